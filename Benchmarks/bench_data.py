@@ -0,0 +1,286 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Synthetic CTM data for the benchmarks.
+
+Makes, with the recording arcpy, a source geodatabase with the feature
+classes of the generalization hierarchy specification, the Fixed 50K
+map product (template, grid XML, cartography data and coordinate system
+zones) and a Workflow Manager job with an area of interest.
+
+The feature classes and the values of their attributes come from the
+rules of Generalization_Hierarchy.vvs so the rules select realistic
+shares of the features. The data only depends on the scale and the seed,
+the same arguments always make the same data."""
+import os
+import re
+import json
+import random
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+import arcpy
+import arcpywmx
+from arcpy._core import store
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VVS = os.path.join(REPO, 'Generalization', 'Generalization_Hierarchy.vvs')
+
+# the features of a feature class at scale 1 are BASE_COUNT times its weight
+BASE_COUNT = 250
+WEIGHTS = {'TransportationGroundCrv': 8, 'StructurePnt': 6, 'HydrographyCrv': 4,
+           'StructureSrf': 3, 'HydrographySrf': 2, 'VegetationSrf': 2,
+           'SettlementSrf': 1, 'TransportationGroundPnt': 1, 'HypsographyCrv': 2}
+DEFAULT_WEIGHT = 0.5
+
+# the Lehi sheet of the sample Fixed 25K product, in Web Mercator
+AOI = (-12453868.023369277, 4920586.8467766969, -12439953.094812483, 4938869.1756399116)
+WKID = 102100
+UTM_WKID = 32612
+
+INTEGER_FIELDS = ('FCSubtype', 'FFN', 'RDC', 'RTN_ROI', 'BAL')
+VALUES = re.compile(r'\b(' + '|'.join(INTEGER_FIELDS) + r')\s*(?:not\s+)?(?:=|<>|in)\s*\(?([-\d,\s]+)\)?',
+                    re.IGNORECASE)
+
+PRODUCT = 'Fixed 50K'
+TEMPLATE = 'CTM50KTemplate.mxd'
+GRID_XML = 'CTM_50K_UTM_WGS84_grid.xml'
+JOB_ID = 1001
+
+
+def read_domains(vvs=VVS):
+    """ {feature class: {field: [values]}} from the where clauses of the
+    specification, in the order the feature classes are listed"""
+    domains = {}
+    order = []
+    for event, element in ElementTree.iterparse(vvs):
+        if element.tag.rsplit('}', 1)[-1] != 'PSRule':
+            continue
+        fc = where = None
+        for child in element.iter():
+            name = child.tag.rsplit('}', 1)[-1]
+            if name == 'FeatureClass':
+                fc = child.text
+            elif name == 'WhereClause':
+                where = child.text or ''
+        element.clear()
+        if not fc:
+            continue
+        if fc not in domains:
+            domains[fc] = dict((field, set()) for field in INTEGER_FIELDS)
+            order.append(fc)
+        for field, values in VALUES.findall(where or ''):
+            field = [name for name in INTEGER_FIELDS if name.lower() == field.lower()][0]
+            domains[fc][field].update(int(value) for value in values.replace(' ', '').split(',')
+                                      if value.strip('-'))
+    return [(fc, dict((field, sorted(values)) for field, values in domains[fc].items()))
+            for fc in order]
+
+
+def _geometry_type(fc):
+    if fc.endswith('Crv'):
+        return 'POLYLINE'
+    if fc.endswith('Srf'):
+        return 'POLYGON'
+    return 'POINT'
+
+
+def _value(rng, domain, missing):
+    """ a value of the domain most of the time, so most rules select
+    features, otherwise a value no rule selects"""
+    if domain and rng.random() < 0.85:
+        return rng.choice(domain)
+    return missing
+
+
+def _shape(rng, geometry_type, extent, sr):
+    xmin, ymin, xmax, ymax = extent
+    x = rng.uniform(xmin, xmax)
+    y = rng.uniform(ymin, ymax)
+    if geometry_type == 'POINT':
+        return arcpy.PointGeometry(arcpy.Point(x, y), sr)
+    if geometry_type == 'POLYGON':
+        width = rng.uniform(20, 300)
+        height = rng.uniform(20, 300)
+        return arcpy.Polygon(arcpy.Array([arcpy.Point(x, y), arcpy.Point(x, y + height),
+                                          arcpy.Point(x + width, y + height),
+                                          arcpy.Point(x + width, y), arcpy.Point(x, y)]), sr)
+    points = [arcpy.Point(x, y)]
+    for step in range(rng.randint(1, 9)):
+        x += rng.uniform(-250, 250)
+        y += rng.uniform(-250, 250)
+        points.append(arcpy.Point(x, y))
+    return arcpy.Polyline(arcpy.Array(points), sr)
+
+
+def _rectangle(envelope, sr):
+    xmin, ymin, xmax, ymax = envelope
+    return arcpy.Polygon(arcpy.Array([arcpy.Point(xmin, ymin), arcpy.Point(xmin, ymax),
+                                      arcpy.Point(xmax, ymax), arcpy.Point(xmax, ymin),
+                                      arcpy.Point(xmin, ymin)]), sr)
+
+
+def _feature_class(workspace, name, geometry_type, fields, rows, sr):
+    """ creates a feature class and inserts rows of (shape, values...)"""
+    fc = str(arcpy.CreateFeatureclass_management(workspace, name, geometry_type, '', '', '', sr))
+    for field_name, field_type in fields:
+        arcpy.AddField_management(fc, field_name, field_type)
+    with arcpy.da.InsertCursor(fc, ['SHAPE@'] + [field[0] for field in fields]) as cursor:
+        for row in rows:
+            cursor.insertRow(row)
+    return fc
+
+
+def make_source(folder, rng, scale):
+    """ the source geodatabase, with the feature classes in the
+    TopographicMap feature dataset and the AOI at the root"""
+    sr = arcpy.SpatialReference(WKID)
+    gdb = str(arcpy.CreateFileGDB_management(folder, 'CTM_Source'))
+    fds = str(arcpy.CreateFeatureDataset_management(gdb, 'TopographicMap', sr))
+    margin_x = (AOI[2] - AOI[0]) * 0.1
+    margin_y = (AOI[3] - AOI[1]) * 0.1
+    extent = (AOI[0] - margin_x, AOI[1] - margin_y, AOI[2] + margin_x, AOI[3] + margin_y)
+    fields = [(field, 'LONG') for field in INTEGER_FIELDS] + [('FNA', 'TEXT')]
+    counts = {}
+    for fc, domains in read_domains():
+        geometry_type = _geometry_type(fc)
+        count = max(5, int(BASE_COUNT * scale * WEIGHTS.get(fc, DEFAULT_WEIGHT)))
+        rows = []
+        for index in range(count):
+            rows.append([_shape(rng, geometry_type, extent, sr)] +
+                        [_value(rng, domains[field], 999 if field == 'FCSubtype' else -999999)
+                         for field in INTEGER_FIELDS] +
+                        [rng.choice(['noInformation', 'Name ' + str(index)])])
+        _feature_class(fds, fc, geometry_type, fields, rows, sr)
+        counts[fc] = count
+    aoi = _feature_class(gdb, 'AOI', 'POLYGON', [('AOI_Name', 'TEXT')],
+                         [[_rectangle(AOI, sr), 'Lehi']], sr)
+    return gdb, aoi, counts
+
+
+def _quads(envelope, columns, rows):
+    xmin, ymin, xmax, ymax = envelope
+    width = (xmax - xmin) / columns
+    height = (ymax - ymin) / rows
+    for column in range(columns):
+        for row in range(rows):
+            yield (xmin + column * width, ymin + row * height,
+                   xmin + (column + 1) * width, ymin + (row + 1) * height)
+
+
+def make_product(folder, rng):
+    """ the Fixed 50K product folder, returns the product JSON of a map of
+    the AOI"""
+    sr = arcpy.SpatialReference(WKID)
+    product_folder = os.path.join(folder, PRODUCT)
+    os.makedirs(product_folder)
+    gdb = str(arcpy.CreateFileGDB_management(product_folder, 'CTM_Cartography'))
+    width = AOI[2] - AOI[0]
+    height = AOI[3] - AOI[1]
+    around = (AOI[0] - width, AOI[1] - height, AOI[2] + width, AOI[3] + height)
+
+    # quads of the size of the AOI, one of them is the AOI
+    quads = [[_rectangle(quad, sr), 'Q' + str(index), 'V795', 1]
+             for index, quad in enumerate(_quads(around, 3, 3))]
+    map_aoi = _feature_class(gdb, 'Map_AOI', 'POLYGON',
+                             [('SHEET', 'TEXT'), ('SERIES', 'TEXT'), ('EDITION', 'LONG')],
+                             quads, sr)
+    index_aoi = _feature_class(gdb, 'Index_AOI', 'POLYGON', [('SHEET', 'TEXT')],
+                               [row[:2] for row in quads], sr)
+    states = _feature_class(gdb, 'US_States', 'POLYGON', [('STATE_NAME', 'TEXT')],
+                            [[_rectangle((around[0] - width * 10, around[1] - height * 10,
+                                          around[2] + width * 10, around[3] + height * 10), sr),
+                              'Utah'],
+                             [_rectangle((around[2] + width * 10, around[1],
+                                          around[2] + width * 30, around[3]), sr), 'Colorado']],
+                            sr)
+    annotation = _feature_class(gdb, 'ANO_Names', 'POLYGON', [('TextString', 'TEXT')],
+                                [[_shape(rng, 'POLYGON', AOI, sr), 'Name ' + str(index)]
+                                 for index in range(200)], sr)
+    store.dataset(annotation).feature_type = 'Annotation'
+    gridlines = _feature_class(gdb, 'GLN_Template', 'POLYLINE', [], [], sr)
+
+    # a real folder, the map generator extracts the zones when it is missing
+    zones_gdb = str(arcpy.CreateFileGDB_management(product_folder, 'CoordinateSystemZones'))
+    _feature_class(zones_gdb, 'UTMZones_WGS84', 'POLYGON', [('ZONE_NUM', 'LONG')],
+                   [[_rectangle((around[0] - width * 20, around[1] - height * 20,
+                                 (AOI[0] + AOI[2]) / 2.0 + width * 3, around[3] + height * 20), sr), 12],
+                    [_rectangle(((AOI[0] + AOI[2]) / 2.0 + width * 3, around[1] - height * 20,
+                                 around[2] + width * 20, around[3] + height * 20), sr), 13]], sr)
+
+    with open(os.path.join(product_folder, GRID_XML), 'w') as grid_file:
+        grid_file.write('<Grid name="CTM 50K UTM" type="UTM" scale="50000" wkid="' +
+                        str(UTM_WKID) + '"/>')
+
+    def layer(name, source, query=''):
+        return {'name': name, 'dataSource': source, 'definitionQuery': query}
+
+    template = {
+        'title': 'CTM 50K',
+        'dataFrames': [
+            {'name': 'Layers', 'elementWidth': 50.0, 'elementHeight': 70.0, 'scale': 50000,
+             'wkid': WKID, 'extent': list(AOI),
+             'layers': [layer('ANO_Names', annotation), layer('GLN_Template', gridlines),
+                        layer('Map_AOI', map_aoi)]},
+            {'name': 'AdjoiningSheet', 'elementWidth': 6.0, 'elementHeight': 6.0,
+             'wkid': WKID, 'extent': list(around), 'layers': [layer('Index_AOI', index_aoi)]},
+            {'name': 'LocationDiagram', 'elementWidth': 6.0, 'elementHeight': 4.0,
+             'wkid': WKID, 'extent': list(around),
+             'layers': [layer('Index_AOI', index_aoi), layer('US_States', states)]}],
+        'elements': [
+            {'name': 'Title Text', 'text': ''},
+            {'name': 'Country Name', 'text': ''},
+            {'name': 'MapInformationLL',
+             'text': '<%map_name%> <%map_series%> <%map_edition%> <%map_sheet%>'},
+            {'name': 'MapInformationUR',
+             'text': '<%map_name%> <%map_series%> <%map_edition%> <%map_sheet%>'},
+            {'name': 'Date Time Text', 'text': '<%Map Name%>'}]}
+    with open(os.path.join(product_folder, TEMPLATE), 'w') as mxd_file:
+        json.dump(template, mxd_file)
+
+    rings = [[[AOI[0], AOI[3]], [AOI[2], AOI[3]], [AOI[2], AOI[1]], [AOI[0], AOI[1]],
+              [AOI[0], AOI[3]]]]
+    return {'productName': PRODUCT, 'mxd': TEMPLATE, 'gridXml': GRID_XML,
+            'pageMargin': '4.5 8 23 8 CENTIMETERS', 'exporter': 'PDF', 'exportOption': 'Export',
+            'geometry': {'rings': rings, 'spatialReference': {'wkid': WKID}}, 'angle': 0,
+            'pageSize': 'CUSTOM PORTRAIT 63 88 CENTIMETERS', 'keep_mxd_backup': False,
+            'mapSheetName': 'Lehi', 'customName': ''}
+
+
+def make_job(aoi):
+    """ registers the Workflow Manager job with the AOI as its area of
+    interest"""
+    arcpywmx.jobs[JOB_ID] = {'name': 'CTM_Job_' + str(JOB_ID), 'aoi': aoi}
+    return JOB_ID
+
+
+def generate(folder, scale=1.0, seed=1):
+    """ makes the data for all the entry points in folder and returns the
+    paths and values the benchmarks pass to them"""
+    rng = random.Random(seed)
+    source_folder = os.path.join(folder, 'Source')
+    products = os.path.join(folder, 'Products')
+    output = os.path.join(folder, 'Output')
+    scratch = os.path.join(folder, 'Scratch')
+    for path in (source_folder, products, output, scratch):
+        os.makedirs(path)
+    gdb, aoi, counts = make_source(source_folder, rng, scale)
+    product = make_product(products, rng)
+    job_id = make_job(aoi)
+    scratch_gdb = str(arcpy.CreateFileGDB_management(scratch, 'scratch'))
+    return {'source': gdb, 'aoi': aoi, 'counts': counts, 'vvs': VVS,
+            'products': products, 'product': product, 'output': output,
+            'scratch': scratch, 'scratch_gdb': scratch_gdb, 'job_id': job_id,
+            'product_library': os.path.join(folder, 'ProductLibrary.mdb')}
@@ -0,0 +1,289 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Benchmarks of the CTM entry points without ArcGIS.
+
+Runs parseVST.main, All_Generalization.main, WMX_Generalization.main and
+MapGenerator.createmap against synthetic data (see bench_data.py) with the
+recording arcpy in fake_arcpy, and reports for each entry point the time
+it took, the geoprocessing tools and cursors it used and the rows it read
+and wrote.
+
+The recording arcpy does not generalize or draw anything: the models of
+the generalization toolbox are only counted, the other tools work on
+in memory datasets with envelopes for geometry. The counts show what a
+change does to the work the scripts ask of ArcGIS, the times what it does
+to the Python around it.
+
+Every repetition makes new data in a new temporary folder, so caches on
+disk start cold. The data only depends on --scale and --seed, the counts
+of two runs with the same arguments are the same.
+
+    python ctm_bench.py --scale 1 --repeat 3 --save-baseline baseline.json
+    python ctm_bench.py --scale 1 --repeat 3 --baseline baseline.json
+
+With --baseline the results are compared to a saved run. A count that
+goes up or a time more than --tolerance slower than the baseline is a
+regression and the exit status is 1. Times are only comparable on the
+same machine."""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import traceback
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(BENCHMARKS)
+for folder in (os.path.join(REPO, 'MapGeneration'),
+               os.path.join(REPO, 'Generalization', 'GeneralizationTools'),
+               os.path.join(REPO, 'Generalization'),
+               os.path.join(BENCHMARKS, 'fake_arcpy'),
+               BENCHMARKS):
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+
+import arcpy
+import arcpywmx
+from arcpy._core import recorder, store
+import bench_data
+
+COUNTS = ('tool_calls', 'api_calls', 'cursors', 'rows_read', 'rows_written', 'errors')
+TOLERANCE = 0.25
+
+
+def run_parse_vst(data):
+    import parseVST
+    arcpy.parameters[:] = [data['source'], data['vvs'], 'Hierarchy']
+    parseVST.main()
+
+
+def run_all_generalization(data):
+    import All_Generalization
+    sys.argv = ['All_Generalization.py']
+    arcpy.parameters[:] = [data['source'], data['aoi'], data['output'], 'CTM_50K',
+                           data['product_library'], data['vvs'], 'false']
+    All_Generalization.main()
+    if not arcpy.Exists(arcpy.parameters[7]):
+        arcpy.AddError("No generalization database was created.")
+
+
+def run_wmx_generalization(data):
+    import WMX_Generalization
+    sys.argv = ['WMX_Generalization.py']
+    arcpy.parameters[:] = [data['source'], str(data['job_id']), data['output'],
+                           data['product_library'], data['vvs'], 'false']
+    WMX_Generalization.main()
+
+
+def run_createmap(data):
+    import MapGenerator_Workers
+    toolbox = MapGenerator_Workers.load_toolbox(os.path.join(REPO, 'MapGeneration',
+                                                             'Fixed_MapGenerator.pyt'))
+    toolbox.output_directory = data['output']
+    toolbox.shared_products_path = data['products']
+    filename = toolbox.MapGenerator().createmap(json.dumps(data['product']))
+    if not filename or not os.path.isfile(os.path.join(data['output'], filename)):
+        arcpy.AddError("No map was exported.")
+
+
+# the entry points in the order they are run
+ENTRY_POINTS = [('parseVST', run_parse_vst),
+                ('All_Generalization', run_all_generalization),
+                ('WMX_Generalization', run_wmx_generalization),
+                ('createmap', run_createmap)]
+
+
+def reset():
+    store.clear()
+    recorder.reset()
+    arcpy.env.reset()
+    arcpywmx.jobs.clear()
+    arcpy.parameters[:] = []
+
+
+def run_once(name, function, scale, seed, verbose):
+    """ makes the data in a new folder and runs the entry point once,
+    returns the time and counts"""
+    folder = tempfile.mkdtemp(prefix='ctm_bench_')
+    argv = list(sys.argv)
+    try:
+        reset()
+        os.environ['CTM_MAP_CACHE'] = os.path.join(folder, 'Caches')
+        os.environ['CTM_VVS_CACHE'] = os.path.join(folder, 'Caches', 'vvs')
+        data = bench_data.generate(folder, scale, seed)
+        arcpy.env.scratchFolder = data['scratch']
+        arcpy.env.scratchWorkspace = data['scratch']
+        arcpy.env.scratchGDB = data['scratch_gdb']
+
+        recorder.reset()
+        recorder.quiet = not verbose
+        # the scripts also print their progress
+        stdout = sys.stdout
+        if not verbose:
+            sys.stdout = open(os.devnull, 'w')
+        started = time.time()
+        try:
+            function(data)
+        except Exception:
+            recorder.errors.append(traceback.format_exc())
+        finally:
+            seconds = time.time() - started
+            if sys.stdout is not stdout:
+                sys.stdout.close()
+                sys.stdout = stdout
+        result = recorder.snapshot()
+        result['seconds'] = seconds
+        if verbose:
+            for error in recorder.errors:
+                sys.stderr.write(name + ": " + error + "\n")
+        return result
+    finally:
+        sys.argv = argv
+        reset()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run(names, scale, seed, repeat, verbose):
+    results = {}
+    for name, function in ENTRY_POINTS:
+        if names and name not in names:
+            continue
+        runs = [run_once(name, function, scale, seed, verbose) for count in range(repeat)]
+        times = sorted(result['seconds'] for result in runs)
+        result = dict((key, runs[-1][key]) for key in COUNTS)
+        result['calls'] = runs[-1]['calls']
+        result['seconds'] = times[len(times) // 2]
+        result['min_seconds'] = times[0]
+        # the counts are the same for every repetition unless the entry
+        # point depends on something other than its data
+        result['stable'] = all(dict((key, run_[key]) for key in COUNTS) ==
+                               dict((key, result[key]) for key in COUNTS) for run_ in runs)
+        results[name] = result
+    return results
+
+
+def environment(scale, seed, repeat):
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': numpy_version, 'scale': scale, 'seed': seed, 'repeat': repeat}
+
+
+def compare(results, baseline, tolerance):
+    """ returns the lines describing the changes from the baseline and
+    whether any of them is a regression"""
+    lines = []
+    regressed = False
+    for name, result in sorted(results.items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            lines.append(name + ": not in the baseline")
+            continue
+        for key in COUNTS:
+            if result[key] != before[key]:
+                worse = result[key] > before[key]
+                regressed = regressed or worse
+                lines.append("%s: %s %s -> %s (%s)" % (name, key, before[key], result[key],
+                                                        'regression' if worse else 'improvement'))
+        if before['seconds'] > 0:
+            change = (result['seconds'] - before['seconds']) / before['seconds']
+            if abs(change) > tolerance:
+                worse = change > 0
+                regressed = regressed or worse
+                lines.append("%s: seconds %.3f -> %.3f (%+.0f%%, %s)" %
+                             (name, before['seconds'], result['seconds'], change * 100,
+                              'regression' if worse else 'improvement'))
+    return lines, regressed
+
+
+def report(results):
+    header = "%-20s %9s %9s %7s %8s %10s %10s %6s" % ('entry point', 'seconds', 'min', 'tools',
+                                                       'cursors', 'rows read', 'written', 'errors')
+    lines = [header, '-' * len(header)]
+    for name, function in ENTRY_POINTS:
+        if name not in results:
+            continue
+        result = results[name]
+        lines.append("%-20s %9.3f %9.3f %7d %8d %10d %10d %6d%s" %
+                     (name, result['seconds'], result['min_seconds'], result['tool_calls'],
+                      result['cursors'], result['rows_read'], result['rows_written'],
+                      result['errors'], '' if result['stable'] else '  (counts vary)'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the CTM entry points with "
+                                                 "synthetic data and a recording arcpy.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="size of the synthetic data, 1 is about 13,000 features")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs of each entry point, the median time is reported")
+    parser.add_argument('--only', default='',
+                        help="comma separated entry points to run: " +
+                             ', '.join(name for name, function in ENTRY_POINTS))
+    parser.add_argument('--baseline', help="compare with the results saved in this file")
+    parser.add_argument('--save-baseline', help="save the results to this file")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="relative change of the time reported, 0.25 by default")
+    parser.add_argument('--verbose', action='store_true',
+                        help="print the messages and errors of the entry points")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(names) - set(name for name, function in ENTRY_POINTS)
+    if unknown:
+        parser.error("unknown entry points: " + ', '.join(sorted(unknown)))
+
+    results = run(names, args.scale, args.seed, max(1, args.repeat), args.verbose)
+    print(report(results))
+    saved = {'environment': environment(args.scale, args.seed, args.repeat), 'results': results}
+
+    status = 0
+    if any(result['errors'] for result in results.values()):
+        print("\nSome entry points reported errors, run with --verbose to see them.")
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        before = baseline['environment']
+        if (before['scale'], before['seed']) != (args.scale, args.seed):
+            print("\nThe baseline was made with --scale %s --seed %s, the counts are not "
+                  "comparable." % (before['scale'], before['seed']))
+            status = 1
+        else:
+            if before.get('numpy') != saved['environment']['numpy']:
+                print("\nThe baseline was made with numpy " + str(before.get('numpy')) +
+                      ", parseVST uses a different code path without it.")
+            lines, regressed = compare(results, baseline, args.tolerance)
+            print("\nCompared with " + args.baseline + ":")
+            print('\n'.join(lines) if lines else "no changes")
+            if regressed:
+                status = 1
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(saved, baseline_file, indent=1, sort_keys=True)
+        print("\nSaved the results to " + args.save_baseline)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,626 @@
+"""A recording stand-in for the parts of arcpy used by the CTM scripts.
+
+Datasets are kept in memory, see _core. The tools the scripts rely on for
+their data (creating, copying, appending, selecting, counting) change the
+datasets, every other tool, including the models of the CTM toolboxes, is
+only recorded. Every call, cursor and row is counted by arcpy.recorder,
+which the benchmark harness reads and resets around each entry point."""
+import os
+import sys
+import copy
+import types
+import shutil
+from arcpy._core import (recorder, store, string_types, real_path, norm, Field,
+                         Dataset, Table, FeatureClass)
+from arcpy.geometry import (Point, Array, SpatialReference, Extent, Geometry, Polyline,
+                            Polygon, PointGeometry, Multipoint, AsShape, rectangle,
+                            envelopes_overlap, envelope_contains)
+from arcpy._data import Layer, Result, resolve, rows, shapes
+from arcpy import da
+from arcpy import mapping
+
+
+class ExecuteError(Exception):
+    pass
+
+
+class ExecuteWarning(Exception):
+    pass
+
+
+class _Env(object):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.overwriteOutput = False
+        self.workspace = None
+        self.scratchWorkspace = None
+        self.scratchGDB = 'in_memory'
+        self.scratchFolder = None
+        self.addOutputsToMap = True
+        self.outputCoordinateSystem = None
+        self.extent = None
+
+
+env = _Env()
+
+# the tool parameters of the entry point being run
+parameters = []
+
+
+def _message(severity, text):
+    if severity == 2:
+        recorder.errors.append(str(text))
+    if not recorder.quiet:
+        sys.stdout.write(('', 'WARNING ', 'ERROR ')[severity] + str(text) + '\n')
+
+
+def AddMessage(message):
+    _message(0, message)
+
+
+def AddWarning(message):
+    _message(1, message)
+
+
+def AddError(message):
+    _message(2, message)
+
+
+def AddIDMessage(message_type, message_id, add_argument1=None, add_argument2=None):
+    _message({'ERROR': 2, 'WARNING': 1}.get(message_type, 0), str(message_id))
+
+
+def _tool_error(text):
+    """ raises the error of the tool being run, GetMessages returns it"""
+    recorder.tool_messages.append((2, text))
+    raise ExecuteError(text)
+
+
+def GetMessages(severity=0):
+    """ the messages of the last tool run, as in arcpy the messages of the
+    script itself are not included"""
+    return '\n'.join(text for level, text in recorder.tool_messages if level >= severity)
+
+
+def GetMessageCount():
+    return len(recorder.tool_messages)
+
+
+def GetParameterAsText(index):
+    recorder.call('GetParameterAsText')
+    if index < len(parameters) and parameters[index] is not None:
+        return str(parameters[index])
+    return ''
+
+
+def GetParameter(index):
+    recorder.call('GetParameter')
+    return parameters[index] if index < len(parameters) else None
+
+
+def GetArgumentCount():
+    return len(parameters)
+
+
+def SetParameter(index, value):
+    while len(parameters) <= index:
+        parameters.append(None)
+    parameters[index] = value
+
+
+SetParameterAsText = SetParameter
+
+
+def CheckExtension(extension):
+    recorder.call('CheckExtension')
+    return 'Available'
+
+
+def CheckOutExtension(extension):
+    recorder.call('CheckOutExtension')
+    return 'CheckedOut'
+
+
+def CheckInExtension(extension):
+    return 'CheckedIn'
+
+
+def ProductInfo():
+    return 'ArcInfo'
+
+
+def GetInstallInfo(product=None):
+    return {'InstallDir': os.environ.get('CTM_BENCH_INSTALL_DIR', ''), 'Version': '10.5'}
+
+
+def ImportToolbox(input_file, module_name=None):
+    recorder.call('ImportToolbox')
+
+
+def RefreshActiveView():
+    recorder.call('RefreshActiveView')
+
+
+def RefreshTOC():
+    recorder.call('RefreshTOC')
+
+
+def AddFieldDelimiters(datasource, field):
+    return field
+
+
+def ClearWorkspaceCache_management(workspace=None):
+    recorder.call('ClearWorkspaceCache_management')
+    return Result([True])
+
+
+def Exists(dataset):
+    recorder.call('Exists')
+    if isinstance(dataset, (Layer, Result)):
+        return True
+    return store.exists(dataset)
+
+
+class _Describe(object):
+    pass
+
+
+def Describe(value, datatype=None):
+    recorder.call('Describe')
+    desc = _Describe()
+    if isinstance(value, string_types) and norm(value) not in store.datasets and \
+            value not in store.layers:
+        if not os.path.exists(real_path(value)):
+            raise IOError('"' + str(value) + '" does not exist')
+        desc.dataType = 'Folder' if os.path.isdir(real_path(value)) else 'File'
+        desc.name = desc.baseName = os.path.basename(str(value))
+        desc.catalogPath = str(value)
+        desc.path = os.path.dirname(str(value))
+        return desc
+
+    if isinstance(value, (Layer, Result)) or value in store.layers:
+        dataset, layer = resolve(value)
+        feature_class = Describe(dataset.path)
+        desc.__dict__.update(feature_class.__dict__)
+        desc.dataType = 'FeatureLayer'
+        desc.featureClass = feature_class
+        desc.nameString = layer.name
+        desc.whereClause = layer.definitionQuery
+        desc.FIDSet = '; '.join(str(oid) for oid in sorted(layer.selection or ()))
+        return desc
+
+    dataset = store.dataset(value)
+    desc.name = desc.baseName = dataset.name
+    desc.catalogPath = dataset.path
+    desc.path = os.path.dirname(dataset.path)
+    desc.spatialReference = dataset.spatial_reference or SpatialReference()
+    desc.children = [Describe(child.path) for child in store.children(dataset.path)] \
+        if dataset.kind in ('Workspace', 'FeatureDataset') else []
+    if dataset.kind == 'Workspace':
+        desc.dataType = 'Workspace'
+        desc.workspaceType = 'LocalDatabase'
+        desc.workspaceFactoryProgID = 'esriDataSourcesGDB.FileGDBWorkspaceFactory'
+        desc.connectionProperties = None
+        return desc
+    if dataset.kind == 'FeatureDataset':
+        desc.dataType = 'FeatureDataset'
+        return desc
+    desc.dataType = 'FeatureClass' if isinstance(dataset, FeatureClass) else 'Table'
+    desc.datasetType = desc.dataType
+    desc.fields = list(dataset.fields)
+    desc.hasOID = True
+    desc.OIDFieldName = 'OBJECTID'
+    desc.shapeFieldName = 'SHAPE'
+    desc.shapeType = dataset.shape_type
+    desc.hasZ = dataset.has_z
+    desc.hasM = dataset.has_m
+    desc.featureType = dataset.feature_type
+    desc.extent = Layer(dataset.path).getExtent() if isinstance(dataset, FeatureClass) else None
+    return desc
+
+
+def ListFields(dataset, wild_card=None, field_type=None):
+    recorder.call('ListFields')
+    found, unused = resolve(dataset)
+    return [field for field in found.fields
+            if (wild_card is None or mapping._matches(field.name, wild_card)) and
+            (field_type in (None, 'All') or field.type == field_type)]
+
+
+def ListFeatureClasses(wild_card=None, feature_type=None, feature_dataset=None):
+    recorder.call('ListFeatureClasses')
+    folder = env.workspace if feature_dataset is None else os.path.join(env.workspace, feature_dataset)
+    return [child.name for child in store.children(folder)
+            if isinstance(child, FeatureClass) and mapping._matches(child.name, wild_card)]
+
+
+def _geometry_type(geometry_type):
+    return {'POLYLINE': 'Polyline', 'POLYGON': 'Polygon', 'POINT': 'Point',
+            'MULTIPOINT': 'Multipoint'}[str(geometry_type).upper()]
+
+
+def _spatial_reference(value):
+    if value is None or value == '' or value == '#':
+        return None
+    if isinstance(value, SpatialReference):
+        return value
+    return SpatialReference(value if isinstance(value, int) else str(value))
+
+
+def _tool(name):
+    recorder.call(name)
+
+
+def CreateFileGDB_management(out_folder_path, out_name, out_version=None):
+    _tool('CreateFileGDB_management')
+    name = str(out_name)
+    if not name.lower().endswith('.gdb'):
+        name += '.gdb'
+    path = os.path.join(str(out_folder_path), name)
+    store.create_workspace(path)
+    return Result([path])
+
+
+def CreateFeatureDataset_management(out_dataset_path, out_name, spatial_reference=None):
+    _tool('CreateFeatureDataset_management')
+    path = os.path.join(str(out_dataset_path), str(out_name))
+    store.add(Dataset(path, 'FeatureDataset', _spatial_reference(spatial_reference)))
+    return Result([path])
+
+
+def CreateFeatureclass_management(out_path, out_name, geometry_type='POLYGON', template=None,
+                                  has_m='DISABLED', has_z='DISABLED', spatial_reference=None,
+                                  *args):
+    _tool('CreateFeatureclass_management')
+    path = os.path.join(str(out_path), str(out_name))
+    fields = []
+    if template not in (None, '', '#'):
+        source, unused = resolve(template)
+        fields = [copy.copy(field) for field in source.fields
+                  if field.type not in ('OID', 'Geometry')]
+    parent = store.dataset(out_path)
+    sr = _spatial_reference(spatial_reference) or (parent.spatial_reference if parent else None)
+    store.add(FeatureClass(path, _geometry_type(geometry_type), fields, sr,
+                           str(has_z).upper() == 'ENABLED', str(has_m).upper() == 'ENABLED'))
+    return Result([path])
+
+
+def CreateTable_management(out_path, out_name, template=None, *args):
+    _tool('CreateTable_management')
+    path = os.path.join(str(out_path), str(out_name))
+    store.add(Table(path))
+    return Result([path])
+
+
+_FIELD_TYPES = {'TEXT': 'String', 'LONG': 'Integer', 'SHORT': 'SmallInteger', 'DOUBLE': 'Double',
+                'FLOAT': 'Single', 'DATE': 'Date', 'GUID': 'GUID', 'BLOB': 'Blob'}
+
+
+def AddField_management(in_table, field_name, field_type, field_precision=None, field_scale=None,
+                        field_length=None, *args):
+    _tool('AddField_management')
+    dataset, unused = resolve(in_table)
+    dataset.add_field(Field(str(field_name), _FIELD_TYPES.get(str(field_type).upper(), 'String'),
+                            field_length))
+    return Result([in_table])
+
+
+def DeleteField_management(in_table, drop_field):
+    _tool('DeleteField_management')
+    dataset, unused = resolve(in_table)
+    names = drop_field if isinstance(drop_field, list) else str(drop_field).split(';')
+    for name in names:
+        index = dataset.field_index(name)
+        if index is not None:
+            del dataset.fields[index]
+            for row in dataset.rows.values():
+                del row[index]
+    return Result([in_table])
+
+
+def GetCount_management(in_rows):
+    _tool('GetCount_management')
+    return Result([str(sum(1 for item in rows(in_rows)))])
+
+
+def Delete_management(in_data, data_type=None):
+    _tool('Delete_management')
+    if isinstance(in_data, Layer):
+        store.layers.pop(in_data.name, None)
+    elif isinstance(in_data, Result):
+        target = in_data.outputs[0]
+        if isinstance(target, Layer):
+            store.layers.pop(target.name, None)
+        else:
+            store.delete(target)
+    else:
+        store.delete(in_data)
+    return Result([True])
+
+
+def Copy_management(in_data, out_data, data_type=None):
+    _tool('Copy_management')
+    if store.dataset(in_data) is None and os.path.isdir(real_path(in_data)):
+        shutil.copytree(real_path(in_data), real_path(out_data))
+    else:
+        store.copy(in_data, out_data)
+    return Result([out_data])
+
+
+def _copy_rows(source, target_dataset, where=None):
+    """ appends the rows of a dataset or layer to a dataset, matching the
+    fields by name"""
+    dataset, unused = resolve(source)
+    mapping_ = [(target_index, dataset.field_index(field.name))
+                for target_index, field in enumerate(target_dataset.fields) if target_index]
+    count = 0
+    for oid, row in rows(source, where):
+        new_oid = target_dataset.insert({})
+        new_row = target_dataset.rows[new_oid]
+        for target_index, source_index in mapping_:
+            if source_index is not None:
+                new_row[target_index] = row[source_index]
+        count += 1
+    return count
+
+
+def Append_management(inputs, target, schema_type='TEST', *args):
+    _tool('Append_management')
+    target_dataset, unused = resolve(target)
+    if isinstance(inputs, string_types):
+        inputs = inputs.split(';')
+    elif not isinstance(inputs, (list, tuple)):
+        inputs = [inputs]
+    for item in inputs:
+        _copy_rows(item, target_dataset)
+    return Result([target])
+
+
+def _new_like(source, out_path, shape_type=None):
+    dataset, unused = resolve(source)
+    fields = [copy.copy(field) for field in dataset.fields if field.type not in ('OID', 'Geometry')]
+    if isinstance(dataset, FeatureClass) or shape_type:
+        new = FeatureClass(str(out_path), shape_type or dataset.shape_type, fields,
+                           dataset.spatial_reference, dataset.has_z, dataset.has_m)
+    else:
+        new = Table(str(out_path), fields)
+    store.add(new)
+    return new
+
+
+def CopyFeatures_management(in_features, out_feature_class, *args):
+    _tool('CopyFeatures_management')
+    _copy_rows(in_features, _new_like(in_features, out_feature_class))
+    return Result([out_feature_class])
+
+
+def CopyRows_management(in_rows, out_table, *args):
+    _tool('CopyRows_management')
+    _copy_rows(in_rows, _new_like(in_rows, out_table))
+    return Result([out_table])
+
+
+def DeleteFeatures_management(in_features):
+    _tool('DeleteFeatures_management')
+    dataset, unused = resolve(in_features)
+    for oid in [oid for oid, row in rows(in_features)]:
+        del dataset.rows[oid]
+    return Result([in_features])
+
+
+DeleteRows_management = DeleteFeatures_management
+
+
+def MakeFeatureLayer_management(in_features, out_layer, where_clause=None, *args):
+    _tool('MakeFeatureLayer_management')
+    dataset, source_layer = resolve(in_features)
+    layer = Layer(dataset.path, str(out_layer))
+    if source_layer is not None:
+        layer.definitionQuery = source_layer.definitionQuery
+    if where_clause not in (None, '', '#'):
+        layer.definitionQuery = where_clause
+    store.layers[str(out_layer)] = layer
+    return Result([layer])
+
+
+MakeTableView_management = MakeFeatureLayer_management
+
+
+def _select(layer, found, selection_type):
+    current = layer.selection
+    if selection_type in (None, '#', 'NEW_SELECTION') or current is None and \
+            selection_type == 'ADD_TO_SELECTION':
+        layer.selection = set(found)
+    elif selection_type == 'ADD_TO_SELECTION':
+        layer.selection = current | set(found)
+    elif selection_type == 'REMOVE_FROM_SELECTION':
+        layer.selection = (current or set()) - set(found)
+    elif selection_type == 'SUBSET_SELECTION':
+        layer.selection = (current if current is not None else set(found)) & set(found)
+    elif selection_type == 'SWITCH_SELECTION':
+        everything = set(oid for oid, row in rows(layer, selected=False))
+        layer.selection = everything - (current or set())
+    else:
+        layer.selection = set(found)
+
+
+def _as_layer(in_layer):
+    dataset, layer = resolve(in_layer)
+    if layer is None:
+        _tool_error("ERROR 000368: Invalid input data " + str(in_layer))
+    return layer
+
+
+def SelectLayerByLocation_management(in_layer, overlap_type='INTERSECT', select_features=None,
+                                     search_distance=None, selection_type='NEW_SELECTION',
+                                     invert_spatial_relationship='NOT_INVERT'):
+    _tool('SelectLayerByLocation_management')
+    layer = _as_layer(in_layer)
+    dataset, unused = resolve(layer)
+    if isinstance(select_features, Geometry):
+        envelopes = [select_features.envelope]
+    else:
+        envelopes = [shape.envelope for shape in shapes(select_features)]
+    index = dataset.field_index('SHAPE')
+    relation = str(overlap_type).upper()
+    found = []
+    for oid, row in rows(layer, selected=False):
+        shape = row[index]
+        if shape is None:
+            continue
+        envelope = shape.envelope
+        if relation == 'HAVE_THEIR_CENTER_IN':
+            center = shape.centroid
+            test = lambda other: envelope_contains(other, (center.X, center.Y, center.X, center.Y))
+        elif relation in ('WITHIN', 'COMPLETELY_WITHIN'):
+            test = lambda other: envelope_contains(other, envelope)
+        elif relation in ('CONTAINS', 'COMPLETELY_CONTAINS'):
+            test = lambda other: envelope_contains(envelope, other)
+        else:
+            test = lambda other: envelopes_overlap(other, envelope)
+        if any(test(other) for other in envelopes):
+            found.append(oid)
+    if str(invert_spatial_relationship).upper() == 'INVERT':
+        found = set(oid for oid, row in rows(layer, selected=False)) - set(found)
+    _select(layer, found, selection_type)
+    return Result([layer])
+
+
+def SelectLayerByAttribute_management(in_layer_or_view, selection_type='NEW_SELECTION',
+                                      where_clause=None, invert_where_clause=None):
+    _tool('SelectLayerByAttribute_management')
+    layer = _as_layer(in_layer_or_view)
+    if selection_type == 'CLEAR_SELECTION':
+        layer.selection = None
+    else:
+        _select(layer, [oid for oid, row in rows(layer, where_clause, selected=False)],
+                selection_type)
+    return Result([layer])
+
+
+def Clip_analysis(in_features, clip_features, out_feature_class, cluster_tolerance=None):
+    _tool('Clip_analysis')
+    envelopes = [shape.envelope for shape in shapes(clip_features)]
+    dataset, unused = resolve(in_features)
+    target = _new_like(in_features, out_feature_class)
+    index = dataset.field_index('SHAPE')
+    for oid, row in rows(in_features):
+        shape = row[index]
+        if shape is not None and any(envelopes_overlap(shape.envelope, e) for e in envelopes):
+            new_oid = target.insert({})
+            target.rows[new_oid][1:] = [value for value in row[1:]]
+    return Result([out_feature_class])
+
+
+def Buffer_analysis(in_features, out_feature_class, buffer_distance_or_field, line_side=None,
+                    line_end_type=None, dissolve_option='NONE', *args):
+    _tool('Buffer_analysis')
+    distance = float(str(buffer_distance_or_field).split()[0])
+    dataset, unused = resolve(in_features)
+    target = _new_like(in_features, out_feature_class, 'Polygon')
+    buffered = [shape.buffer(distance) for shape in shapes(in_features)]
+    if str(dissolve_option).upper() == 'ALL' and buffered:
+        merged = buffered[0]
+        for shape in buffered[1:]:
+            merged = merged.union(shape)
+        buffered = [merged]
+    index = target.field_index('SHAPE')
+    for shape in buffered:
+        target.rows[target.insert({})][index] = shape
+    return Result([out_feature_class])
+
+
+def Identity_analysis(in_features, identity_features, out_feature_class, *args):
+    _tool('Identity_analysis')
+    _copy_rows(in_features, _new_like(in_features, out_feature_class))
+    return Result([out_feature_class])
+
+
+def MultipartToSinglepart_management(in_features, out_feature_class):
+    _tool('MultipartToSinglepart_management')
+    dataset, unused = resolve(in_features)
+    target = _new_like(in_features, out_feature_class)
+    index = dataset.field_index('SHAPE')
+    for oid, row in rows(in_features):
+        parts = [row[index]] if row[index] is None else \
+            [row[index]._new([part]) for part in row[index].parts]
+        for part in parts:
+            new_oid = target.insert({})
+            target.rows[new_oid][1:] = row[1:]
+            target.rows[new_oid][index] = part
+    return Result([out_feature_class])
+
+
+def GetJobAOI_wmx(job_id, AOILayer, database_path=None):
+    _tool('GetJobAOI_wmx')
+    import arcpywmx
+    job = arcpywmx.jobs[int(job_id)]
+    layer = Layer(job['aoi'], str(AOILayer))
+    store.layers[str(AOILayer)] = layer
+    return Result([layer])
+
+
+def MakeGridsAndGraticulesLayer_cartography(in_grid_template, in_aoi, input_feature_dataset,
+                                            output_layer, name=None, *args):
+    _tool('MakeGridsAndGraticulesLayer_cartography')
+    envelope = in_aoi.envelope if isinstance(in_aoi, Geometry) else \
+        shapes(in_aoi)[0].envelope
+    fds = store.dataset(input_feature_dataset)
+    sr = fds.spatial_reference if fds is not None else None
+    lines = FeatureClass(os.path.join(str(input_feature_dataset), 'GLN_' + str(output_layer)),
+                         'Polyline', [Field('LINE_TYPE')], sr)
+    xmin, ymin, xmax, ymax = envelope
+    for step in range(11):
+        x = xmin + (xmax - xmin) * step / 10.0
+        y = ymin + (ymax - ymin) * step / 10.0
+        for points in (([x, ymin], [x, ymax]), ([xmin, y], [xmax, y])):
+            oid = lines.insert({'LINE_TYPE': 'Gridline'})
+            lines.rows[oid][1] = Polyline([Point(*points[0]), Point(*points[1])], sr)
+    store.add(lines)
+    store.add(FeatureClass(os.path.join(str(input_feature_dataset), 'GPT_' + str(output_layer)),
+                           'Point', [], sr))
+    layer = Layer(lines.path, str(output_layer))
+    return Result([layer], "Created grid " + str(output_layer))
+
+
+def FeatureOutlineMasks_cartography(input_layer, output_fc, reference_scale, spatial_reference,
+                                    margin, method, mask_for=None, *args):
+    _tool('FeatureOutlineMasks_cartography')
+    masks = FeatureClass(str(output_fc), 'Polygon', [], _spatial_reference(spatial_reference))
+    index = masks.field_index('SHAPE')
+    for shape in shapes(input_layer):
+        masks.rows[masks.insert({})][index] = rectangle(shape.envelope, shape.spatialReference)
+    store.add(masks)
+    return Result([output_fc])
+
+
+def PackageMap_management(in_map, output_file, *args):
+    _tool('PackageMap_management')
+    mapping._export('PackageMap_management', in_map, output_file)
+    return Result([output_file])
+
+
+class _ArcpyModule(types.ModuleType):
+    """ the module with every other attribute named like a tool recorded as
+    a call of that tool, e.g. the models of an imported toolbox"""
+
+    def __getattr__(self, name):
+        if name.startswith('__') or '_' not in name.strip('_'):
+            raise AttributeError(name)
+
+        def tool(*args, **kwargs):
+            recorder.call(name)
+            return Result([args[0] if args else None])
+        tool.__name__ = name
+        return tool
+
+
+_module = _ArcpyModule(__name__, __doc__)
+_module.__dict__.update(globals())
+# python 2 clears the globals of a module when it is collected, the
+# functions above still use them
+_module._original = sys.modules[__name__]
+sys.modules[__name__] = _module
@@ -0,0 +1,249 @@
+"""The datasets of the recording arcpy and the counters of what the scripts
+asked of it.
+
+Datasets live in memory, keyed by their path with either separator and in
+any case. Creating a file geodatabase also creates its folder on disk so
+scripts that look at the files of a workspace find it."""
+import os
+import shutil
+from collections import OrderedDict
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class Recorder(object):
+    """ counts the calls, cursors and rows of a benchmark run"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.cursors = 0
+        self.rows_read = 0
+        self.rows_written = 0
+        # the messages of the last tool run
+        self.tool_messages = []
+        self.errors = []
+        self.quiet = True
+
+    def call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if is_tool(name):
+            self.tool_messages = []
+
+    @property
+    def tool_calls(self):
+        return sum(count for name, count in self.calls.items() if is_tool(name))
+
+    def snapshot(self):
+        return {'tool_calls': self.tool_calls,
+                'api_calls': sum(self.calls.values()),
+                'cursors': self.cursors,
+                'rows_read': self.rows_read,
+                'rows_written': self.rows_written,
+                'errors': len(self.errors),
+                'calls': dict(self.calls)}
+
+
+def is_tool(name):
+    """ geoprocessing tools are named Tool_alias, mapping and production
+    functions are counted as tools too"""
+    return '_' in name.lstrip('_') or name.startswith('mapping.') or \
+        name.startswith('production.')
+
+
+recorder = Recorder()
+
+
+def norm(path):
+    """ the key of a path: one separator, no trailing separator, lower case"""
+    path = str(path).replace('\\', '/')
+    while '//' in path[1:]:
+        path = path[0] + path[1:].replace('//', '/')
+    return path.rstrip('/').lower()
+
+
+def real_path(path):
+    """ the path on disk, the scripts join paths with backslashes"""
+    path = str(path)
+    if os.sep == '/':
+        path = path.replace('\\', '/')
+    return path
+
+
+def parent_key(key):
+    return key.rsplit('/', 1)[0] if '/' in key else ''
+
+
+class Field(object):
+
+    def __init__(self, name, type='String', length=None, editable=True, required=False):
+        self.name = name
+        self.aliasName = name
+        self.baseName = name
+        self.type = type
+        self.length = length or (255 if type == 'String' else 4)
+        self.editable = editable
+        self.required = required
+        self.isNullable = not required
+        self.domain = ''
+        self.precision = 0
+        self.scale = 0
+        self.defaultValue = None
+
+
+class Dataset(object):
+    """ a workspace, feature dataset, table or feature class"""
+
+    def __init__(self, path, kind, spatial_reference=None):
+        self.path = str(path)
+        self.name = os.path.basename(self.path.replace('\\', '/'))
+        self.kind = kind
+        self.spatial_reference = spatial_reference
+
+
+class Table(Dataset):
+
+    def __init__(self, path, fields=(), kind='Table', spatial_reference=None):
+        Dataset.__init__(self, path, kind, spatial_reference)
+        self.fields = [Field('OBJECTID', 'OID', editable=False, required=True)]
+        self.fields.extend(fields)
+        self.rows = OrderedDict()
+        self.next_oid = 1
+        self.shape_type = None
+        self.has_z = False
+        self.has_m = False
+        self.feature_type = 'Simple'
+
+    def field_index(self, name):
+        """ the position of a field in the rows, None when missing"""
+        upper = name.upper()
+        for index, field in enumerate(self.fields):
+            if field.name.upper() == upper:
+                return index
+        return None
+
+    def add_field(self, field):
+        if self.field_index(field.name) is not None:
+            return
+        self.fields.append(field)
+        for row in self.rows.values():
+            row.append(None)
+
+    def insert(self, values):
+        """ adds a row from {upper field name: value}, returns the ObjectID"""
+        oid = self.next_oid
+        self.next_oid += 1
+        row = [oid] + [values.get(field.name.upper()) for field in self.fields[1:]]
+        self.rows[oid] = row
+        return oid
+
+    def copy_to(self, path):
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other.path = str(path)
+        other.name = os.path.basename(other.path.replace('\\', '/'))
+        other.fields = list(self.fields)
+        other.rows = OrderedDict((oid, list(row)) for oid, row in self.rows.items())
+        return other
+
+
+class FeatureClass(Table):
+
+    def __init__(self, path, shape_type, fields=(), spatial_reference=None,
+                 has_z=False, has_m=False, feature_type='Simple'):
+        Table.__init__(self, path, [Field('SHAPE', 'Geometry', editable=True)] + list(fields),
+                       'FeatureClass', spatial_reference)
+        self.shape_type = shape_type
+        self.has_z = has_z
+        self.has_m = has_m
+        self.feature_type = feature_type
+        # the database maintained length and area are left out, scripts
+        # only ever read them
+
+
+class Store(object):
+    """ every dataset and layer the recording arcpy knows about"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.datasets = {}
+        self.layers = {}
+        self.add(Dataset('in_memory', 'Workspace'))
+
+    def add(self, dataset):
+        self.datasets[norm(dataset.path)] = dataset
+        return dataset
+
+    def dataset(self, path):
+        return self.datasets.get(norm(path))
+
+    def children(self, path):
+        key = norm(path)
+        return [dataset for child, dataset in self.datasets.items()
+                if parent_key(child) == key]
+
+    def under(self, path):
+        key = norm(path)
+        return [(child, dataset) for child, dataset in self.datasets.items()
+                if child == key or child.startswith(key + '/')]
+
+    def workspace_of(self, path):
+        key = parent_key(norm(path))
+        while key:
+            dataset = self.datasets.get(key)
+            if dataset is not None and dataset.kind == 'Workspace':
+                return dataset
+            key = parent_key(key)
+        return None
+
+    def exists(self, path):
+        if norm(path) in self.datasets or str(path) in self.layers:
+            return True
+        return os.path.exists(real_path(path))
+
+    def create_workspace(self, path):
+        """ a file geodatabase, its folder is created on disk when the parent
+        folder exists"""
+        real = real_path(path)
+        folder = os.path.dirname(real)
+        if folder and os.path.isdir(folder) and not os.path.exists(real):
+            os.mkdir(real)
+        return self.add(Dataset(path, 'Workspace'))
+
+    def delete(self, path):
+        if str(path) in self.layers:
+            del self.layers[str(path)]
+            return
+        found = self.under(path)
+        for key, dataset in found:
+            del self.datasets[key]
+        real = real_path(path)
+        if os.path.isdir(real):
+            shutil.rmtree(real, ignore_errors=True)
+        elif os.path.isfile(real):
+            os.remove(real)
+
+    def copy(self, source, target):
+        source_key = norm(source)
+        for key, dataset in sorted(self.under(source)):
+            depth = key[len(source_key):].count('/')
+            path = str(target)
+            if depth:
+                names = dataset.path.replace('\\', '/').rstrip('/').split('/')
+                path = path + '/' + '/'.join(names[-depth:])
+            if isinstance(dataset, Table):
+                self.add(dataset.copy_to(path))
+            elif dataset.kind == 'Workspace':
+                self.create_workspace(path)
+            else:
+                self.add(Dataset(path, dataset.kind, dataset.spatial_reference))
+
+
+store = Store()
@@ -0,0 +1,181 @@
+"""Layers and the rows of datasets as the scripts see them, through a
+layer's definition query and selection."""
+import os
+import json
+from arcpy._core import store, string_types, real_path, FeatureClass
+from arcpy._where import compile_where
+from arcpy.geometry import Extent
+
+
+class LabelClass(object):
+
+    def __init__(self):
+        self.className = 'Default'
+        self.expression = ''
+        self.SQLQuery = ''
+        self.showClassLabels = True
+
+
+class Layer(object):
+    """ a feature layer over a dataset, with an optional definition query
+    and selection"""
+
+    def __init__(self, source=None, name=None):
+        self.definitionQuery = ''
+        self.selection = None
+        if source is not None and str(source).lower().endswith('.lyr') and \
+                os.path.isfile(real_path(source)):
+            with open(real_path(source)) as layer_file:
+                saved = json.load(layer_file)
+            source = saved['dataSource']
+            name = name or saved['name']
+            self.definitionQuery = saved.get('definitionQuery', '')
+        self.dataSource = str(source) if source is not None else ''
+        dataset = store.dataset(self.dataSource) if source is not None else None
+        self.name = name or (dataset.name if dataset is not None else os.path.basename(self.dataSource))
+        self.longName = self.name
+        self.datasetName = dataset.name if dataset is not None else ''
+        self.workspacePath = os.path.dirname(self.dataSource)
+        self.visible = True
+        self.isBroken = False
+        self.isFeatureLayer = isinstance(dataset, FeatureClass) or dataset is None
+        self.isGroupLayer = False
+        self.isRasterLayer = False
+        self.isServiceLayer = False
+        self.showLabels = False
+        self.labelClasses = [LabelClass()]
+        self.transparency = 0
+        self.description = ''
+        self.brightness = 0
+        self.contrast = 0
+        self.minScale = 0
+        self.maxScale = 0
+
+    def supports(self, layer_property):
+        return str(layer_property).upper() in ('DATASOURCE', 'DEFINITIONQUERY', 'LABELCLASSES',
+                                                'NAME', 'VISIBLE', 'WORKSPACEPATH',
+                                                'DATASETNAME', 'SHOWLABELS', 'TRANSPARENCY')
+
+    def getExtent(self, symbolized_extent=True):
+        return extent_of_rows(self, None)
+
+    def getSelectedExtent(self, extent_of_selected=True):
+        return extent_of_rows(self, self.selection)
+
+    def saveACopy(self, path, version=None):
+        with open(real_path(path), 'w') as layer_file:
+            json.dump({'name': self.name, 'dataSource': self.dataSource,
+                       'definitionQuery': self.definitionQuery}, layer_file)
+
+    def replaceDataSource(self, workspace_path, workspace_type=None, dataset_name=None, validate=True):
+        self.dataSource = os.path.join(str(workspace_path), dataset_name or self.datasetName)
+        self.workspacePath = str(workspace_path)
+
+    def findAndReplaceWorkspacePath(self, find, replace, validate=True):
+        self.dataSource = self.dataSource.replace(str(find), str(replace))
+        self.workspacePath = os.path.dirname(self.dataSource)
+
+    def __str__(self):
+        return self.name
+
+    __repr__ = __str__
+
+
+class Result(object):
+    """ the result of a tool"""
+
+    def __init__(self, outputs, messages=''):
+        self.outputs = list(outputs)
+        self.messages = messages
+        self.status = 4
+        self.outputCount = len(self.outputs)
+
+    def getOutput(self, index):
+        return self.outputs[index]
+
+    def getMessages(self, severity=None):
+        return self.messages
+
+    def getMessage(self, index):
+        return self.messages
+
+    def __iter__(self):
+        return iter(self.outputs)
+
+    def __str__(self):
+        return str(self.outputs[0]) if self.outputs else ''
+
+    def __getitem__(self, index):
+        return self.outputs[index]
+
+
+def resolve(item):
+    """ the dataset and the layer, if any, of a path, layer name, layer or
+    result. Raises IOError when there is no such dataset"""
+    if isinstance(item, Result):
+        item = item.outputs[0]
+    layer = None
+    if isinstance(item, Layer):
+        layer = item
+    elif isinstance(item, string_types) and item in store.layers:
+        layer = store.layers[item]
+    if layer is not None:
+        dataset = store.dataset(layer.dataSource)
+    else:
+        dataset = store.dataset(item)
+    if dataset is None:
+        raise IOError('"' + str(item) + '" does not exist')
+    return dataset, layer
+
+
+def row_values(dataset, row):
+    """ the values of a row by upper case field name, for where clauses"""
+    return dict((field.name.upper(), value) for field, value in zip(dataset.fields, row))
+
+
+def rows(item, where=None, selected=True):
+    """ yields (oid, row) for the rows of a dataset or layer matching the
+    where clause, the layer's query and, with selected, its selection"""
+    dataset, layer = resolve(item)
+    tests = []
+    if where:
+        tests.append(compile_where(where))
+    if layer is not None:
+        if layer.definitionQuery:
+            tests.append(compile_where(layer.definitionQuery))
+    selection = layer.selection if layer is not None and selected else None
+    for oid in list(dataset.rows):
+        row = dataset.rows.get(oid)
+        if row is None:
+            continue
+        if selection is not None and oid not in selection:
+            continue
+        if tests:
+            values = row_values(dataset, row)
+            if not all(test(values) for test in tests):
+                continue
+        yield oid, row
+
+
+def shapes(item, where=None):
+    """ the shapes of a dataset or layer, for the tools that need them"""
+    dataset, layer = resolve(item)
+    index = dataset.field_index('SHAPE')
+    if index is None:
+        return []
+    return [row[index] for oid, row in rows(item, where) if row[index] is not None]
+
+
+def extent_of_rows(layer, selection):
+    envelopes = []
+    dataset, unused = resolve(layer)
+    index = dataset.field_index('SHAPE')
+    for oid, row in rows(layer, selected=selection is not None):
+        if index is not None and row[index] is not None:
+            envelopes.append(row[index].envelope)
+    if not envelopes:
+        return Extent()
+    return Extent(min(e[0] for e in envelopes), min(e[1] for e in envelopes),
+                  max(e[2] for e in envelopes), max(e[3] for e in envelopes))
+
+
@@ -0,0 +1,190 @@
+"""Evaluates the where clauses the scripts pass to cursors and layers.
+
+Supports comparisons, IN, BETWEEN, LIKE, IS [NOT] NULL, AND, OR, NOT and
+parentheses, which covers the clauses of the CTM tools and visual
+specifications. A clause is compiled once into a function of a row."""
+import re
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|-?\.\d+)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<op><>|!=|<=|>=|=|<|>)
+  | (?P<punct>[(),])
+  | (?P<name>[A-Za-z_@][A-Za-z0-9_.@]*|"[^"]+"|\[[^\]]+\])
+  )""", re.VERBOSE)
+
+_cache = {}
+
+
+def _tokens(where):
+    tokens = []
+    position = 0
+    where = where.strip()
+    while position < len(where):
+        match = _TOKEN.match(where, position)
+        if match is None or match.end() == position:
+            raise ValueError("Unsupported where clause: " + where)
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'number':
+            value = float(text)
+            tokens.append(('value', int(value) if value == int(value) and '.' not in text else value))
+        elif kind == 'string':
+            tokens.append(('value', text[1:-1].replace("''", "'")))
+        elif kind == 'name':
+            upper = text.upper()
+            if upper in ('AND', 'OR', 'NOT', 'IN', 'IS', 'NULL', 'BETWEEN', 'LIKE'):
+                tokens.append(('keyword', upper))
+            else:
+                tokens.append(('field', text.strip('"[]').upper()))
+        else:
+            tokens.append((kind, text))
+    return tokens
+
+
+def _compare(op, a, b):
+    if a is None or b is None:
+        return False
+    if op == '=':
+        return a == b
+    if op in ('<>', '!='):
+        return a != b
+    if op == '<':
+        return a < b
+    if op == '>':
+        return a > b
+    if op == '<=':
+        return a <= b
+    return a >= b
+
+
+class _Parser(object):
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, kind=None, text=None):
+        if self.position >= len(self.tokens):
+            return False
+        token = self.tokens[self.position]
+        return (kind is None or token[0] == kind) and (text is None or token[1] == text)
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, kind, text=None):
+        if not self.peek(kind, text):
+            raise ValueError("Expected " + str(text or kind))
+        return self.take()
+
+    def parse(self):
+        node = self.disjunction()
+        if self.position != len(self.tokens):
+            raise ValueError("Unexpected " + str(self.tokens[self.position]))
+        return node
+
+    def disjunction(self):
+        nodes = [self.conjunction()]
+        while self.peek('keyword', 'OR'):
+            self.take()
+            nodes.append(self.conjunction())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda row: any(node(row) for node in nodes)
+
+    def conjunction(self):
+        nodes = [self.negation()]
+        while self.peek('keyword', 'AND'):
+            self.take()
+            nodes.append(self.negation())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda row: all(node(row) for node in nodes)
+
+    def negation(self):
+        if self.peek('keyword', 'NOT'):
+            self.take()
+            node = self.negation()
+            return lambda row: not node(row)
+        return self.predicate()
+
+    def operand(self):
+        kind, value = self.take()
+        if kind == 'field':
+            return lambda row: row.get(value)
+        if kind == 'value':
+            return lambda row: value
+        raise ValueError("Unexpected " + str(value))
+
+    def list_value(self):
+        if self.peek('keyword', 'NULL'):
+            self.take()
+            return None
+        return self.expect('value')[1]
+
+    def predicate(self):
+        if self.peek('punct', '('):
+            self.take()
+            node = self.disjunction()
+            self.expect('punct', ')')
+            return node
+        left = self.operand()
+        negate = False
+        if self.peek('keyword', 'NOT'):
+            self.take()
+            negate = True
+        if self.peek('op'):
+            op = self.take()[1]
+            right = self.operand()
+            node = lambda row: _compare(op, left(row), right(row))
+        elif self.peek('keyword', 'IN'):
+            self.take()
+            self.expect('punct', '(')
+            values = [self.list_value()]
+            while self.peek('punct', ','):
+                self.take()
+                values.append(self.list_value())
+            self.expect('punct', ')')
+            # NULL in a list never matches, as in SQL
+            values = set(value for value in values if value is not None)
+            node = lambda row: left(row) in values
+        elif self.peek('keyword', 'BETWEEN'):
+            self.take()
+            low = self.operand()
+            self.expect('keyword', 'AND')
+            high = self.operand()
+            node = lambda row: (_compare('>=', left(row), low(row)) and
+                                _compare('<=', left(row), high(row)))
+        elif self.peek('keyword', 'LIKE'):
+            self.take()
+            pattern = self.expect('value')[1]
+            regex = re.compile('^' + ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c)
+                                             for c in pattern) + '$')
+            node = lambda row: left(row) is not None and regex.match(str(left(row))) is not None
+        elif self.peek('keyword', 'IS'):
+            self.take()
+            if self.peek('keyword', 'NOT'):
+                self.take()
+                negate = not negate
+            self.expect('keyword', 'NULL')
+            node = lambda row: left(row) is None
+        else:
+            raise ValueError("Expected a comparison")
+        if negate:
+            plain = node
+            return lambda row: not plain(row)
+        return node
+
+
+def compile_where(where):
+    """ a function of {upper field name: value}, None for an empty clause"""
+    if not where or not str(where).strip():
+        return None
+    where = str(where)
+    if where not in _cache:
+        _cache[where] = _Parser(_tokens(where)).parse()
+    return _cache[where]
@@ -0,0 +1,309 @@
+"""arcpy.da: cursors over the datasets of the recording arcpy and Walk.
+
+Every row a cursor hands to the script is counted as read, every row the
+script updates, inserts or deletes is counted as written."""
+import os
+from arcpy._core import store, recorder, string_types, Table, FeatureClass
+from arcpy._data import resolve, rows
+from arcpy.geometry import Geometry, PointGeometry, Point
+
+
+def _shape_reader(token, spatial_reference):
+    token = token.upper()
+
+    def project(shape):
+        if spatial_reference is not None and shape.spatialReference != spatial_reference:
+            return shape.projectAs(spatial_reference)
+        return shape
+
+    if token == 'SHAPE@':
+        return lambda shape: project(shape)
+    if token == 'SHAPE@XY':
+        return lambda shape: (shape.centroid.X, shape.centroid.Y)
+    if token == 'SHAPE@TRUECENTROID':
+        return lambda shape: (shape.centroid.X, shape.centroid.Y)
+    if token == 'SHAPE@X':
+        return lambda shape: shape.centroid.X
+    if token == 'SHAPE@Y':
+        return lambda shape: shape.centroid.Y
+    if token == 'SHAPE@WKB':
+        return lambda shape: shape.WKB
+    if token == 'SHAPE@WKT':
+        return lambda shape: shape.WKT
+    if token == 'SHAPE@JSON':
+        return lambda shape: shape.JSON
+    if token == 'SHAPE@LENGTH':
+        return lambda shape: shape.length
+    if token == 'SHAPE@AREA':
+        return lambda shape: shape.area
+    raise RuntimeError("Cannot find field '" + token + "'")
+
+
+class _Cursor(object):
+
+    kind = 'SearchCursor'
+
+    def __init__(self, in_table, field_names, where_clause=None, spatial_reference=None,
+                 explode_to_points=False, sql_clause=(None, None), datum_transformation=None):
+        recorder.call('da.' + self.kind)
+        recorder.cursors += 1
+        self.source = in_table
+        self.dataset, self.layer = resolve(in_table)
+        if isinstance(field_names, string_types) and field_names != '*':
+            field_names = [name.strip() for name in field_names.split(';')]
+        if field_names == '*' or field_names == ['*']:
+            field_names = [field.name for field in self.dataset.fields]
+        self.fields = tuple(field_names)
+        self.where = where_clause
+        self.spatial_reference = spatial_reference
+        self.order_by = None
+        if sql_clause and sql_clause[1] and 'ORDER BY' in str(sql_clause[1]).upper():
+            self.order_by = str(sql_clause[1]).split()[-1]
+        self.shape_index = self.dataset.field_index('SHAPE')
+        self.readers = []
+        self.writers = []
+        for name in self.fields:
+            upper = name.upper()
+            if upper == 'OID@':
+                self.readers.append((0, None))
+                self.writers.append(None)
+            elif upper.startswith('SHAPE@'):
+                if self.shape_index is None:
+                    raise RuntimeError("Cannot find field '" + name + "'")
+                self.readers.append((self.shape_index, _shape_reader(upper, spatial_reference)))
+                self.writers.append((self.shape_index, upper))
+            else:
+                index = self.dataset.field_index(name)
+                if index is None:
+                    raise RuntimeError("Cannot find field '" + name + "'")
+                self.readers.append((index, None))
+                self.writers.append((index, None))
+        self._iterator = None
+        self.current = None
+
+    def _rows(self):
+        found = rows(self.source, self.where)
+        if self.order_by:
+            index = self.dataset.field_index(self.order_by)
+            found = sorted(found, key=lambda item: item[1][index])
+        for oid, row in found:
+            recorder.rows_read += 1
+            self.current = oid
+            values = []
+            for index, reader in self.readers:
+                value = row[index]
+                if reader is not None and value is not None:
+                    value = reader(value)
+                values.append(value)
+            yield values
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._rows()
+        return self._convert(next(self._iterator))
+
+    next = __next__
+
+    def _convert(self, values):
+        return tuple(values)
+
+    def reset(self):
+        self._iterator = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._iterator = None
+        return False
+
+
+class SearchCursor(_Cursor):
+    kind = 'SearchCursor'
+
+
+def _stored(writer, value, spatial_reference):
+    index, token = writer
+    if token is None or value is None:
+        return value
+    if token == 'SHAPE@XY':
+        return PointGeometry(Point(value[0], value[1]), spatial_reference)
+    if isinstance(value, Geometry):
+        return value
+    raise RuntimeError("Unsupported value for " + token)
+
+
+class UpdateCursor(_Cursor):
+    kind = 'UpdateCursor'
+
+    def _convert(self, values):
+        return list(values)
+
+    def updateRow(self, values):
+        row = self.dataset.rows[self.current]
+        for writer, value in zip(self.writers, values):
+            if writer is None:
+                continue
+            row[writer[0]] = _stored(writer, value, self.dataset.spatial_reference)
+        recorder.rows_written += 1
+
+    def deleteRow(self):
+        del self.dataset.rows[self.current]
+        recorder.rows_written += 1
+
+
+class InsertCursor(object):
+
+    def __init__(self, in_table, field_names, datum_transformation=None):
+        recorder.call('da.InsertCursor')
+        recorder.cursors += 1
+        self.dataset, self.layer = resolve(in_table)
+        if isinstance(field_names, string_types):
+            field_names = [name.strip() for name in field_names.split(';')]
+        self.fields = tuple(field_names)
+        self.writers = []
+        for name in self.fields:
+            upper = name.upper()
+            if upper == 'OID@':
+                self.writers.append(None)
+            elif upper.startswith('SHAPE@'):
+                self.writers.append((self.dataset.field_index('SHAPE'), upper))
+            else:
+                index = self.dataset.field_index(name)
+                if index is None:
+                    raise RuntimeError("Cannot find field '" + name + "'")
+                self.writers.append((index, None))
+
+    def insertRow(self, values):
+        oid = self.dataset.insert({})
+        row = self.dataset.rows[oid]
+        for writer, value in zip(self.writers, values):
+            if writer is not None:
+                row[writer[0]] = _stored(writer, value, self.dataset.spatial_reference)
+        recorder.rows_written += 1
+        return oid
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# NumPy types of the field types, strings get the length of the field
+_DTYPES = {'OID': '<i4', 'SmallInteger': '<i2', 'Integer': '<i4', 'Single': '<f4',
+           'Double': '<f8', 'Date': '<M8[us]'}
+
+
+class _FeatureClassReader(_Cursor):
+    kind = 'FeatureClassToNumPyArray'
+
+
+class _TableReader(_Cursor):
+    kind = 'TableToNumPyArray'
+
+
+def _to_numpy(reader, in_table, field_names, where_clause=None, skip_nulls=False,
+              null_value=None):
+    """ reads the rows with a search cursor into a structured array, nulls
+    are replaced by null_value, a value or a dictionary by field name, or
+    skipped with skip_nulls, otherwise they raise like arcpy does"""
+    import numpy
+    cursor = reader(in_table, field_names, where_clause)
+    dtype = []
+    for name, (index, reader) in zip(cursor.fields, cursor.readers):
+        if name.upper() == 'OID@':
+            dtype.append((str(name), '<i4'))
+        elif name.upper() in ('SHAPE@XY', 'SHAPE@TRUECENTROID'):
+            dtype.append((str(name), '<f8', 2))
+        elif name.upper().startswith('SHAPE@'):
+            dtype.append((str(name), '<f8'))
+        else:
+            field = cursor.dataset.fields[index]
+            dtype.append((str(name), _DTYPES.get(field.type, '<U' + str(field.length))))
+    values = []
+    for row in cursor:
+        converted = []
+        for name, value in zip(cursor.fields, row):
+            if value is None:
+                if isinstance(null_value, dict) and name in null_value:
+                    value = null_value[name]
+                elif null_value is not None and not isinstance(null_value, dict):
+                    value = null_value
+                elif skip_nulls:
+                    converted = None
+                    break
+                else:
+                    raise RuntimeError("Null value in " + name + ", use skip_nulls or null_value")
+            converted.append(value)
+        if converted is not None:
+            values.append(tuple(converted))
+    return numpy.array(values, dtype=dtype)
+
+
+def FeatureClassToNumPyArray(in_table, field_names, where_clause=None, spatial_reference=None,
+                             explode_to_points=False, skip_nulls=False, null_value=None):
+    return _to_numpy(_FeatureClassReader, in_table, field_names, where_clause,
+                     skip_nulls, null_value)
+
+
+def TableToNumPyArray(in_table, field_names, where_clause=None, skip_nulls=False,
+                      null_value=None):
+    return _to_numpy(_TableReader, in_table, field_names, where_clause,
+                     skip_nulls, null_value)
+
+
+def _matches(dataset, datatype):
+    if datatype is None:
+        return isinstance(dataset, Table)
+    datatypes = [datatype] if isinstance(datatype, string_types) else list(datatype)
+    for kind in datatypes:
+        if kind == 'FeatureClass' and isinstance(dataset, FeatureClass):
+            return True
+        if kind == 'Table' and isinstance(dataset, Table) and not isinstance(dataset, FeatureClass):
+            return True
+        if kind == 'Any' and isinstance(dataset, Table):
+            return True
+    return False
+
+
+def Walk(top, topdown=True, onerror=None, followlinks=False, datatype=None, type=None):
+    recorder.call('da.Walk')
+    folders = [str(top)]
+    while folders:
+        folder = folders.pop(0)
+        children = sorted(store.children(folder), key=lambda dataset: dataset.name.lower())
+        dirnames = [child.name for child in children if child.kind == 'FeatureDataset']
+        filenames = [child.name for child in children if _matches(child, datatype)]
+        yield folder, dirnames, filenames
+        folders.extend(os.path.join(folder, name) for name in dirnames)
+
+
+class Editor(object):
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.isEditing = False
+
+    def startEditing(self, with_undo=True, multiuser_mode=True):
+        self.isEditing = True
+
+    def stopEditing(self, save_changes=True):
+        self.isEditing = False
+
+    def startOperation(self):
+        pass
+
+    def stopOperation(self):
+        pass
+
+    def __enter__(self):
+        self.startEditing()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopEditing()
+        return False
@@ -0,0 +1,421 @@
+"""Points, arrays, spatial references and geometries of the recording arcpy.
+
+Geometries keep their vertices and answer the relational and overlay
+methods from envelopes: a line is split into the runs of vertices inside
+and outside the envelope of the other geometry, polygons overlap when
+their envelopes do. This exercises the code paths of the scripts, it is
+not a geometry engine."""
+import json
+import struct
+
+
+class Point(object):
+
+    def __init__(self, X=0.0, Y=0.0, Z=None, M=None, ID=0):
+        self.X = X
+        self.Y = Y
+        self.Z = Z
+        self.M = M
+        self.ID = ID
+
+    def __repr__(self):
+        return "%s %s" % (self.X, self.Y)
+
+
+class Array(object):
+
+    def __init__(self, items=None):
+        self.items = list(items or [])
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def add(self, item):
+        self.items.append(item)
+
+    append = add
+
+    def getObject(self, index):
+        return self.items[index]
+
+    def removeAll(self):
+        self.items = []
+
+
+class SpatialReference(object):
+
+    def __init__(self, item=None):
+        self.factoryCode = 0
+        self.name = 'Unknown'
+        if isinstance(item, int):
+            self.factoryCode = item
+            self.name = {4326: 'GCS_WGS_1984'}.get(item, 'WKID_' + str(item))
+        elif item:
+            self.name = str(item)
+        self.type = 'Geographic' if self.name.startswith('GCS') else 'Projected'
+
+    @property
+    def GCS(self):
+        return SpatialReference(4326)
+
+    @property
+    def PCSCode(self):
+        return self.factoryCode if self.type == 'Projected' else 0
+
+    def exportToString(self):
+        return self.name + ';' + str(self.factoryCode)
+
+    def loadFromString(self, text):
+        name, _, code = str(text).partition(';')
+        self.name = name
+        self.factoryCode = int(code or 0)
+        self.type = 'Geographic' if self.name.startswith('GCS') else 'Projected'
+
+    def __eq__(self, other):
+        return isinstance(other, SpatialReference) and other.name == self.name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+class Extent(object):
+
+    def __init__(self, XMin=0.0, YMin=0.0, XMax=0.0, YMax=0.0, ZMin=None, ZMax=None,
+                 MMin=None, MMax=None):
+        self.XMin = XMin
+        self.YMin = YMin
+        self.XMax = XMax
+        self.YMax = YMax
+        self.spatialReference = None
+
+    @property
+    def width(self):
+        return self.XMax - self.XMin
+
+    @property
+    def height(self):
+        return self.YMax - self.YMin
+
+    @property
+    def lowerLeft(self):
+        return Point(self.XMin, self.YMin)
+
+    @property
+    def upperRight(self):
+        return Point(self.XMax, self.YMax)
+
+    @property
+    def polygon(self):
+        return rectangle((self.XMin, self.YMin, self.XMax, self.YMax), self.spatialReference)
+
+    def overlaps(self, other):
+        return envelopes_overlap(envelope_of(self), envelope_of(other))
+
+    def __str__(self):
+        return "%s %s %s %s NaN NaN NaN NaN" % (self.XMin, self.YMin, self.XMax, self.YMax)
+
+
+def envelope_of(item):
+    if isinstance(item, Extent):
+        return (item.XMin, item.YMin, item.XMax, item.YMax)
+    return item.envelope
+
+
+def envelopes_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def envelope_contains(outer, inner):
+    return (outer[0] <= inner[0] and inner[2] <= outer[2] and
+            outer[1] <= inner[1] and inner[3] <= outer[3])
+
+
+def _parts(items):
+    """ lists of points from an Array of Points, an Array of Arrays or lists"""
+    if isinstance(items, Point):
+        return [[items]]
+    items = list(items or [])
+    if not items:
+        return []
+    if isinstance(items[0], Point):
+        return [list(items)]
+    return [[point for point in part if point is not None] for part in items]
+
+
+class Geometry(object):
+
+    type = None
+
+    def __init__(self, inputs=None, spatial_reference=None, has_z=False, has_m=False):
+        self.parts = [part for part in _parts(inputs) if part]
+        self.spatialReference = spatial_reference
+        self.hasZ = has_z
+        self.hasM = has_m
+        self._envelope = None
+
+    def _new(self, parts):
+        return self.__class__(parts, self.spatialReference, self.hasZ, self.hasM)
+
+    def __iter__(self):
+        return iter([Array(part) for part in self.parts])
+
+    def getPart(self, index=None):
+        if index is None:
+            return Array([Array(part) for part in self.parts])
+        return Array(self.parts[index])
+
+    @property
+    def partCount(self):
+        return len(self.parts)
+
+    @property
+    def pointCount(self):
+        return sum(len(part) for part in self.parts)
+
+    @property
+    def isMultipart(self):
+        return len(self.parts) > 1
+
+    @property
+    def envelope(self):
+        if self._envelope is None:
+            xs = [point.X for part in self.parts for point in part]
+            ys = [point.Y for part in self.parts for point in part]
+            if not xs:
+                self._envelope = (0.0, 0.0, 0.0, 0.0)
+            else:
+                self._envelope = (min(xs), min(ys), max(xs), max(ys))
+        return self._envelope
+
+    @property
+    def extent(self):
+        extent = Extent(*self.envelope)
+        extent.spatialReference = self.spatialReference
+        return extent
+
+    @property
+    def firstPoint(self):
+        return self.parts[0][0] if self.parts else None
+
+    @property
+    def lastPoint(self):
+        return self.parts[-1][-1] if self.parts else None
+
+    @property
+    def centroid(self):
+        xmin, ymin, xmax, ymax = self.envelope
+        return Point((xmin + xmax) / 2.0, (ymin + ymax) / 2.0)
+
+    trueCentroid = centroid
+    labelPoint = centroid
+
+    @property
+    def length(self):
+        total = 0.0
+        for part in self.parts:
+            for a, b in zip(part, part[1:]):
+                total += ((a.X - b.X) ** 2 + (a.Y - b.Y) ** 2) ** 0.5
+        return total
+
+    @property
+    def area(self):
+        return 0.0
+
+    @property
+    def JSON(self):
+        return json.dumps(self.esri_json())
+
+    @property
+    def WKT(self):
+        return self.type.upper() + " " + repr(self.parts)
+
+    @property
+    def WKB(self):
+        values = [value for part in self.parts for point in part for value in (point.X, point.Y)]
+        return bytearray(struct.pack('<%dd' % len(values), *values))
+
+    def esri_json(self):
+        data = {}
+        if self.spatialReference is not None:
+            data['spatialReference'] = {'wkid': self.spatialReference.factoryCode}
+        return data
+
+    def projectAs(self, spatial_reference, transformation=None):
+        copy = self._new(self.parts)
+        copy.spatialReference = spatial_reference
+        return copy
+
+    def boundary(self):
+        return Polyline(self.parts, self.spatialReference)
+
+    def buffer(self, distance):
+        xmin, ymin, xmax, ymax = self.envelope
+        return rectangle((xmin - distance, ymin - distance, xmax + distance, ymax + distance),
+                         self.spatialReference)
+
+    def disjoint(self, other):
+        return not envelopes_overlap(self.envelope, envelope_of(other))
+
+    def intersects(self, other):
+        return not self.disjoint(other)
+
+    def touches(self, other):
+        return not self.disjoint(other)
+
+    overlaps = touches
+    crosses = touches
+
+    def contains(self, other):
+        return envelope_contains(self.envelope, envelope_of(other))
+
+    def within(self, other):
+        return envelope_contains(envelope_of(other), self.envelope)
+
+    def equals(self, other):
+        return self.parts == getattr(other, 'parts', None)
+
+    def _runs(self, envelope, inside):
+        """ the runs of vertices inside (or outside) the envelope, every run
+        takes the vertex on either side of it so it keeps the crossing
+        segments"""
+        runs = []
+        for part in self.parts:
+            flags = [envelope_contains(envelope, (p.X, p.Y, p.X, p.Y)) == inside for p in part]
+            start = None
+            for index, flag in enumerate(flags + [False]):
+                if flag and start is None:
+                    start = index
+                elif not flag and start is not None:
+                    run = part[max(0, start - 1):min(len(part), index + 1)]
+                    if len(run) > 1:
+                        runs.append(run)
+                    start = None
+        return runs
+
+    def intersect(self, other, dimension=None):
+        envelope = envelope_of(other)
+        if isinstance(self, Polygon):
+            xmin, ymin, xmax, ymax = self.envelope
+            box = (max(xmin, envelope[0]), max(ymin, envelope[1]),
+                   min(xmax, envelope[2]), min(ymax, envelope[3]))
+            if box[0] > box[2] or box[1] > box[3]:
+                return Polygon([], self.spatialReference)
+            return rectangle(box, self.spatialReference)
+        if isinstance(self, Polyline):
+            return self._new(self._runs(envelope, True))
+        return self._new([[p for part in self.parts for p in part
+                           if envelope_contains(envelope, (p.X, p.Y, p.X, p.Y))]])
+
+    def clip(self, extent):
+        return self.intersect(extent)
+
+    def difference(self, other):
+        envelope = envelope_of(other)
+        if isinstance(self, Polyline):
+            return self._new(self._runs(envelope, False))
+        if envelope_contains(envelope, self.envelope):
+            return self._new([])
+        return self._new(self.parts)
+
+    def union(self, other):
+        return self._new(self.parts + list(getattr(other, 'parts', [])))
+
+    def symmetricDifference(self, other):
+        return self._new(self.parts)
+
+
+class Polyline(Geometry):
+    type = 'polyline'
+
+    def esri_json(self):
+        data = Geometry.esri_json(self)
+        data['paths'] = [[[p.X, p.Y] for p in part] for part in self.parts]
+        return data
+
+
+class Polygon(Geometry):
+    type = 'polygon'
+
+    @property
+    def area(self):
+        total = 0.0
+        for part in self.parts:
+            total += abs(sum(a.X * b.Y - b.X * a.Y for a, b in zip(part, part[1:] + part[:1]))) / 2.0
+        return total
+
+    @property
+    def length(self):
+        return Geometry.length.fget(self.boundary())
+
+    def esri_json(self):
+        data = Geometry.esri_json(self)
+        data['rings'] = [[[p.X, p.Y] for p in part] for part in self.parts]
+        return data
+
+
+class PointGeometry(Geometry):
+    type = 'point'
+
+    @property
+    def X(self):
+        return self.parts[0][0].X
+
+    @property
+    def Y(self):
+        return self.parts[0][0].Y
+
+    def esri_json(self):
+        data = Geometry.esri_json(self)
+        data['x'] = self.parts[0][0].X
+        data['y'] = self.parts[0][0].Y
+        return data
+
+
+class Multipoint(Geometry):
+    type = 'multipoint'
+
+    def esri_json(self):
+        data = Geometry.esri_json(self)
+        data['points'] = [[p.X, p.Y] for part in self.parts for p in part]
+        return data
+
+
+def rectangle(envelope, spatial_reference=None):
+    xmin, ymin, xmax, ymax = envelope
+    return Polygon([Point(xmin, ymin), Point(xmin, ymax), Point(xmax, ymax),
+                    Point(xmax, ymin), Point(xmin, ymin)], spatial_reference)
+
+
+def AsShape(geojson_struct, esri_json=False):
+    data = geojson_struct
+    if not isinstance(data, dict):
+        data = json.loads(data)
+    spatial_reference = None
+    if data.get('spatialReference'):
+        spatial_reference = SpatialReference(int(data['spatialReference'].get('wkid') or 0))
+
+    def points(coordinates):
+        return [Point(c[0], c[1]) for c in coordinates]
+
+    if 'rings' in data:
+        return Polygon([points(ring) for ring in data['rings']], spatial_reference)
+    if 'paths' in data:
+        return Polyline([points(path) for path in data['paths']], spatial_reference)
+    if 'points' in data:
+        return Multipoint([points(data['points'])], spatial_reference)
+    if 'x' in data:
+        return PointGeometry(Point(data['x'], data['y']), spatial_reference)
+    raise ValueError("Unsupported geometry " + str(data)[:80])
@@ -0,0 +1,216 @@
+"""arcpy.mapping: map documents of the recording arcpy.
+
+A map document is a JSON file with its data frames, their layers and the
+layout elements, the synthetic data generator writes the templates. The
+export functions write a small file in place of the page."""
+import os
+import json
+import fnmatch
+from arcpy._core import recorder, real_path, string_types
+from arcpy._data import Layer
+from arcpy.geometry import Extent, SpatialReference
+
+
+def _record(name):
+    recorder.call('mapping.' + name)
+
+
+def _matches(name, wildcard):
+    if wildcard is None or wildcard == '':
+        return True
+    if not isinstance(wildcard, string_types):
+        wildcard = getattr(wildcard, 'name', str(wildcard))
+    return fnmatch.fnmatch(name.lower(), wildcard.lower())
+
+
+class DataFrame(object):
+
+    def __init__(self, data):
+        self.name = data['name']
+        self.elementWidth = data.get('elementWidth', 10.0)
+        self.elementHeight = data.get('elementHeight', 10.0)
+        self.elementPositionX = data.get('elementPositionX', 0.0)
+        self.elementPositionY = data.get('elementPositionY', 0.0)
+        self.extent = Extent(*data.get('extent', (0.0, 0.0, 1.0, 1.0)))
+        self.scale = data.get('scale', 50000.0)
+        self.referenceScale = data.get('referenceScale', 0.0)
+        self.rotation = 0.0
+        self.mapUnits = 'Meters'
+        self.displayUnits = 'Meters'
+        self.credits = ''
+        self.description = ''
+        self.type = 'DATAFRAME_ELEMENT'
+        self.spatialReference = SpatialReference(data.get('wkid', 4326))
+        self.layers = []
+        for layer_data in data.get('layers', []):
+            layer = Layer(layer_data['dataSource'], layer_data['name'])
+            layer.definitionQuery = layer_data.get('definitionQuery', '')
+            self.layers.append(layer)
+
+    def panToExtent(self, extent):
+        width = self.extent.width
+        height = self.extent.height
+        x = (extent.XMin + extent.XMax) / 2.0
+        y = (extent.YMin + extent.YMax) / 2.0
+        self.extent = Extent(x - width / 2.0, y - height / 2.0, x + width / 2.0, y + height / 2.0)
+
+    def zoomToSelectedFeatures(self):
+        pass
+
+    def data(self):
+        return {'name': self.name, 'elementWidth': self.elementWidth,
+                'elementHeight': self.elementHeight, 'scale': self.scale,
+                'extent': [self.extent.XMin, self.extent.YMin, self.extent.XMax, self.extent.YMax],
+                'wkid': self.spatialReference.factoryCode,
+                'layers': [{'name': layer.name, 'dataSource': layer.dataSource,
+                            'definitionQuery': layer.definitionQuery} for layer in self.layers]}
+
+
+class LayoutElement(object):
+
+    def __init__(self, data):
+        self.name = data['name']
+        self.type = data.get('type', 'TEXT_ELEMENT')
+        self.text = data.get('text', '')
+        self.elementWidth = data.get('elementWidth', 1.0)
+        self.elementHeight = data.get('elementHeight', 1.0)
+        self.elementPositionX = data.get('elementPositionX', 0.0)
+        self.elementPositionY = data.get('elementPositionY', 0.0)
+        self.visible = True
+
+    def data(self):
+        return {'name': self.name, 'type': self.type, 'text': self.text}
+
+
+class MapDocument(object):
+
+    def __init__(self, mxd_path):
+        _record('MapDocument')
+        self.filePath = str(mxd_path)
+        with open(real_path(mxd_path)) as mxd_file:
+            data = json.load(mxd_file)
+        self.dataFrames = [DataFrame(frame) for frame in data.get('dataFrames', [])]
+        self.elements = [LayoutElement(element) for element in data.get('elements', [])]
+        self.activeView = data.get('activeView', 'PAGE_LAYOUT')
+        self.title = data.get('title', '')
+        self.author = ''
+        self.credits = ''
+        self.relativePaths = True
+        self.pageSize = (63.0, 88.0)
+        self.dataDrivenPages = None
+
+    def _data(self):
+        return {'dataFrames': [frame.data() for frame in self.dataFrames],
+                'elements': [element.data() for element in self.elements],
+                'activeView': self.activeView, 'title': self.title}
+
+    def save(self):
+        _record('MapDocument.save')
+        self.saveACopy(self.filePath)
+
+    def saveACopy(self, file_name, version=None):
+        with open(real_path(file_name), 'w') as mxd_file:
+            json.dump(self._data(), mxd_file)
+
+    def deleteThumbnail(self):
+        pass
+
+
+def ListDataFrames(map_document, wildcard=None):
+    _record('ListDataFrames')
+    return [frame for frame in map_document.dataFrames if _matches(frame.name, wildcard)]
+
+
+def ListLayers(map_document_or_layer, wildcard=None, data_frame=None):
+    _record('ListLayers')
+    if isinstance(map_document_or_layer, Layer):
+        return [map_document_or_layer] if _matches(map_document_or_layer.name, wildcard) else []
+    frames = [data_frame] if data_frame is not None else map_document_or_layer.dataFrames
+    return [layer for frame in frames for layer in frame.layers if _matches(layer.name, wildcard)]
+
+
+def ListLayoutElements(map_document, element_type=None, wildcard=None):
+    _record('ListLayoutElements')
+    return [element for element in map_document.elements
+            if (element_type is None or element.type == element_type) and
+            _matches(element.name, wildcard)]
+
+
+def AddLayer(data_frame, add_layer, add_position='AUTO_ARRANGE'):
+    _record('AddLayer')
+    if add_position == 'BOTTOM':
+        data_frame.layers.append(add_layer)
+    else:
+        data_frame.layers.insert(0, add_layer)
+
+
+def InsertLayer(data_frame, reference_layer, insert_layer, insert_position='BEFORE'):
+    _record('InsertLayer')
+    data_frame.layers.insert(0, insert_layer)
+
+
+def RemoveLayer(data_frame, remove_layer):
+    _record('RemoveLayer')
+    data_frame.layers = [layer for layer in data_frame.layers
+                         if layer is not remove_layer and layer.name != remove_layer.name]
+
+
+def UpdateLayer(data_frame, update_layer, source_layer, symbology_only=True):
+    _record('UpdateLayer')
+
+
+def MoveLayer(data_frame, reference_layer, move_layer, insert_position='BEFORE'):
+    _record('MoveLayer')
+
+
+def _export(name, map_document, out_path):
+    _record(name)
+    with open(real_path(out_path), 'w') as page:
+        json.dump({'export': name, 'map': getattr(map_document, 'filePath', str(map_document))}, page)
+
+
+def ExportToPDF(map_document, out_pdf, *args, **kwargs):
+    _export('ExportToPDF', map_document, out_pdf)
+
+
+def ExportToJPEG(map_document, out_jpeg, *args, **kwargs):
+    _export('ExportToJPEG', map_document, out_jpeg)
+
+
+def ExportToTIFF(map_document, out_tiff, *args, **kwargs):
+    _export('ExportToTIFF', map_document, out_tiff)
+
+
+def ExportToPNG(map_document, out_png, *args, **kwargs):
+    _export('ExportToPNG', map_document, out_png)
+
+
+class PDFDocument(object):
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.pageCount = 0
+        if os.path.isfile(real_path(path)):
+            with open(real_path(path)) as pdf:
+                try:
+                    self.pageCount = json.load(pdf).get('pages', 1)
+                except ValueError:
+                    self.pageCount = 1
+
+    def appendPages(self, pdf_path, input_pdf_password=None):
+        _record('PDFDocument.appendPages')
+        self.pageCount += PDFDocument(pdf_path).pageCount or 1
+
+    def saveAndClose(self):
+        with open(real_path(self.path), 'w') as pdf:
+            json.dump({'pages': self.pageCount}, pdf)
+
+
+def PDFDocumentCreate(pdf_path):
+    _record('PDFDocumentCreate')
+    return PDFDocument(pdf_path)
+
+
+def PDFDocumentOpen(pdf_path, user_password=None, master_password=None):
+    _record('PDFDocumentOpen')
+    return PDFDocument(pdf_path)
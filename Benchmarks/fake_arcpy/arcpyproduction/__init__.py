@@ -0,0 +1,3 @@
+"""A recording stand-in for the parts of arcpyproduction used by the CTM
+scripts, see the arcpy package next to it."""
+from arcpyproduction import mapping
@@ -0,0 +1,54 @@
+"""arcpyproduction.mapping: grids, masking and the production exports.
+
+A grid is read from the small XML file the synthetic data generator
+writes, <Grid type="..." scale="..." wkid="..."/>. The exports write a
+small file in place of the page, like arcpy.mapping."""
+from xml.etree import ElementTree
+from arcpy._core import recorder, real_path
+from arcpy.geometry import Extent, SpatialReference
+from arcpy import mapping as _mapping
+
+
+def _record(name):
+    recorder.call('production.' + name)
+
+
+class Grid(object):
+
+    def __init__(self, grid_xml):
+        _record('Grid')
+        root = ElementTree.parse(real_path(grid_xml)).getroot()
+        self.name = root.get('name', 'Grid')
+        self.type = root.get('type', 'UTM')
+        self.scale = float(root.get('scale', 50000))
+        self.baseSpatialReference = SpatialReference(int(root.get('wkid', 4326)))
+
+    def updateDataFrameProperties(self, data_frame, aoi):
+        _record('Grid.updateDataFrameProperties')
+        xmin, ymin, xmax, ymax = aoi.envelope
+        data_frame.extent = Extent(xmin, ymin, xmax, ymax)
+        data_frame.scale = self.scale
+
+
+def ClipDataFrameToGeometry(data_frame, geometry, exclude_layers=None):
+    _record('ClipDataFrameToGeometry')
+
+
+def EnableLayerMasking(data_frame, enable):
+    _record('EnableLayerMasking')
+
+
+def MaskLayer(data_frame, mask_operation, masking_layer, masked_layer):
+    _record('MaskLayer')
+
+
+def ApplyLayoutRules(map_document, rules):
+    _record('ApplyLayoutRules')
+
+
+def ExportToLayoutGeoTIFF(map_document, out_tiff, *args, **kwargs):
+    _mapping._export('ExportToLayoutGeoTIFF', map_document, out_tiff)
+
+
+def ExportToProductionPDF(map_document, out_pdf, *args, **kwargs):
+    _mapping._export('ExportToProductionPDF', map_document, out_pdf)
@@ -0,0 +1,31 @@
+"""A recording stand-in for arcpywmx. The harness registers the jobs the
+entry points look up in jobs, by job ID: {'name': ..., 'aoi': path}."""
+from arcpy._core import recorder
+
+jobs = {}
+
+
+class Job(object):
+
+    def __init__(self, job_id, data):
+        self.ID = job_id
+        self.name = data['name']
+        self.hasAOI = bool(data.get('aoi'))
+        self.properties = {}
+
+    def save(self):
+        recorder.call('wmx.Job.save')
+
+
+class Connection(object):
+
+    def getJob(self, job_id):
+        recorder.call('wmx.getJob')
+        if job_id not in jobs:
+            return None
+        return Job(job_id, jobs[job_id])
+
+
+def Connect(database_path=None):
+    recorder.call('wmx.Connect')
+    return Connection()
@@ -9,22 +9,81 @@
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
 import os
+import sys
 import arcpy
-import datetime
-
-
-def create_backup(backup, gen_workspace, output_folder, model, count):
+from Generalization_Stages import (Stage, RunManifest, RunPlan, parse_run_options,
+                                   input_fingerprint, plan_run, run_stages,
+                                   TRANSPORTATION_FCS, BUILDING_FCS, HYDRO_FCS,
+                                   LANDCOV_FCS, ELEV_FCS)
+from Generalization_Scratch import ScratchManager
+from Generalization_Snapshots import SnapshotStore
+from Generalization_Telemetry import RunTelemetry
+from Generalization_Incremental import IncrementalUpdate, SourceDigests
+
+
+# the generalization models in the order they are run. The theme models
+# declare the feature classes they use so they can run concurrently
+STAGES = [
+    Stage('PrepareData', "Running Prepare Model",
+          'PrepareData_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace', 'aoi_fc', 'vvs']),
+    Stage('Transportation', "Running Transportation Model",
+          'Transportation_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace'],
+          writes=TRANSPORTATION_FCS),
+    Stage('Building', "Running Building Model",
+          'Buildings_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace'],
+          reads=['TransportationGroundCrv'], writes=BUILDING_FCS),
+    Stage('Hydro', "Running Hydrography Model",
+          'Hydro_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace', 'scratch_db'],
+          writes=HYDRO_FCS),
+    Stage('LandCov', "Running Land Cover Model",
+          'LandCov_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace', 'scratch_db'],
+          writes=LANDCOV_FCS),
+    Stage('Elev', "Running Elevation Model",
+          'Elev_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace'],
+          writes=ELEV_FCS),
+    Stage('Symbology', "Running Apply Symbology Model",
+          'ApplySymbology_CTM50KGeneralization',
+          ['gen_workspace', 'product_library', 'vvs']),
+    Stage('ResolveLine', "Running Line Conflicts Model",
+          'ResolveLine_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace']),
+    Stage('ResolveStructure', "Running Structure Conflicts Model",
+          'ResolveStructure_CTM50KGeneralization',
+          ['gen_workspace']),
+    Stage('ResolveHydro', "Running Hydro Conflicts Model",
+          'ResolveHydro_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace']),
+    Stage('ResolveVeg', "Running Vegetation Conflicts Model",
+          'ResolveVeg_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace']),
+]
+
+
+def create_backup(backup, gen_workspace, store, model, count):
+    """ snapshots the workspace into the snapshot store, only the feature
+    classes changed by the model are copied. Use Generalization_Snapshots.py
+    to restore after_<count>_<model>.gdb"""
+    out = None
     if backup == 'true':
         arcpy.AddMessage("Creating Backup")
-        out = output_folder + '\\after_' + str(count) + '_' + model + '.gdb'
-        arcpy.Copy_management(gen_workspace, out)
-    count += 1
-    return count
+        out = store.snapshot(gen_workspace, model, count)
+    return out
 
 def main():
 
     arcpy.env.overwriteOutput = True
 
+    # --resume, --from-stage, --to-stage, --force, --workers, --telemetry,
+    # --memory-budget, --incremental and --tolerance are removed from the
+    # arguments before the tool parameters are read
+    options = parse_run_options(sys.argv)
+
     if arcpy.CheckExtension("Spatial") != "Available":
 
         arcpy.AddError("The Spatial Analyst Extension is not available.")
@@ -54,168 +113,107 @@ def main():
     vvs = arcpy.GetParameterAsText(5)
     backup = arcpy.GetParameterAsText(6)
 
-    count = 0
-
     #input_path = os.path.dirname(input_workspace)
 
-    start_start = datetime.datetime.now().replace(microsecond=0)
-    try:
-        scratch_db_name = 'scratch'
-        scratch_db = output_folder + '\\' + scratch_db_name + '.gdb'
-        if not arcpy.Exists(scratch_db):
-            arcpy.CreateFileGDB_management(output_folder, scratch_db_name)
+    gen_workspace = output_folder + '\\' + output_name + '.gdb'
+    scratch_workspace = 'in_memory'
+    finished = False
+
+    # in_memory or a scratch geodatabase is chosen for each model from the
+    # size of its input
+    scratch = ScratchManager(os.path.join(output_folder, output_name + '_scratch'),
+                             options['memory_budget'])
 
-        if arcpy.Exists(scratch_db):
-            arcpy.AddMessage("Scratch database: " + str(scratch_db))
+    telemetry = RunTelemetry(RunTelemetry.path_for(gen_workspace), options['telemetry'])
 
-        #create the output database
-        arcpy.AddMessage("Creating generalization database")
-        gen_workspace = output_folder + '\\' + output_name + '.gdb'
-        arcpy.Copy_management(input_workspace, gen_workspace)
+    # with --incremental only the area around the source features that
+    # changed since the last run is generalized again
+    incremental = None
+    if options['incremental']:
+        incremental = IncrementalUpdate(input_workspace, gen_workspace, options['tolerance'])
+        if not incremental.available:
+            arcpy.AddWarning("No previous run to update incrementally, starting a full run.")
+            incremental = None
+
+    try:
+        scratch.open()
+
+        if incremental is not None:
+            context = {'toolbox': tbx,
+                       'scratch_workspace': scratch_workspace,
+                       'scratch_db': None,
+                       'product_library': product_library,
+                       'vvs': vvs}
+            if incremental.find_changes():
+                context.update(incremental.prepare(aoi_fc))
+                manifest = RunManifest(RunManifest.path_for(context['gen_workspace']))
+                manifest.reset(None, STAGES)
+                run_stages(STAGES, context, manifest, RunPlan(0, len(STAGES) - 1, True),
+                           workers=options['workers'], telemetry=telemetry, scratch=scratch)
+                started = telemetry.start('Splice', gen_workspace)
+                incremental.splice()
+                telemetry.finish(started)
+                os.remove(manifest.path)
+            incremental.commit()
+            finished = True
+            return
+
+        # the manifest records which stages completed for these inputs
+        fingerprint = input_fingerprint(input_workspace, aoi_fc, product_library, vvs)
+        manifest = RunManifest(RunManifest.path_for(gen_workspace))
+        plan = plan_run(STAGES, manifest, fingerprint, options, gen_workspace)
+
+        if plan.complete:
+            # the stages after --to-stage still need the shared feature classes
+            finished = all(manifest.is_complete(stage.name) for stage in STAGES)
+            return
+
+        if plan.fresh:
+            #create the output database
+            arcpy.AddMessage("Creating generalization database")
+            arcpy.Copy_management(input_workspace, gen_workspace)
+            manifest.reset(fingerprint, STAGES)
+        else:
+            arcpy.AddMessage("Resuming generalization at stage " + STAGES[plan.start].name)
 
         #Creating the Scratch workspace
         #scratch_workspace = arcpy.CreateFileGDB_management(output_folder, "Scratch")
-        scratch_workspace = 'in_memory'
-
-        #Run the prepare script
-        arcpy.AddMessage("Running Prepare Model")
-
-        start = datetime.datetime.now().replace(microsecond=0)
-
-        arcpy.PrepareData_CTM50KGeneralization(gen_workspace, scratch_workspace, aoi_fc, vvs)
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'PrepareData', count)
-
-        #Run the transportation script
-        arcpy.AddMessage("Running Transportation Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.Transportation_CTM50KGeneralization(gen_workspace, scratch_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'Transportation', count)
-
-        #Run the buildings script
-        arcpy.AddMessage("Running Building Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.Buildings_CTM50KGeneralization(gen_workspace, scratch_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'Building', count)
-
-        #Run the hydro script
-        arcpy.AddMessage("Running Hydrography Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.Hydro_CTM50KGeneralization(gen_workspace, scratch_workspace, scratch_db)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'Hydro', count)
-
-        #Run the Land Cover script
-        arcpy.AddMessage("Running Land Cover Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.arcpy.LandCov_CTM50KGeneralization(gen_workspace, scratch_workspace, scratch_db)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'LandCov', count)
-
-        #Run the Elev script
-        arcpy.AddMessage("Running Elevation Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.Elev_CTM50KGeneralization(gen_workspace, scratch_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'Elev', count)
-
-        #Run the Symbology script
-        arcpy.AddMessage("Running Apply Symbology Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.ApplySymbology_CTM50KGeneralization(gen_workspace, product_library, vvs)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'Symbology', count)
-
-        #Run the line conflicts script
-        arcpy.AddMessage("Running Line Conflicts Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.ResolveLine_CTM50KGeneralization(gen_workspace, scratch_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'ResolveLine', count)
-
-        #Run the point conflicts script
-        arcpy.AddMessage("Running Structure Conflicts Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.ResolveStructure_CTM50KGeneralization(gen_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'ResolveStructure', count)
-
-        #Run the hydro conflicts script
-        arcpy.AddMessage("Running Hydro Conflicts Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.ResolveHydro_CTM50KGeneralization(gen_workspace, scratch_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'ResolveHydro', count)
-
-        #Run the veg conflicts script
-        arcpy.AddMessage("Running Vegetation Conflicts Model")
-        start = datetime.datetime.now().replace(microsecond=0)
-        arcpy.ResolveVeg_CTM50KGeneralization(gen_workspace, scratch_workspace)
-        arcpy.AddMessage(arcpy.GetMessages())
-        end = datetime.datetime.now().replace(microsecond=0)
-        arcpy.AddMessage(arcpy.GetMessages())
-        arcpy.AddMessage("Took " + str(end - start))
-
-        count = create_backup(backup, gen_workspace, output_folder, 'ResolveVeg', count)
 
-    finally:
-        if arcpy.Exists(scratch_workspace):
-            try:
-                arcpy.Delete_management(scratch_workspace)
-            except:
-                arcpy.AddWarning("Unable to delete scratch workspace " + str(scratch_workspace))
-        #Clean up the final database
-        if arcpy.Exists(os.path.join(gen_workspace, "AOI_Boundary_line")) == True:
-            arcpy.Delete_management(os.path.join(gen_workspace, "AOI_Boundary_line"))
-        if arcpy.Exists(os.path.join(gen_workspace, "Partition")) == True:
-            arcpy.Delete_management(os.path.join(gen_workspace, "Partition"))
+        context = {'toolbox': tbx,
+                   'gen_workspace': gen_workspace,
+                   'scratch_workspace': scratch_workspace,
+                   # a scratch geodatabase from the pool for the models that use one
+                   'scratch_db': None,
+                   'aoi_fc': aoi_fc,
+                   'product_library': product_library,
+                   'vvs': vvs}
 
-        end_end = datetime.datetime.now().replace(microsecond=0)
+        store = SnapshotStore.for_output(output_folder, output_name)
 
+        def backup_stage(stage, index):
+            return create_backup(backup, gen_workspace, store, stage.name, index)
 
+        def restore_stage(checkpoint, workspace):
+            store.restore(os.path.basename(checkpoint), workspace)
 
-        arcpy.AddMessage("Took Total " + str(end_end - start_start))
+        finished = run_stages(STAGES, context, manifest, plan, backup_stage,
+                              restore_stage, options['workers'], telemetry, scratch)
+
+        # the source of a complete run is the starting point of the next
+        # incremental run
+        if finished and options['incremental']:
+            SourceDigests(SourceDigests.path_for(gen_workspace)).record(input_workspace)
+
+    finally:
+        scratch.close()
+        #Clean up the final database, later stages need these when resuming
+        if finished:
+            if arcpy.Exists(os.path.join(gen_workspace, "AOI_Boundary_line")) == True:
+                arcpy.Delete_management(os.path.join(gen_workspace, "AOI_Boundary_line"))
+            if arcpy.Exists(os.path.join(gen_workspace, "Partition")) == True:
+                arcpy.Delete_management(os.path.join(gen_workspace, "Partition"))
+
+        telemetry.summary()
         arcpy.SetParameter(7, gen_workspace)
     pass
 
@@ -0,0 +1,531 @@
+#-------------------------------------------------------------------------------
+# Name:        compileVVS
+# Purpose:     Compiled, vectorized evaluation of visual specification rules.
+#
+#              The where clause of each rule is parsed once into a small
+#              predicate tree. The attributes a feature class needs are read
+#              into NumPy columns with arcpy.da.FeatureClassToNumPyArray,
+#              every rule is evaluated as a boolean mask in rule order and
+#              the changed features are written back with an update cursor
+#              restricted to their ObjectIDs. Where clauses using SQL that
+#              is not supported here are still evaluated by the database.
+#              Without NumPy the predicates are tested row by row in the
+#              update pass.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import re
+import arcpy
+
+try:
+    import numpy
+    # numpy.isin replaced numpy.in1d, ArcGIS 10.x ships a NumPy without isin
+    _isin = getattr(numpy, 'isin', None) or numpy.in1d
+except ImportError:
+    numpy = None
+
+
+NUMERIC_TYPES = ('OID', 'SmallInteger', 'Integer', 'Single', 'Double')
+STRING_TYPES = ('String', 'GUID', 'GlobalID')
+
+
+class CompileError(Exception):
+    """ raised for SQL the compiler does not support"""
+    pass
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|-?\.\d+)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<op><>|!=|<=|>=|=|<|>)
+    | (?P<punct>[(),])
+    | (?P<name>[A-Za-z_][A-Za-z0-9_.]*|"[^"]+"|\[[^\]]+\])
+    )""", re.VERBOSE)
+
+KEYWORDS = ('AND', 'OR', 'NOT', 'IN', 'IS', 'NULL', 'BETWEEN')
+
+
+def tokenize(where):
+    tokens = []
+    position = 0
+    where = where.strip()
+    while position < len(where):
+        match = _TOKEN.match(where, position)
+        if match is None or match.end() == position:
+            raise CompileError("Unexpected text: " + where[position:])
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'number':
+            value = float(text)
+            if value == int(value) and '.' not in text and 'e' not in text.lower():
+                value = int(text)
+            tokens.append(('literal', value))
+        elif kind == 'string':
+            tokens.append(('literal', text[1:-1].replace("''", "'")))
+        elif kind == 'name':
+            if text[0] in '"[':
+                tokens.append(('field', text[1:-1]))
+            elif text.upper() in KEYWORDS:
+                tokens.append(('keyword', text.upper()))
+            else:
+                tokens.append(('field', text))
+        else:
+            tokens.append((kind, text))
+    return tokens
+
+
+class Compare(object):
+    def __init__(self, field, op, value):
+        self.field, self.op, self.value = field, op, value
+
+    def fields(self):
+        return set([self.field])
+
+    def evaluate(self, columns):
+        values, nulls = columns.column(self.field, self.value)
+        if self.op == '=':
+            match = values == self.value
+        elif self.op in ('<>', '!='):
+            match = values != self.value
+        elif self.op == '<':
+            match = values < self.value
+        elif self.op == '>':
+            match = values > self.value
+        elif self.op == '<=':
+            match = values <= self.value
+        else:
+            match = values >= self.value
+        match = numpy.asarray(match, dtype=bool)
+        return match & ~nulls, ~match & ~nulls
+
+    def test(self, row):
+        value = row[self.field.upper()]
+        if value is None:
+            return None
+        if self.op == '=':
+            return value == self.value
+        if self.op in ('<>', '!='):
+            return value != self.value
+        if self.op == '<':
+            return value < self.value
+        if self.op == '>':
+            return value > self.value
+        if self.op == '<=':
+            return value <= self.value
+        return value >= self.value
+
+
+class In(object):
+    def __init__(self, field, values, negate):
+        self.field = field
+        self.values = [value for value in values if value is not None]
+        self.has_null = len(self.values) != len(values)
+        self.negate = negate
+
+    def fields(self):
+        return set([self.field])
+
+    def evaluate(self, columns):
+        sample = self.values[0] if self.values else None
+        values, nulls = columns.column(self.field, sample)
+        if self.values:
+            found = numpy.asarray(_isin(values, numpy.array(self.values, dtype=values.dtype)),
+                                  dtype=bool)
+        else:
+            found = numpy.zeros(len(values), dtype=bool)
+        true = found & ~nulls
+        # x IN (..., NULL) is unknown rather than false when x is not listed
+        if self.has_null:
+            false = numpy.zeros(len(values), dtype=bool)
+        else:
+            false = ~found & ~nulls
+        if self.negate:
+            return false, true
+        return true, false
+
+    def test(self, row):
+        value = row[self.field.upper()]
+        if value is None:
+            return None
+        if value in self.values:
+            return not self.negate
+        if self.has_null:
+            return None
+        return self.negate
+
+
+class Between(object):
+    def __init__(self, field, low, high, negate):
+        self.field, self.low, self.high, self.negate = field, low, high, negate
+
+    def fields(self):
+        return set([self.field])
+
+    def evaluate(self, columns):
+        values, nulls = columns.column(self.field, self.low)
+        match = numpy.asarray((values >= self.low) & (values <= self.high), dtype=bool)
+        true, false = match & ~nulls, ~match & ~nulls
+        if self.negate:
+            return false, true
+        return true, false
+
+    def test(self, row):
+        value = row[self.field.upper()]
+        if value is None:
+            return None
+        return (self.low <= value <= self.high) != self.negate
+
+
+class IsNull(object):
+    def __init__(self, field, negate):
+        self.field, self.negate = field, negate
+
+    def fields(self):
+        return set([self.field])
+
+    def evaluate(self, columns):
+        values, nulls = columns.column(self.field, None)
+        if self.negate:
+            return ~nulls, nulls.copy()
+        return nulls.copy(), ~nulls
+
+    def test(self, row):
+        return (row[self.field.upper()] is None) != self.negate
+
+
+class Not(object):
+    def __init__(self, item):
+        self.item = item
+
+    def fields(self):
+        return self.item.fields()
+
+    def evaluate(self, columns):
+        true, false = self.item.evaluate(columns)
+        return false, true
+
+    def test(self, row):
+        result = self.item.test(row)
+        return None if result is None else not result
+
+
+class And(object):
+    def __init__(self, items):
+        self.items = items
+
+    def fields(self):
+        return set().union(*[item.fields() for item in self.items])
+
+    def evaluate(self, columns):
+        true, false = self.items[0].evaluate(columns)
+        for item in self.items[1:]:
+            item_true, item_false = item.evaluate(columns)
+            true = true & item_true
+            false = false | item_false
+        return true, false
+
+    def test(self, row):
+        results = [item.test(row) for item in self.items]
+        if False in results:
+            return False
+        return None if None in results else True
+
+
+class Or(And):
+    def evaluate(self, columns):
+        true, false = self.items[0].evaluate(columns)
+        for item in self.items[1:]:
+            item_true, item_false = item.evaluate(columns)
+            true = true | item_true
+            false = false & item_false
+        return true, false
+
+    def test(self, row):
+        results = [item.test(row) for item in self.items]
+        if True in results:
+            return True
+        return None if None in results else False
+
+
+class _Parser(object):
+    """ recursive descent parser for the where clauses used in visual
+    specifications: comparisons of a field with a literal, IN, BETWEEN,
+    IS NULL, AND, OR, NOT and parentheses"""
+
+    def __init__(self, where):
+        self.tokens = tokenize(where)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, kind=None, text=None):
+        token = self.peek()
+        if (kind and token[0] != kind) or (text and token[1] != text):
+            raise CompileError("Expected " + str(text or kind) + " found " + str(token[1]))
+        self.position += 1
+        return token
+
+    def accept(self, kind, text):
+        if self.peek() == (kind, text):
+            self.position += 1
+            return True
+        return False
+
+    def parse(self):
+        if not self.tokens:
+            raise CompileError("Empty where clause")
+        node = self.parse_or()
+        if self.position != len(self.tokens):
+            raise CompileError("Unexpected " + str(self.peek()[1]))
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.accept('keyword', 'OR'):
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else Or(items)
+
+    def parse_and(self):
+        items = [self.parse_not()]
+        while self.accept('keyword', 'AND'):
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else And(items)
+
+    def parse_not(self):
+        if self.accept('keyword', 'NOT'):
+            return Not(self.parse_not())
+        if self.accept('punct', '('):
+            node = self.parse_or()
+            self.take('punct', ')')
+            return node
+        return self.parse_predicate()
+
+    def literal(self):
+        if self.accept('keyword', 'NULL'):
+            return None
+        return self.take('literal')[1]
+
+    def parse_predicate(self):
+        kind, value = self.peek()
+        if kind == 'literal':
+            # 5 = FIELD is turned around to FIELD = 5
+            self.position += 1
+            op = self.take('op')[1]
+            field = self.take('field')[1]
+            flipped = {'<': '>', '>': '<', '<=': '>=', '>=': '<='}.get(op, op)
+            return Compare(field, flipped, value)
+
+        field = self.take('field')[1]
+        kind, text = self.peek()
+        if kind == 'op':
+            self.position += 1
+            if self.peek()[0] != 'literal':
+                raise CompileError("Only comparisons with a literal value are supported")
+            return Compare(field, text, self.take('literal')[1])
+        if self.accept('keyword', 'IS'):
+            negate = self.accept('keyword', 'NOT')
+            self.take('keyword', 'NULL')
+            return IsNull(field, negate)
+        negate = self.accept('keyword', 'NOT')
+        if self.accept('keyword', 'IN'):
+            self.take('punct', '(')
+            values = [self.literal()]
+            while self.accept('punct', ','):
+                values.append(self.literal())
+            self.take('punct', ')')
+            return In(field, values, negate)
+        if self.accept('keyword', 'BETWEEN'):
+            low = self.take('literal')[1]
+            self.take('keyword', 'AND')
+            high = self.take('literal')[1]
+            return Between(field, low, high, negate)
+        raise CompileError("Unsupported SQL near " + str(text))
+
+
+def compile_where(where):
+    """ returns the predicate tree for a where clause, raises CompileError
+    when the clause uses SQL that is not supported"""
+    return _Parser(where).parse()
+
+
+def try_compile(where):
+    try:
+        return compile_where(where)
+    except CompileError:
+        return None
+
+
+# stand-ins for nulls when a feature class is read into NumPy, a field
+# holding one is checked for nulls with the database
+NULL_VALUES = {'SmallInteger': -32768, 'Integer': -2147483648, 'Single': float('nan'),
+               'Double': float('nan'), 'String': u'\x00', 'GUID': u'\x00'}
+
+
+class Columns(object):
+    """ the attributes of a feature class as NumPy arrays, one per field,
+    each with a mask of the null values"""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    @classmethod
+    def read(cls, table, names, field_types, field_names, unchecked=()):
+        """ reads the fields, upper case names, of a feature class or table
+        with arcpy.da in one pass. Returns the ObjectIDs and the columns.
+        The stand-ins for nulls in the unchecked fields are taken to be
+        nulls without asking the database"""
+        null_value = {}
+        for name in names:
+            if field_types[name] in NULL_VALUES:
+                null_value[field_names[name]] = NULL_VALUES[field_types[name]]
+        fields = ['OID@'] + [field_names[name] for name in names]
+        if hasattr(arcpy.Describe(table), 'shapeType'):
+            array = arcpy.da.FeatureClassToNumPyArray(table, fields, null_value=null_value)
+        else:
+            array = arcpy.da.TableToNumPyArray(table, fields, null_value=null_value)
+        oids = array['OID@']
+        arrays = {}
+        for name in names:
+            values = array[field_names[name]]
+            if field_types[name] in NUMERIC_TYPES:
+                values = values.astype(numpy.float64)
+            else:
+                values = values.astype(object)
+            nulls = numpy.zeros(len(values), dtype=bool)
+            if field_names[name] in null_value:
+                stand_in = null_value[field_names[name]]
+                if stand_in != stand_in:
+                    possible = numpy.isnan(values)
+                else:
+                    possible = values == stand_in
+                possible = numpy.asarray(possible, dtype=bool)
+                if name in unchecked:
+                    nulls = possible
+                    values[nulls] = 0 if field_types[name] in NUMERIC_TYPES else u''
+                elif possible.any():
+                    # the stand-in may also be a real value
+                    where = arcpy.AddFieldDelimiters(table, field_names[name]) + " IS NULL"
+                    with arcpy.da.SearchCursor(table, ['OID@'], where) as cursor:
+                        null_oids = [row[0] for row in cursor]
+                    nulls = numpy.asarray(_isin(oids, numpy.array(null_oids, dtype=oids.dtype)),
+                                          dtype=bool)
+                    values[nulls] = 0 if field_types[name] in NUMERIC_TYPES else u''
+            arrays[name] = (values, nulls)
+        return oids, cls(arrays)
+
+    def column(self, name, sample):
+        """ returns the values and null mask of a field, check_types has
+        made sure sample has the type of the field"""
+        return self.arrays[name.upper()]
+
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_types(node, types):
+    """ makes sure every field exists and is compared with values of the
+    same kind, the database would convert mixed types"""
+    if isinstance(node, (And, Or)):
+        for item in node.items:
+            check_types(item, types)
+        return
+    if isinstance(node, Not):
+        check_types(node.item, types)
+        return
+    key = node.field.upper()
+    if key not in types:
+        raise CompileError("Unknown field " + node.field)
+    if types[key] not in NUMERIC_TYPES + STRING_TYPES:
+        raise CompileError("Unsupported field type for " + node.field)
+    if isinstance(node, Compare):
+        values = [node.value]
+    elif isinstance(node, In):
+        values = node.values
+    elif isinstance(node, Between):
+        values = [node.low, node.high]
+    else:
+        values = []
+    numeric = types[key] in NUMERIC_TYPES
+    for value in values:
+        if _numeric(value) != numeric:
+            raise CompileError("Type mismatch for " + node.field)
+
+
+def prepare_rules(update_fc, rules, field):
+    """ checks the compiled where clauses against the fields of the feature
+    class. Returns the rules as (where, value, predicate), with predicate
+    None where it cannot be evaluated here, the upper case names of the
+    fields the predicates read, the target field first, and a dictionary
+    of the field types by upper case name and one of the field names"""
+    field_types = {}
+    field_names = {}
+    for f in arcpy.ListFields(update_fc):
+        field_types[f.name.upper()] = f.type
+        field_names[f.name.upper()] = f.name
+
+    predicates = []
+    needed = set()
+    for where, value, predicate in rules:
+        if predicate is not None:
+            try:
+                check_types(predicate, field_types)
+                needed |= set(name.upper() for name in predicate.fields())
+            except CompileError:
+                predicate = None
+        predicates.append((where, value, predicate))
+
+    target = field.upper()
+    needed.discard(target)
+    return predicates, [target] + sorted(needed), field_types, field_names
+
+
+def apply_rules_compiled(update_fc, rules, field):
+    """ applies all the rules for a feature class using NumPy masks.
+
+    rules is a list of (where, value, predicate) where predicate is None for
+    where clauses that could not be compiled, those are evaluated by the
+    database. Returns the number of features matched, scanned and updated"""
+    predicates, names, field_types, field_names = prepare_rules(update_fc, rules, field)
+    target = names[0]
+    # a target field holding the stand-in is written like a null one
+    oids, columns = Columns.read(update_fc, names, field_types, field_names, (target,))
+    scanned = len(oids)
+    if not scanned:
+        return 0, 0, 0
+
+    current, current_nulls = columns.arrays[target]
+    result = current.copy()
+    assigned = numpy.zeros(len(oids), dtype=bool)
+    for where, value, predicate in predicates:
+        if predicate is not None:
+            mask = predicate.evaluate(columns)[0]
+        else:
+            with arcpy.da.SearchCursor(update_fc, ['OID@'], where or None) as cursor:
+                matched = [row[0] for row in cursor]
+            mask = _isin(oids, numpy.array(matched, dtype=oids.dtype))
+        result[mask] = value
+        assigned |= mask
+
+    changed = assigned & (current_nulls | (result != current))
+    updates = dict(zip(oids[changed].tolist(), result[changed].tolist()))
+    if updates:
+        # only the features that change are read again, the where clause
+        # is built in chunks to keep it within the size the database accepts
+        oid_field = arcpy.AddFieldDelimiters(update_fc, arcpy.Describe(update_fc).OIDFieldName)
+        changed_oids = sorted(updates)
+        for start in range(0, len(changed_oids), 1000):
+            chunk = changed_oids[start:start + 1000]
+            where = oid_field + " IN (" + ", ".join(str(oid) for oid in chunk) + ")"
+            with arcpy.da.UpdateCursor(update_fc, ['OID@', field], where) as cursor:
+                for row in cursor:
+                    row[1] = int(updates[row[0]])
+                    cursor.updateRow(row)
+
+    return int(assigned.sum()), scanned, len(updates)
@@ -8,8 +8,24 @@
 # Copyright:   (c) ambe3073 2016
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
-from xml.dom import minidom
+import os
+import re
+import json
+import hashlib
+from collections import OrderedDict, namedtuple
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 import arcpy
+import compileVVS
+
+# bump when the cached rule format changes
+CACHE_VERSION = 2
+HASH_BLOCK = 1024 * 1024
+GENERATE = re.compile(r'Generate\s*=\s*(-?\d+)')
+
+VVSRule = namedtuple('VVSRule', ['feature_class', 'where', 'expression', 'value'])
 
 def get_fcs(workspace):
     print("Getting Feature Classes from Workspace")
@@ -35,54 +51,217 @@ def check_field(fc_class, field):
         arcpy.AddField_management(fc_class, field, "Long")
 
 
+def _local_name(tag):
+    """ strips the namespace from an element tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(element, name):
+    """ returns the text of the first descendant with the given name, or
+    None when the element does not have one"""
+    for child in element.iter():
+        if child is not element and _local_name(child.tag) == name:
+            return child.text or ''
+    return None
+
+
+def _generate_value(expression):
+    """ returns the value assigned to Generate in a rule expression"""
+    match = GENERATE.search(expression or '')
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def iter_rules(xml_file):
+    """ yields a VVSRule for every rule in the visual specification, in the
+    order they are listed. The file is read incrementally and each rule is
+    discarded once it has been yielded, so the document is never held in
+    memory as a whole"""
+    root = None
+    for event, element in ElementTree.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
+        if _local_name(element.tag) != 'PSRule':
+            continue
+
+        fc = _child_text(element, 'FeatureClass')
+        expression = _child_text(element, 'Expression')
+        where = _child_text(element, 'WhereClause')
+        value = _generate_value(expression)
+        element.clear()
+        root.clear()
+
+        if not fc or value is None:
+            arcpy.AddWarning("Skipping rule without a feature class or "
+                             "Generate value: " + str(fc))
+            continue
+        yield VVSRule(fc, (where or '').strip(), expression, value)
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as data:
+        block = data.read(HASH_BLOCK)
+        while block:
+            digest.update(block)
+            block = data.read(HASH_BLOCK)
+    return digest.hexdigest()
+
+
+def cache_folder():
+    """ the folder holding parsed rule sets, CTM_VVS_CACHE overrides the
+    default folder in the profile of the user"""
+    return os.environ.get('CTM_VVS_CACHE') or \
+        os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'),
+                     'CTM', 'vvs_cache')
+
+
+def _compile_rules(parsed):
+    return [(fc, where, value, compileVVS.try_compile(where) if where else None)
+            for fc, where, value in parsed]
+
+
+def read_rules(xml_file, folder=None):
+    """ returns the (feature class, where clause, value, predicate) of every
+    rule in the visual specification, in the order they are listed.
+    predicate is the compiled where clause, or None when it cannot be
+    compiled.
+
+    The rules are cached on disk as JSON keyed by the content of the file,
+    so jobs that use the same specification only parse it once. The where
+    clauses are compiled again when the cache is read"""
+    folder = folder or cache_folder()
+    cache_path = os.path.join(folder, _file_hash(xml_file) + '_' +
+                              str(CACHE_VERSION) + '.json')
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as cache_file:
+                parsed = [(fc, where, value) for fc, where, value in json.load(cache_file)]
+            arcpy.AddMessage("Read " + str(len(parsed)) + " rules from " + cache_path)
+            return _compile_rules(parsed)
+        except (ValueError, TypeError):
+            arcpy.AddWarning("Ignoring unreadable rule cache " + cache_path)
+
+    parsed = [(rule.feature_class, rule.where, rule.value) for rule in iter_rules(xml_file)]
+    rules = _compile_rules(parsed)
+
+    # several jobs may write the same cache, each writes its own temporary
+    # file and the rename is skipped when another job got there first
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        temp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'w') as cache_file:
+            json.dump(parsed, cache_file)
+        if os.path.exists(cache_path):
+            os.remove(temp_path)
+        else:
+            os.rename(temp_path, cache_path)
+    except (IOError, OSError) as ex:
+        arcpy.AddWarning("Unable to cache rules in " + folder + ": " + str(ex))
+    return rules
+
+
+def group_rules(rules):
+    """ groups the rules by feature class, keeping the order of the rules
+    for each feature class"""
+    grouped = OrderedDict()
+    for fc, where, value, predicate in rules:
+        grouped.setdefault(fc, []).append((where, value, predicate))
+    return grouped
+
+
+def apply_rules(update_fc, rules, field):
+    """ applies all the rules for a feature class with a single update pass.
+
+    The compiled where clauses are tested on the attributes read by the
+    update cursor. Where clauses that cannot be compiled are evaluated by
+    the database first, with cursors that only read the ObjectID. When
+    several rules match a feature the last one wins, as it did when every
+    rule was applied with its own update cursor. Only features whose value
+    changes are written"""
+    predicates, names, field_types, field_names = \
+        compileVVS.prepare_rules(update_fc, rules, field)
+
+    # the features matched by the where clauses the database evaluates
+    database = {}
+    for index, (where, value, predicate) in enumerate(predicates):
+        if predicate is None and where:
+            with arcpy.da.SearchCursor(update_fc, ['OID@'], where) as cursor:
+                database[index] = set(row[0] for row in cursor)
+
+    # a rule without a where clause applies to every feature
+    if all(rule[0] for rule in rules):
+        where = " OR ".join("(" + rule[0] + ")" for rule in rules)
+    else:
+        where = None
+
+    matched = 0
+    scanned = 0
+    updated = 0
+    cursor_fields = ['OID@'] + [field_names[name] for name in names]
+    with arcpy.da.UpdateCursor(update_fc, cursor_fields, where) as cursor:
+        for row in cursor:
+            scanned += 1
+            values = dict(zip(names, row[1:]))
+            new_value = None
+            for index, (rule_where, value, predicate) in enumerate(predicates):
+                if predicate is not None:
+                    hit = predicate.test(values)
+                elif rule_where:
+                    hit = row[0] in database[index]
+                else:
+                    hit = True
+                if hit:
+                    new_value = value
+            if new_value is None:
+                continue
+            matched += 1
+            if row[1] != new_value:
+                row[1] = new_value
+                cursor.updateRow(row)
+                updated += 1
+
+    return matched, scanned, updated
+
+
 def main():
     xml_file = arcpy.GetParameterAsText(1)
     input_workspace = arcpy.GetParameterAsText(0)
     field =  arcpy.GetParameterAsText(2)
-    checked = []
+    # the optional fourth parameter turns the compiled mode off with 'false'
+    compiled = True
+    if arcpy.GetArgumentCount() > 3:
+        compiled = arcpy.GetParameterAsText(3).lower() not in ('false', 'cursor')
+    if compiled and compileVVS.numpy is None:
+        arcpy.AddWarning("NumPy is not available, applying the rules with cursors.")
+        compiled = False
 
     fcs = get_fcs(input_workspace)
 
-    xmldoc = minidom.parse(xml_file)
-    value_list = xmldoc.getElementsByTagName('Expression')
-    fc_list = xmldoc.getElementsByTagName('FeatureClass')
-    where_list = xmldoc.getElementsByTagName('WhereClause')
-
-##    print(len(value_list))
-##    print(len(fc_list))
-##    print(len(where_list))
-
-    for index, fc_item in enumerate(fc_list):
-        fc = fc_item.firstChild.data
-        where_item = where_list[index]
-        where = where_item.firstChild.data
-        value_item = value_list[index]
-        value_str = value_item.firstChild.data
-        string_list = str(value_str).split("Generate = ")
-        value = string_list[1][:1]
-        value = int(value)
-
-        if fc in fcs:
-            update_fc = fcs[str(fc)]
-            print update_fc
-            if update_fc not in checked:
-                check_field(update_fc, field)
-                checked.append(update_fc)
-            print("updating " + str(fc) + " where " + str(where) )
-            up_cnt = 0
-            with arcpy.da.UpdateCursor(update_fc, '*', where) as cursor:
-                cfields = cursor.fields
-                field_ind = 0
-                for index, item in enumerate(cfields):
-                    if item == field:
-                        field_ind = index
-                if field_ind >= 0:
-                    for row in cursor:
-                        row[field_ind] = value
-                        cursor.updateRow(row)
-                        up_cnt += 1
-
-            arcpy.AddMessage(str(up_cnt) + " features updated in " + str(fc) + " where " + str(where))
+    # each where clause is compiled once when the rules are read, rules that
+    # cannot be compiled are evaluated by the database
+    rules = group_rules(read_rules(xml_file))
+
+    for fc, fc_rules in rules.items():
+        if fc not in fcs:
+            continue
+        update_fc = fcs[str(fc)]
+        print(update_fc)
+        check_field(update_fc, field)
+        print("updating " + str(fc) + " with " + str(len(fc_rules)) + " rules")
+
+        if compiled:
+            matched, scanned, updated = compileVVS.apply_rules_compiled(update_fc, fc_rules, field)
+        else:
+            matched, scanned, updated = apply_rules(update_fc, fc_rules, field)
+
+        arcpy.AddMessage(str(fc) + ": " + str(len(fc_rules)) + " rules, " +
+                         str(scanned) + " features scanned, " + str(matched) +
+                         " matched, " + str(updated) + " updated")
 
 
     pass
@@ -91,7 +270,3 @@ if __name__ == '__main__':
     main()
 
 
-##print(itemlist[0].attributes['name'].value)
-##for s in itemlist:
-##    print(s.attributes['Generate'].value)
-
@@ -0,0 +1,927 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Coordinator
+# Purpose:     Generalizes a large area of interest as tiles on several
+#              workers.
+#
+#              The plan step counts the source features on a grid over the
+#              area of interest and splits it as a quadtree until no tile
+#              holds more than a number of features, so dense urban areas get
+#              small tiles and empty areas large ones. The tiles are put in a
+#              tile queue shared by the worker nodes. Every worker leases the
+#              largest waiting tile, copies the source features within a
+#              tolerance around it, runs the generalization models on them
+#              and reports the tile geodatabase back to the queue.
+#
+#              A lease is kept alive by a heartbeat while the models run. The
+#              tile of a worker that stopped is offered again once its lease
+#              expires, and a tile that runs much longer than the tiles
+#              finished so far is offered to a second worker, the first to
+#              finish is kept. Tiles that fail are retried up to a number of
+#              attempts.
+#
+#              The merge step splits the lines of every tile at its edge and
+#              keeps the features whose center is in the tile. The tiles are
+#              generalized separately, so the pieces of a feature do not
+#              quite meet at a seam: the features near the seams are snapped
+#              to each other, then the line pieces and polygon parts with the
+#              same attributes are merged across the seams.
+#
+#              Two queues are provided. A SQLite file on a local disk serves
+#              workers on the same host, SQLite locking is not reliable on
+#              network shares (SMB, NFS) so it refuses UNC paths. A folder on
+#              a share, named with the folder: prefix, serves workers on
+#              several machines: it is locked by creating a directory and
+#              its state is replaced by a rename, both atomic on a share. The
+#              clocks of the machines have to agree, leases expire by them.
+#
+#                  python Generalization_Coordinator.py plan D:\gen\tiles.sqlite
+#                      <input gdb> <aoi fc> D:\gen\tiles <product library> <vvs>
+#                  python Generalization_Coordinator.py work D:\gen\tiles.sqlite
+#                  python Generalization_Coordinator.py status D:\gen\tiles.sqlite
+#                  python Generalization_Coordinator.py merge D:\gen\tiles.sqlite <output gdb>
+#
+#                  python Generalization_Coordinator.py plan folder:\\server\gen\queue
+#                      <input gdb> <aoi fc> \\server\gen\tiles <product library> <vvs>
+#                  python Generalization_Coordinator.py work folder:\\server\gen\queue
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import abc
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import argparse
+import threading
+import arcpy
+from Generalization_Edges import split_at_boundary, project
+from Generalization_Incremental import (MODEL_TOLERANCE, linear_unit,
+                                        feature_classes, extract_area, rejoin_pieces)
+from Generalization_Stages import SHARED_FCS, RunManifest, RunPlan, run_stages
+from Generalization_Scratch import ScratchManager
+from Generalization_Telemetry import RunTelemetry
+
+
+# the most source features in a tile, tiles are split until they hold fewer
+MAX_FEATURES = 50000
+
+# cells on each side of the grid the features are counted on, the smallest
+# tile is one cell
+GRID_SIZE = 256
+
+# seconds a lease lasts without a heartbeat
+LEASE_SECONDS = 900
+
+# a tile running this many times longer than expected from the tiles
+# finished so far is offered to another worker
+SLOW_FACTOR = 3.0
+
+# finished tiles needed before the expected time of a tile is trusted
+SLOW_MIN_DONE = 3
+
+MAX_ATTEMPTS = 3
+
+POLL_SECONDS = 30
+
+# the distance within which the features on both sides of a seam are
+# snapped together when the tiles are merged
+SEAM_SNAP = "2 Meters"
+
+TILE_AREA_FC = 'Tile_Area'
+TILE_CONTEXT_FC = 'Tile_Context'
+TILE_AOI_FC = 'Tile_AOI'
+TILE_FCS = (TILE_AREA_FC, TILE_CONTEXT_FC, TILE_AOI_FC)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class DensityGrid(object):
+    """ the number of features in the cells of a grid over an extent, with
+    the counts summed so the features in any block of cells are counted in
+    constant time"""
+
+    def __init__(self, extent, size=GRID_SIZE):
+        self.xmin, self.ymin, self.xmax, self.ymax = extent
+        self.size = size
+        self.width = float(self.xmax - self.xmin) or 1.0
+        self.height = float(self.ymax - self.ymin) or 1.0
+        self.cells = [[0] * size for row in range(size)]
+        self.sums = None
+
+    def add(self, x, y):
+        if x < self.xmin or x > self.xmax or y < self.ymin or y > self.ymax:
+            return
+        column = min(self.size - 1, int((x - self.xmin) / self.width * self.size))
+        row = min(self.size - 1, int((y - self.ymin) / self.height * self.size))
+        self.cells[row][column] += 1
+        self.sums = None
+
+    def _summed(self):
+        sums = [[0] * (self.size + 1) for row in range(self.size + 1)]
+        for row in range(self.size):
+            total = 0
+            above = sums[row]
+            current = sums[row + 1]
+            cells = self.cells[row]
+            for column in range(self.size):
+                total += cells[column]
+                current[column + 1] = above[column + 1] + total
+        return sums
+
+    def count(self, column0, row0, column1, row1):
+        """ the features in the cells from column0, row0 up to but not
+        including column1, row1"""
+        if self.sums is None:
+            self.sums = self._summed()
+        sums = self.sums
+        return (sums[row1][column1] - sums[row0][column1] -
+                sums[row1][column0] + sums[row0][column0])
+
+    def extent(self, column0, row0, column1, row1):
+        return (self.xmin + self.width * column0 / self.size,
+                self.ymin + self.height * row0 / self.size,
+                self.xmin + self.width * column1 / self.size,
+                self.ymin + self.height * row1 / self.size)
+
+    def split(self, max_features):
+        """ splits the grid as a quadtree until every block holds at most
+        max_features or is a single cell. Returns [(extent, count)]"""
+        blocks = []
+        todo = [(0, 0, self.size, self.size)]
+        while todo:
+            column0, row0, column1, row1 = todo.pop()
+            count = self.count(column0, row0, column1, row1)
+            if not count:
+                # empty blocks still need a tile when they are in the aoi,
+                # they are cheap so they are not split further
+                blocks.append((self.extent(column0, row0, column1, row1), 0))
+                continue
+            if count <= max_features or (column1 - column0 <= 1 and row1 - row0 <= 1):
+                blocks.append((self.extent(column0, row0, column1, row1), count))
+                continue
+            middle_column = (column0 + column1 + 1) // 2
+            middle_row = (row0 + row1 + 1) // 2
+            for block in ((column0, row0, middle_column, middle_row),
+                          (middle_column, row0, column1, middle_row),
+                          (column0, middle_row, middle_column, row1),
+                          (middle_column, middle_row, column1, row1)):
+                if block[2] > block[0] and block[3] > block[1]:
+                    todo.append(block)
+        return blocks
+
+
+def _rectangle(extent, spatial_reference):
+    xmin, ymin, xmax, ymax = extent
+    array = arcpy.Array([arcpy.Point(xmin, ymin), arcpy.Point(xmin, ymax),
+                         arcpy.Point(xmax, ymax), arcpy.Point(xmax, ymin),
+                         arcpy.Point(xmin, ymin)])
+    return arcpy.Polygon(array, spatial_reference)
+
+
+def plan_tiles(input_workspace, aoi_fc, max_features=MAX_FEATURES, grid_size=GRID_SIZE):
+    """ tiles the area of interest by the density of the source features.
+    Returns [(polygon, count)] in the spatial reference of the source"""
+    fcs = sorted(feature_classes(input_workspace).values())
+    if not fcs:
+        arcpy.AddError("No feature classes in " + str(input_workspace))
+        raise arcpy.ExecuteError
+    spatial_reference = arcpy.Describe(fcs[0]).spatialReference
+
+    aoi = None
+    with arcpy.da.SearchCursor(aoi_fc, ['SHAPE@'], spatial_reference=spatial_reference) as cursor:
+        for row in cursor:
+            if row[0] is not None:
+                aoi = row[0] if aoi is None else aoi.union(row[0])
+    if aoi is None:
+        arcpy.AddError("The area of interest " + str(aoi_fc) + " is empty")
+        raise arcpy.ExecuteError
+
+    extent = aoi.extent
+    grid = DensityGrid((extent.XMin, extent.YMin, extent.XMax, extent.YMax), grid_size)
+    arcpy.AddMessage("Counting the source features of " + str(len(fcs)) + " feature classes")
+    for fc in fcs:
+        with arcpy.da.SearchCursor(fc, ['SHAPE@XY'], spatial_reference=spatial_reference) as cursor:
+            for row in cursor:
+                if row[0] is not None and row[0][0] is not None:
+                    grid.add(row[0][0], row[0][1])
+
+    tiles = []
+    for block, count in grid.split(max_features):
+        polygon = _rectangle(block, spatial_reference).intersect(aoi, 4)
+        if polygon is not None and polygon.area > 0:
+            tiles.append((polygon, count))
+    tiles.sort(key=lambda tile: -tile[1])
+    return tiles
+
+
+class TileQueue(object):
+    """ the tiles of a run and their state, shared by the coordinator and
+    the worker nodes. Every method may be called from any node"""
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def create(self, settings, tiles):
+        """ starts a run with its settings and [(geometry json, count)]"""
+
+    @abc.abstractmethod
+    def settings(self):
+        """ the settings of the run"""
+
+    @abc.abstractmethod
+    def lease(self, worker, lease_seconds=LEASE_SECONDS):
+        """ the next tile for a worker as a dict, or None"""
+
+    @abc.abstractmethod
+    def heartbeat(self, tile_id, worker, lease_seconds=LEASE_SECONDS):
+        """ extends a lease, False when the tile went to another worker"""
+
+    @abc.abstractmethod
+    def complete(self, tile_id, worker, output, seconds):
+        """ records the output of a tile, False when another worker
+        completed it first"""
+
+    @abc.abstractmethod
+    def fail(self, tile_id, worker, error):
+        """ offers a tile again, or fails it after the last attempt"""
+
+    @abc.abstractmethod
+    def tiles(self, status=None):
+        """ the tiles as dicts, with the given status only"""
+
+    @abc.abstractmethod
+    def counts(self):
+        """ the number of tiles by status"""
+
+
+def _slow_rate(tiles):
+    """ seconds per source feature of the finished tiles, None until
+    enough tiles finished"""
+    rows = [tile for tile in tiles if tile['status'] == DONE and tile['seconds'] is not None]
+    if len(rows) < SLOW_MIN_DONE:
+        return None
+    rates = sorted(row['seconds'] / max(1, row['features']) for row in rows)
+    return rates[len(rates) // 2]
+
+
+def _next_tile(tiles, worker, now, lease_seconds, max_attempts):
+    """ the tile a worker leases next: the largest waiting tile, or a tile
+    whose lease expired or that runs much longer than expected. Returns the
+    tile and the ids of the tiles out of attempts"""
+    rate = _slow_rate(tiles)
+    exhausted = []
+    waiting = [tile for tile in tiles if tile['status'] in (PENDING, LEASED)]
+    for tile in sorted(waiting, key=lambda tile: (-tile['features'], tile['id'])):
+        if tile['status'] == LEASED:
+            if tile['worker'] == worker:
+                continue
+            expired = tile['lease_expires'] < now
+            slow = (rate is not None and now - tile['started'] >
+                    SLOW_FACTOR * rate * max(1, tile['features']) + lease_seconds / 10.0)
+            if not expired and not slow:
+                continue
+        if tile['attempts'] >= max_attempts:
+            if tile['status'] == PENDING or tile['lease_expires'] < now:
+                exhausted.append(tile['id'])
+            continue
+        return tile, exhausted
+    return None, exhausted
+
+
+class SQLiteTileQueue(TileQueue):
+    """ a tile queue in a SQLite database. Every call opens its own
+    connection so the queue can be used from any thread or process, leases
+    are taken in an immediate transaction so two workers never take the same
+    waiting tile. The database has to be on a local disk, the workers
+    sharing it run on one host"""
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        if str(path).startswith(('\\\\', '//')):
+            arcpy.AddError("The SQLite tile queue has to be on a local disk, SQLite "
+                           "locking is not reliable on network shares: " + str(path) +
+                           ". Use a folder: queue for workers on several machines.")
+            raise arcpy.ExecuteError
+        self.path = os.path.abspath(path)
+        self.max_attempts = max_attempts
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create(self, settings, tiles):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("CREATE TABLE settings (name TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE tiles (id INTEGER PRIMARY KEY, geometry TEXT, "
+                               "features INTEGER, status TEXT, worker TEXT, started REAL, "
+                               "lease_expires REAL, attempts INTEGER, output TEXT, "
+                               "error TEXT, seconds REAL)")
+            connection.executemany("INSERT INTO settings VALUES (?, ?)",
+                                   [(name, json.dumps(value)) for name, value in settings.items()])
+            connection.executemany("INSERT INTO tiles (geometry, features, status, attempts) "
+                                   "VALUES (?, ?, ?, 0)",
+                                   [(geometry, count, PENDING) for geometry, count in tiles])
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def settings(self):
+        connection = self._connect()
+        try:
+            return dict((row['name'], json.loads(row['value']))
+                        for row in connection.execute("SELECT name, value FROM settings"))
+        finally:
+            connection.close()
+
+    def lease(self, worker, lease_seconds=LEASE_SECONDS):
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            rows = connection.execute("SELECT id, features, status, worker, started, "
+                                      "lease_expires, attempts, seconds FROM tiles "
+                                      "WHERE status IN (?, ?, ?)", (PENDING, LEASED, DONE))
+            tile, exhausted = _next_tile([dict(zip(row.keys(), row)) for row in rows], worker,
+                                         now, lease_seconds, self.max_attempts)
+            for tile_id in exhausted:
+                connection.execute("UPDATE tiles SET status = ?, error = "
+                                   "COALESCE(error, 'The lease expired') WHERE id = ?",
+                                   (FAILED, tile_id))
+            if tile is not None:
+                tile = connection.execute("SELECT * FROM tiles WHERE id = ?",
+                                          (tile['id'],)).fetchone()
+            if tile is None:
+                connection.execute("COMMIT")
+                return None
+            if tile['status'] == LEASED:
+                arcpy.AddMessage("Reassigning tile " + str(tile['id']) + " from " +
+                                 str(tile['worker']) + " to " + str(worker))
+            connection.execute("UPDATE tiles SET status = ?, worker = ?, started = ?, "
+                               "lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                               (LEASED, worker, now, now + lease_seconds, tile['id']))
+            connection.execute("COMMIT")
+            result = dict((key, tile[key]) for key in tile.keys())
+            result['attempts'] += 1
+            return result
+        finally:
+            connection.close()
+
+    def heartbeat(self, tile_id, worker, lease_seconds=LEASE_SECONDS):
+        connection = self._connect()
+        try:
+            cursor = connection.execute("UPDATE tiles SET lease_expires = ? WHERE id = ? "
+                                        "AND worker = ? AND status = ?",
+                                        (time.time() + lease_seconds, tile_id, worker, LEASED))
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+    def complete(self, tile_id, worker, output, seconds):
+        connection = self._connect()
+        try:
+            cursor = connection.execute("UPDATE tiles SET status = ?, worker = ?, output = ?, "
+                                        "seconds = ?, error = NULL WHERE id = ? AND status != ?",
+                                        (DONE, worker, output, seconds, tile_id, DONE))
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+    def fail(self, tile_id, worker, error):
+        connection = self._connect()
+        try:
+            connection.execute("UPDATE tiles SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                               "error = ? WHERE id = ? AND worker = ? AND status = ?",
+                               (self.max_attempts, PENDING, FAILED, error, tile_id, worker, LEASED))
+        finally:
+            connection.close()
+
+    def tiles(self, status=None):
+        connection = self._connect()
+        try:
+            if status is None:
+                rows = connection.execute("SELECT * FROM tiles ORDER BY id")
+            else:
+                rows = connection.execute("SELECT * FROM tiles WHERE status = ? ORDER BY id", (status,))
+            return [dict((key, row[key]) for key in row.keys()) for row in rows]
+        finally:
+            connection.close()
+
+    def counts(self):
+        connection = self._connect()
+        try:
+            counts = dict((status, 0) for status in (PENDING, LEASED, DONE, FAILED))
+            for row in connection.execute("SELECT status, COUNT(*) AS n FROM tiles GROUP BY status"):
+                counts[row['status']] = row['n']
+            return counts
+        finally:
+            connection.close()
+
+
+class FolderTileQueue(TileQueue):
+    """ a tile queue in a folder on a network share, for workers on several
+    machines. The settings and tile geometries are written once, the state
+    of the tiles is a small JSON file. Every call takes the lock of the
+    queue, a directory that only one node can create, reads the state and
+    writes a new state that replaces it by a rename. A lock older than
+    LOCK_SECONDS was left by a node that stopped and is broken"""
+
+    LOCK_SECONDS = 120
+    LOCK_TIMEOUT = 300
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = os.path.abspath(path)
+        self.max_attempts = max_attempts
+        self._lock_path = os.path.join(self.path, 'lock')
+        self._state_path = os.path.join(self.path, 'state.json')
+        self._geometry = None
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name)) as json_file:
+            return json.load(json_file)
+
+    def _write(self, path, value):
+        temp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        with open(temp_path, 'w') as json_file:
+            json.dump(value, json_file)
+        return temp_path
+
+    def _acquire(self):
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                os.mkdir(self._lock_path)
+                return
+            except OSError:
+                pass
+            try:
+                age = time.time() - os.path.getmtime(self._lock_path)
+            except OSError:
+                continue
+            if age > self.LOCK_SECONDS:
+                # only the node whose rename succeeds removes the stale lock
+                stale = self._lock_path + '.' + uuid.uuid4().hex
+                try:
+                    os.rename(self._lock_path, stale)
+                    shutil.rmtree(stale, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            if time.time() > deadline:
+                raise IOError("Timed out waiting for the lock of the tile queue " + self.path)
+            time.sleep(0.2)
+
+    def _release(self):
+        try:
+            os.rmdir(self._lock_path)
+        except OSError:
+            pass
+
+    def _load(self):
+        # a state being replaced is only under its new name for a moment
+        path = self._state_path
+        if not os.path.exists(path) and os.path.exists(path + '.new'):
+            path = path + '.new'
+        with open(path) as state_file:
+            return json.load(state_file)
+
+    def _save(self, state):
+        temp_path = self._write(self._state_path, state)
+        new_path = self._state_path + '.new'
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        os.rename(temp_path, new_path)
+        if os.path.exists(self._state_path):
+            os.remove(self._state_path)
+        os.rename(new_path, self._state_path)
+
+    def _update(self, change):
+        """ calls change with the state under the lock, the state is saved
+        when change returns True as its first value"""
+        self._acquire()
+        try:
+            state = self._load()
+            changed, result = change(state)
+            if changed:
+                self._save(state)
+            return result
+        finally:
+            self._release()
+
+    def _tiles(self, state):
+        if self._geometry is None:
+            self._geometry = self._read('tiles.json')
+        tiles = []
+        for tile in self._geometry:
+            tile = dict(tile)
+            tile.update(state[str(tile['id'])])
+            tiles.append(tile)
+        return tiles
+
+    def create(self, settings, tiles):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        geometry = [{'id': index + 1, 'geometry': tile, 'features': count}
+                    for index, (tile, count) in enumerate(tiles)]
+        state = dict((str(tile['id']), {'status': PENDING, 'worker': None, 'started': None,
+                                        'lease_expires': None, 'attempts': 0, 'output': None,
+                                        'error': None, 'seconds': None})
+                     for tile in geometry)
+        for name, value in (('settings.json', settings), ('tiles.json', geometry)):
+            os.rename(self._write(os.path.join(self.path, name), value),
+                      os.path.join(self.path, name))
+        self._save(state)
+        self._geometry = geometry
+
+    def settings(self):
+        return self._read('settings.json')
+
+    def lease(self, worker, lease_seconds=LEASE_SECONDS):
+        def change(state):
+            now = time.time()
+            tile, exhausted = _next_tile(self._tiles(state), worker, now, lease_seconds,
+                                         self.max_attempts)
+            for tile_id in exhausted:
+                entry = state[str(tile_id)]
+                entry['status'] = FAILED
+                entry['error'] = entry['error'] or 'The lease expired'
+            if tile is None:
+                return bool(exhausted), None
+            if tile['status'] == LEASED:
+                arcpy.AddMessage("Reassigning tile " + str(tile['id']) + " from " +
+                                 str(tile['worker']) + " to " + str(worker))
+            entry = state[str(tile['id'])]
+            entry.update({'status': LEASED, 'worker': worker, 'started': now,
+                          'lease_expires': now + lease_seconds,
+                          'attempts': entry['attempts'] + 1})
+            tile.update(entry)
+            return True, tile
+        return self._update(change)
+
+    def heartbeat(self, tile_id, worker, lease_seconds=LEASE_SECONDS):
+        def change(state):
+            entry = state[str(tile_id)]
+            if entry['worker'] != worker or entry['status'] != LEASED:
+                return False, False
+            entry['lease_expires'] = time.time() + lease_seconds
+            return True, True
+        return self._update(change)
+
+    def complete(self, tile_id, worker, output, seconds):
+        def change(state):
+            entry = state[str(tile_id)]
+            if entry['status'] == DONE:
+                return False, False
+            entry.update({'status': DONE, 'worker': worker, 'output': output,
+                          'seconds': seconds, 'error': None})
+            return True, True
+        return self._update(change)
+
+    def fail(self, tile_id, worker, error):
+        def change(state):
+            entry = state[str(tile_id)]
+            if entry['worker'] != worker or entry['status'] != LEASED:
+                return False, None
+            entry['status'] = PENDING if entry['attempts'] < self.max_attempts else FAILED
+            entry['error'] = error
+            return True, None
+        self._update(change)
+
+    def tiles(self, status=None):
+        tiles = self._update(lambda state: (False, self._tiles(state)))
+        return [tile for tile in tiles if status is None or tile['status'] == status]
+
+    def counts(self):
+        counts = dict((status, 0) for status in (PENDING, LEASED, DONE, FAILED))
+        for entry in self._update(lambda state: (False, list(state.values()))):
+            counts[entry['status']] += 1
+        return counts
+
+
+# the tile queues by the scheme of their location, a location without a
+# scheme is a SQLite file
+QUEUES = {'sqlite': SQLiteTileQueue, 'folder': FolderTileQueue}
+
+
+def open_queue(location):
+    scheme, separator, path = location.partition(':')
+    # drive letters are not schemes
+    if separator and len(scheme) > 1:
+        if scheme not in QUEUES:
+            arcpy.AddError("Unknown tile queue " + str(scheme))
+            raise arcpy.ExecuteError
+        return QUEUES[scheme](path)
+    return QUEUES['sqlite'](location)
+
+
+class Heartbeat(object):
+    """ extends the lease of a tile on a thread while the models run"""
+
+    def __init__(self, queue, tile_id, worker, lease_seconds):
+        self.queue = queue
+        self.tile_id = tile_id
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._beat)
+        self.thread.daemon = True
+
+    def _beat(self):
+        while not self.stopped.wait(self.lease_seconds / 3.0):
+            try:
+                if not self.queue.heartbeat(self.tile_id, self.worker, self.lease_seconds):
+                    # another worker took the tile, whoever finishes first wins
+                    self.lost = True
+            except (sqlite3.Error, IOError, OSError):
+                pass
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+def _area_fc(gdb, name, polygon):
+    arcpy.CreateFeatureclass_management(gdb, name, "POLYGON",
+                                        spatial_reference=polygon.spatialReference)
+    fc = os.path.join(gdb, name)
+    with arcpy.da.InsertCursor(fc, ['SHAPE@']) as cursor:
+        cursor.insertRow([polygon])
+    return fc
+
+
+def generalize_tile(settings, tile, stages, workers=1):
+    """ copies the source around a tile to a tile geodatabase and runs the
+    generalization models on it. Returns the path of the tile geodatabase"""
+    folder = settings['output_folder']
+    name = 'tile_' + str(tile['id']) + '_' + str(tile['attempts'])
+    tile_gdb = os.path.join(folder, name + '.gdb')
+    if arcpy.Exists(tile_gdb):
+        arcpy.Delete_management(tile_gdb)
+    arcpy.CreateFileGDB_management(folder, name)
+
+    polygon = arcpy.AsShape(json.loads(tile['geometry']), True)
+    area = _area_fc(tile_gdb, TILE_AREA_FC, polygon)
+    context = os.path.join(tile_gdb, TILE_CONTEXT_FC)
+    arcpy.Buffer_analysis(area, context, linear_unit(settings['tolerance']))
+    extract_area(settings['input_workspace'], tile_gdb, context)
+    tile_aoi = os.path.join(tile_gdb, TILE_AOI_FC)
+    arcpy.Clip_analysis(settings['aoi_fc'], context, tile_aoi)
+
+    context = {'toolbox': settings['toolbox'],
+               'gen_workspace': tile_gdb,
+               'scratch_workspace': 'in_memory',
+               'scratch_db': None,
+               'aoi_fc': tile_aoi,
+               'product_library': settings['product_library'],
+               'vvs': settings['vvs']}
+    manifest = RunManifest(RunManifest.path_for(tile_gdb))
+    manifest.reset(None, stages)
+    scratch = ScratchManager(os.path.join(folder, name + '_scratch'))
+    telemetry = RunTelemetry(RunTelemetry.path_for(tile_gdb), settings.get('telemetry', 'basic'))
+    try:
+        scratch.open()
+        run_stages(stages, context, manifest, RunPlan(0, len(stages) - 1, True),
+                   workers=workers, telemetry=telemetry, scratch=scratch)
+    finally:
+        scratch.close()
+        telemetry.summary()
+    os.remove(manifest.path)
+    return tile_gdb
+
+
+def work(queue, worker, stages, workers=1, once=False):
+    """ generalizes tiles from the queue until none are left. Returns the
+    number of tiles this worker completed"""
+    settings = queue.settings()
+    lease_seconds = settings.get('lease_seconds', LEASE_SECONDS)
+    # the toolbox next to this script, the nodes may install it anywhere
+    settings['toolbox'] = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                       'CTM50KGeneralization.tbx')
+    arcpy.ImportToolbox(settings['toolbox'])
+    completed = 0
+    while True:
+        tile = queue.lease(worker, lease_seconds)
+        if tile is None:
+            counts = queue.counts()
+            if once or not counts[PENDING] and not counts[LEASED]:
+                break
+            # tiles leased by other workers may still come back
+            time.sleep(POLL_SECONDS)
+            continue
+
+        arcpy.AddMessage("Generalizing tile " + str(tile['id']) + ", " +
+                         str(tile['features']) + " source features, attempt " + str(tile['attempts']))
+        started = time.time()
+        try:
+            with Heartbeat(queue, tile['id'], worker, lease_seconds):
+                tile_gdb = generalize_tile(settings, tile, stages, workers)
+        except Exception as ex:
+            message = str(ex) or arcpy.GetMessages(2)
+            arcpy.AddWarning("Tile " + str(tile['id']) + " failed: " + message)
+            queue.fail(tile['id'], worker, message)
+            continue
+
+        if queue.complete(tile['id'], worker, tile_gdb, time.time() - started):
+            completed += 1
+        else:
+            arcpy.AddMessage("Tile " + str(tile['id']) + " was completed by another worker")
+            arcpy.Delete_management(tile_gdb)
+        if once:
+            break
+    return completed
+
+
+def tile_seams(polygons):
+    """ returns the edges between the tiles as one polyline, without the
+    outline of the tiles"""
+    outline = None
+    edges = None
+    for polygon in polygons:
+        outline = polygon if outline is None else outline.union(polygon)
+        boundary = polygon.boundary()
+        edges = boundary if edges is None else edges.union(boundary)
+    if edges is None:
+        return None
+    return edges.difference(outline.boundary())
+
+
+def stitch_seams(fc, seams, snap_distance=SEAM_SNAP):
+    """ snaps the lines and polygons of fc near the seams to each other and
+    merges the pieces with the same attributes across them. Returns the
+    number of pieces merged away"""
+    shape_type = arcpy.Describe(fc).shapeType
+    if shape_type not in ('Polyline', 'Polygon'):
+        return 0
+    layer = arcpy.MakeFeatureLayer_management(fc, "seam_features").getOutput(0)
+    try:
+        arcpy.SelectLayerByLocation_management(layer, "WITHIN_A_DISTANCE", seams, snap_distance)
+        if int(arcpy.GetCount_management(layer).getOutput(0)) < 2:
+            return 0
+        # line ends to line ends, polygon edges to polygon edges
+        snap_type = "END" if shape_type == 'Polyline' else "EDGE"
+        arcpy.Snap_edit(layer, [[layer, snap_type, snap_distance]])
+    finally:
+        arcpy.Delete_management(layer)
+    return rejoin_pieces(fc, seams, snap_distance)
+
+
+def merge_tiles(queue, output_gdb, snap_distance=SEAM_SNAP):
+    """ merges the tile geodatabases into output_gdb. The lines of every
+    tile are split at its edge and the features whose center is in the tile
+    are kept, then the features are stitched across the seams between the
+    tiles"""
+    counts = queue.counts()
+    if counts[PENDING] or counts[LEASED] or counts[FAILED]:
+        arcpy.AddError("Cannot merge, " + str(counts[PENDING] + counts[LEASED]) +
+                       " tiles are not finished and " + str(counts[FAILED]) + " failed")
+        raise arcpy.ExecuteError
+    tiles = queue.tiles(DONE)
+    if not tiles:
+        arcpy.AddError("The queue has no finished tiles")
+        raise arcpy.ExecuteError
+
+    folder, name = os.path.split(os.path.splitext(str(output_gdb))[0])
+    if arcpy.Exists(output_gdb):
+        arcpy.Delete_management(output_gdb)
+    arcpy.CreateFileGDB_management(folder, name)
+    schema = os.path.join(folder, name + '_schema.xml')
+    arcpy.ExportXMLWorkspaceDocument_management(tiles[0]['output'], schema, "SCHEMA_ONLY")
+    arcpy.ImportXMLWorkspaceDocument_management(output_gdb, schema, "SCHEMA_ONLY")
+    os.remove(schema)
+    for name in TILE_FCS + SHARED_FCS:
+        if arcpy.Exists(os.path.join(output_gdb, name)):
+            arcpy.Delete_management(os.path.join(output_gdb, name))
+
+    # every tile carries all the rows of the tables
+    for dirpath, dirnames, filenames in arcpy.da.Walk(tiles[0]['output'], datatype="Table"):
+        for filename in filenames:
+            target = os.path.join(output_gdb, filename)
+            if arcpy.Exists(target):
+                arcpy.Append_management(os.path.join(dirpath, filename), target, "NO_TEST")
+
+    outputs = feature_classes(output_gdb)
+    for tile in tiles:
+        arcpy.AddMessage("Merging tile " + str(tile['id']) + " from " + str(tile['output']))
+        area = os.path.join(tile['output'], TILE_AREA_FC)
+        polygon = arcpy.AsShape(json.loads(tile['geometry']), True)
+        for name, tile_fc in sorted(feature_classes(tile['output']).items()):
+            if name not in outputs:
+                continue
+            if arcpy.Describe(tile_fc).shapeType == 'Polyline':
+                split_at_boundary(tile_fc, polygon)
+            layer = arcpy.MakeFeatureLayer_management(tile_fc, "merge_tile").getOutput(0)
+            try:
+                arcpy.SelectLayerByLocation_management(layer, "HAVE_THEIR_CENTER_IN", area)
+                if int(arcpy.GetCount_management(layer).getOutput(0)):
+                    arcpy.Append_management(layer, outputs[name], "NO_TEST")
+            finally:
+                arcpy.Delete_management(layer)
+
+    seams = tile_seams([arcpy.AsShape(json.loads(tile['geometry']), True) for tile in tiles])
+    if seams is None or not seams.length:
+        return output_gdb
+    # the seams in the spatial reference of each feature class
+    projected = {}
+    for name, fc in sorted(outputs.items()):
+        if name in TILE_FCS:
+            continue
+        spatial_reference = arcpy.Describe(fc).spatialReference
+        text = spatial_reference.exportToString()
+        if text not in projected:
+            projected[text] = project(seams, spatial_reference)
+        merged = stitch_seams(fc, projected[text], snap_distance)
+        if merged:
+            arcpy.AddMessage(name + ": merged " + str(merged) + " pieces across the tile seams")
+    return output_gdb
+
+
+def _report(queue):
+    counts = queue.counts()
+    arcpy.AddMessage(", ".join(str(counts[status]) + " " + status
+                               for status in (PENDING, LEASED, DONE, FAILED)))
+    for tile in queue.tiles():
+        if tile['status'] in (LEASED, FAILED) or tile['attempts'] > 1:
+            arcpy.AddMessage("tile " + str(tile['id']) + ": " + tile['status'] + ", " +
+                             str(tile['worker']) + ", attempt " + str(tile['attempts']) +
+                             (", " + tile['error'] if tile['error'] else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generalizes a large area as tiles on several workers.")
+    commands = parser.add_subparsers(dest='command')
+
+    plan = commands.add_parser('plan', help="tiles the area of interest and fills the queue")
+    plan.add_argument('queue')
+    plan.add_argument('input_workspace')
+    plan.add_argument('aoi_fc')
+    plan.add_argument('output_folder', help="folder for the tile geodatabases, shared by the workers")
+    plan.add_argument('product_library')
+    plan.add_argument('vvs')
+    plan.add_argument('--max-features', type=int, default=MAX_FEATURES)
+    plan.add_argument('--grid-size', type=int, default=GRID_SIZE)
+    plan.add_argument('--tolerance', default=MODEL_TOLERANCE)
+    plan.add_argument('--lease', type=int, default=LEASE_SECONDS)
+    plan.add_argument('--telemetry', default='basic')
+
+    worker = commands.add_parser('work', help="generalizes tiles until none are left")
+    worker.add_argument('queue')
+    worker.add_argument('--name', default=socket.gethostname() + '-' + str(os.getpid()))
+    worker.add_argument('--workers', type=int, default=1, help="worker processes for the models")
+    worker.add_argument('--once', action='store_true', help="generalize one tile and stop")
+
+    status = commands.add_parser('status', help="reports the tiles of the queue")
+    status.add_argument('queue')
+
+    merge = commands.add_parser('merge', help="merges the tiles into one geodatabase")
+    merge.add_argument('queue')
+    merge.add_argument('output_gdb')
+    merge.add_argument('--snap', default=SEAM_SNAP,
+                       help="distance the features are snapped across the seams, " + SEAM_SNAP)
+
+    args = parser.parse_args(argv)
+    arcpy.env.overwriteOutput = True
+    queue = open_queue(args.queue)
+
+    if args.command == 'plan':
+        tiles = plan_tiles(args.input_workspace, args.aoi_fc, args.max_features, args.grid_size)
+        # the workers may run in another folder
+        settings = {'input_workspace': os.path.abspath(args.input_workspace),
+                    'aoi_fc': os.path.abspath(args.aoi_fc),
+                    'output_folder': os.path.abspath(args.output_folder),
+                    'product_library': os.path.abspath(args.product_library),
+                    'vvs': os.path.abspath(args.vvs),
+                    'tolerance': args.tolerance,
+                    'lease_seconds': args.lease,
+                    'telemetry': args.telemetry}
+        queue.create(settings, [(polygon.JSON, count) for polygon, count in tiles])
+        arcpy.AddMessage("Planned " + str(len(tiles)) + " tiles, the largest has " +
+                         str(tiles[0][1] if tiles else 0) + " source features")
+    elif args.command == 'work':
+        from All_Generalization import STAGES
+        completed = work(queue, args.name, STAGES, args.workers, args.once)
+        arcpy.AddMessage(args.name + " completed " + str(completed) + " tiles")
+    elif args.command == 'status':
+        _report(queue)
+    elif args.command == 'merge':
+        merge_tiles(queue, args.output_gdb, linear_unit(args.snap))
+        arcpy.AddMessage("Merged the tiles into " + str(args.output_gdb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Edges
+# Purpose:     Finds the features that touch the boundary of the job area of
+#              interest and sets their hierarchy.
+#
+#              The boundary is read once, projected to the spatial reference
+#              of each feature class and split into short pieces that are
+#              kept in a grid index by envelope. Every feature class is
+#              then read with a single update cursor, a feature is only
+#              tested against the boundary pieces whose envelopes overlap its
+#              own, and only features that touch the boundary are written.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import math
+import hashlib
+import arcpy
+
+
+# vertices per boundary piece. Shorter pieces give tighter envelopes but more
+# entries in the index
+PIECE_VERTICES = 32
+
+# field names of every feature class looked at by this process
+_SCHEMA = {}
+
+# the index of the last boundary used by a worker process, by a hash of
+# the boundary pieces and their spatial reference
+_INDEX = {}
+
+
+def field_names(fc):
+    """ returns the upper case field names of a feature class, ListFields is
+    only called once for each feature class"""
+    key = str(fc)
+    if key not in _SCHEMA:
+        _SCHEMA[key] = set(f.name.upper() for f in arcpy.ListFields(fc))
+    return _SCHEMA[key]
+
+
+def forget_schema(fc=None):
+    """ drops cached field names, e.g. after fields were added"""
+    if fc is None:
+        _SCHEMA.clear()
+    else:
+        _SCHEMA.pop(str(fc), None)
+
+
+class EnvelopeGrid(object):
+    """ a uniform grid of envelopes. Every item is listed in each cell its
+    envelope overlaps, a query returns the items listed in the cells the
+    query envelope overlaps"""
+
+    def __init__(self, envelopes):
+        self.envelopes = envelopes
+        self.cells = {}
+        if not envelopes:
+            self.size = 1.0
+            self.xmin = self.ymin = 0.0
+            return
+        self.xmin = min(e[0] for e in envelopes)
+        self.ymin = min(e[1] for e in envelopes)
+        xmax = max(e[2] for e in envelopes)
+        ymax = max(e[3] for e in envelopes)
+        # roughly square cells with about one item per cell
+        area = max((xmax - self.xmin) * (ymax - self.ymin), 1e-12)
+        self.size = max(math.sqrt(area / len(envelopes)),
+                        max(xmax - self.xmin, ymax - self.ymin) / 4096.0, 1e-9)
+        for item, envelope in enumerate(envelopes):
+            for cell in self._cells(envelope):
+                self.cells.setdefault(cell, []).append(item)
+
+    def _range(self, envelope):
+        return (int(math.floor((envelope[0] - self.xmin) / self.size)),
+                int(math.floor((envelope[1] - self.ymin) / self.size)),
+                int(math.floor((envelope[2] - self.xmin) / self.size)),
+                int(math.floor((envelope[3] - self.ymin) / self.size)))
+
+    def _cells(self, envelope):
+        x0, y0, x1, y1 = self._range(envelope)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield (x, y)
+
+    def query(self, envelope):
+        """ returns the items whose envelopes overlap the envelope"""
+        x0, y0, x1, y1 = self._range(envelope)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # large envelopes cover more cells than are in use
+            candidates = range(len(self.envelopes))
+        else:
+            candidates = set()
+            for cell in self._cells(envelope):
+                candidates.update(self.cells.get(cell, ()))
+        found = set()
+        for item in candidates:
+            other = self.envelopes[item]
+            if (other[0] <= envelope[2] and envelope[0] <= other[2] and
+                    other[1] <= envelope[3] and envelope[1] <= other[3]):
+                found.add(item)
+        return found
+
+
+def shape_pieces(shape):
+    """ splits the boundary of a polygon, or a polyline, into lists of (x, y)
+    vertices with at most PIECE_VERTICES vertices each"""
+    pieces = []
+    if shape.type == 'polygon':
+        shape = shape.boundary()
+    step = PIECE_VERTICES - 1
+    for part in shape:
+        vertices = [(point.X, point.Y) for point in part if point is not None]
+        for start in range(0, max(len(vertices) - 1, 1), step):
+            piece = vertices[start:start + PIECE_VERTICES]
+            if len(piece) > 1:
+                pieces.append(piece)
+    return pieces
+
+
+def project(shape, spatial_ref):
+    """ returns the geometry in spatial_ref"""
+    if shape is not None and spatial_ref is not None and \
+            shape.spatialReference.name != spatial_ref.name:
+        shape = shape.projectAs(spatial_ref)
+    return shape
+
+
+def aoi_polygon(aoi, spatial_ref=None):
+    """ returns the union of the polygons in aoi, projected to spatial_ref.
+    With boundary lines in aoi the union of the lines is returned"""
+    polygon = None
+    with arcpy.da.SearchCursor(aoi, ['SHAPE@']) as cursor:
+        for row in cursor:
+            if row[0] is None:
+                continue
+            polygon = row[0] if polygon is None else polygon.union(row[0])
+    return project(polygon, spatial_ref)
+
+
+def boundary_key(pieces, spatial_ref):
+    """ returns a hash of the boundary pieces and their spatial reference"""
+    digest = hashlib.sha1(str(spatial_ref).encode('utf-8'))
+    for piece in pieces:
+        digest.update(repr(piece).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BoundaryIndex(object):
+    """ the pieces of the boundary as polylines in an envelope grid"""
+
+    def __init__(self, pieces, spatial_ref):
+        if not isinstance(spatial_ref, arcpy.SpatialReference):
+            text = spatial_ref
+            spatial_ref = arcpy.SpatialReference()
+            spatial_ref.loadFromString(text)
+        self.lines = []
+        envelopes = []
+        for piece in pieces:
+            array = arcpy.Array([arcpy.Point(x, y) for x, y in piece])
+            self.lines.append(arcpy.Polyline(array, spatial_ref))
+            xs = [x for x, y in piece]
+            ys = [y for x, y in piece]
+            envelopes.append((min(xs), min(ys), max(xs), max(ys)))
+        self.grid = EnvelopeGrid(envelopes)
+
+    def touches(self, shape):
+        """ True if the geometry intersects the boundary"""
+        extent = shape.extent
+        envelope = (extent.XMin, extent.YMin, extent.XMax, extent.YMax)
+        for item in self.grid.query(envelope):
+            if not shape.disjoint(self.lines[item]):
+                return True
+        return False
+
+
+def _boundary_index(key, pieces, spatial_ref):
+    """ builds the index of a boundary once per process, key is the
+    boundary_key of the pieces"""
+    if key not in _INDEX:
+        _INDEX.clear()
+        _INDEX[key] = BoundaryIndex(pieces, spatial_ref)
+    return _INDEX[key]
+
+
+def mark_edge_features(task):
+    """ sets the hierarchy field of every feature of one feature class that
+    touches the boundary to the edge value. Runs in the driver or in a
+    worker process, returns (feature class, features read, features updated)"""
+    index = _boundary_index(task['key'], task['pieces'], task['spatial_ref'])
+    field = task['field']
+    value = task['value']
+    delimited = arcpy.AddFieldDelimiters(task['fc'], field)
+    where = delimited + " <> " + str(value) + " OR " + delimited + " IS NULL"
+
+    scanned = 0
+    updated = 0
+    with arcpy.da.UpdateCursor(task['fc'], ['SHAPE@', field], where) as cursor:
+        for row in cursor:
+            scanned += 1
+            if row[0] is not None and index.touches(row[0]):
+                row[1] = value
+                cursor.updateRow(row)
+                updated += 1
+    return task['fc'], scanned, updated
+
+
+def set_edge_hierarchy(fcs, aoi, hier_field, value=0, workers=1):
+    """ sets the hierarchy of all features touching the boundary of the aoi
+    to value. Feature classes without the hierarchy field are skipped, with
+    more than one worker the feature classes are processed concurrently.
+    The boundary is projected to the spatial reference of every feature
+    class, the way split_at_boundary does"""
+    boundary = aoi_polygon(aoi)
+    if boundary is None:
+        arcpy.AddWarning("The area of interest " + str(aoi) + " has no boundary")
+        return {}
+
+    # the boundary pieces by spatial reference of the feature classes
+    projected = {}
+    tasks = []
+    for fc in fcs:
+        if hier_field.upper() not in field_names(fc):
+            continue
+        spatial_ref = arcpy.Describe(fc).spatialReference
+        text = spatial_ref.exportToString()
+        if text not in projected:
+            pieces = shape_pieces(project(boundary, spatial_ref))
+            projected[text] = (pieces, boundary_key(pieces, text))
+        pieces, key = projected[text]
+        tasks.append({'fc': fc, 'field': hier_field, 'value': value, 'key': key,
+                      'pieces': pieces, 'spatial_ref': text})
+    arcpy.AddMessage("Setting hierarchy for edge features in " + str(len(tasks)) +
+                     " feature classes, " + str(len(projected)) +
+                     " spatial reference(s)")
+
+    if workers > 1 and len(tasks) > 1:
+        from Generalization_Scheduler import create_pool
+        pool = create_pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(mark_edge_features, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [mark_edge_features(task) for task in tasks]
+
+    counts = {}
+    for fc, scanned, updated in results:
+        counts[fc] = updated
+        if updated:
+            arcpy.AddMessage(str(fc) + ": " + str(updated) + " of " +
+                             str(scanned) + " features on the edge")
+    return counts
+
+
+def _single_parts(shape, spatial_ref, has_z, has_m):
+    parts = []
+    if shape is None:
+        return parts
+    for part in shape:
+        if part.count:
+            parts.append(arcpy.Polyline(part, spatial_ref, has_z, has_m))
+    return parts
+
+
+def split_at_boundary(fc, polygon):
+    """ splits the lines of fc that cross the boundary of polygon into the
+    parts inside and outside of it, and the other multipart lines into their
+    parts, so every line is single part as after an identity with the
+    polygon and MultipartToSinglepart. Only the features that cross the
+    boundary or have several parts are written, the first part keeps the
+    ObjectID and the other parts are inserted with the same attributes.
+    Returns the number of features split and the number of features
+    inserted"""
+    desc = arcpy.Describe(fc)
+    spatial_ref = desc.spatialReference
+    index = BoundaryIndex(shape_pieces(polygon), polygon.spatialReference)
+
+    # the envelope test and the exact test only need the geometry
+    candidates = []
+    touching = set()
+    with arcpy.da.SearchCursor(fc, ['OID@', 'SHAPE@']) as cursor:
+        for oid, shape in cursor:
+            if shape is None:
+                continue
+            if index.touches(shape):
+                touching.add(oid)
+                candidates.append(oid)
+            elif shape.isMultipart:
+                candidates.append(oid)
+    if not candidates:
+        return 0, 0
+
+    fields = [f.name for f in desc.fields
+              if f.editable and f.type not in ('OID', 'Geometry')]
+    oid_field = arcpy.AddFieldDelimiters(fc, desc.OIDFieldName)
+
+    split = 0
+    inserted = 0
+    rows = []
+    # the where clause is built in chunks to keep it within the size the
+    # database accepts
+    for start in range(0, len(candidates), 1000):
+        chunk = candidates[start:start + 1000]
+        where = oid_field + " IN (" + ", ".join(str(oid) for oid in chunk) + ")"
+        with arcpy.da.UpdateCursor(fc, ['OID@', 'SHAPE@'] + fields, where) as cursor:
+            for row in cursor:
+                shape = row[1]
+                if row[0] in touching:
+                    parts = (_single_parts(shape.intersect(polygon, 2), spatial_ref,
+                                           desc.hasZ, desc.hasM) +
+                             _single_parts(shape.difference(polygon), spatial_ref,
+                                           desc.hasZ, desc.hasM))
+                else:
+                    parts = _single_parts(shape, spatial_ref, desc.hasZ, desc.hasM)
+                if len(parts) < 2:
+                    # single part, touching the boundary without crossing it
+                    continue
+                row[1] = parts[0]
+                cursor.updateRow(row)
+                split += 1
+                for part in parts[1:]:
+                    rows.append([part] + list(row[2:]))
+
+    if rows:
+        with arcpy.da.InsertCursor(fc, ['SHAPE@'] + fields) as cursor:
+            for row in rows:
+                cursor.insertRow(row)
+                inserted += 1
+    return split, inserted
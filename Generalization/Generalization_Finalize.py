@@ -0,0 +1,72 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Finalize
+# Purpose:     Applies representation overrides and repairs the geometry of
+#              the feature classes of a generalization workspace.
+#
+#              The feature classes can be finalized concurrently in worker
+#              processes, the time each one took is reported.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import time
+import datetime
+import arcpy
+
+
+def finalize_feature_class(task):
+    """ applies the representation overrides and repairs the geometry of one
+    feature class. Runs in the driver or in a worker process"""
+    start = time.time()
+    fc = task['fc']
+    result = {'fc': fc, 'status': 'repaired', 'error': None}
+    try:
+        arcpy.env.overwriteOutput = True
+        arcpy.env.addOutputsToMap = False
+        desc = arcpy.Describe(fc)
+        if hasattr(desc, "representations"):
+            for rep in desc.representations:
+                arcpy.UpdateOverride_cartography(fc, rep.name, "BOTH")
+        arcpy.RepairGeometry_management(fc)
+        result['messages'] = arcpy.GetMessages()
+    except Exception as ex:
+        result['status'] = 'failed'
+        result['error'] = str(ex)
+        result['messages'] = arcpy.GetMessages()
+    result['seconds'] = time.time() - start
+    return result
+
+
+def finalize(fcs, workers=1):
+    """ finalizes the feature classes, with more than one worker they are
+    finalized concurrently. Returns the results in the order of fcs"""
+    tasks = [{'fc': fc} for fc in fcs]
+
+    if workers > 1 and len(tasks) > 1:
+        from Generalization_Scheduler import create_pool
+        pool = create_pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(finalize_feature_class, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [finalize_feature_class(task) for task in tasks]
+
+    failed = []
+    for result in results:
+        took = str(datetime.timedelta(seconds=int(result['seconds'])))
+        if result['status'] == 'failed':
+            failed.append(result['fc'])
+            arcpy.AddWarning(str(result['fc']) + " failed after " + took + ": " +
+                             str(result['error']))
+            continue
+        arcpy.AddMessage("Applied overrides and repaired " + str(result['fc']) +
+                         " in " + took)
+
+    arcpy.AddMessage("Finalized " + str(len(results) - len(failed)) + " of " +
+                     str(len(results)) + " feature classes")
+    if failed:
+        arcpy.AddError("Unable to finalize " + ", ".join(str(fc) for fc in failed))
+        raise arcpy.ExecuteError
+    return results
@@ -0,0 +1,378 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Incremental
+# Purpose:     Regenerates only the part of a generalization workspace whose
+#              source features changed since the last run.
+#
+#              A digest of the attributes and geometry of every source
+#              feature is kept next to the generalization workspace. The
+#              next run compares the source with it and pads the envelopes
+#              of the added, changed and deleted features by the largest
+#              model tolerance, this is the dirty region. The source features
+#              within a second tolerance around it are generalized in a work
+#              geodatabase, then the features of the output whose center is
+#              in the dirty region are replaced by those of the work
+#              geodatabase. Lines crossing the edge of the dirty region are
+#              split at it first so every piece is owned by one side, and
+#              the pieces of a line that meet at the edge are merged again
+#              after the features were replaced.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import json
+import hashlib
+import arcpy
+from Generalization_Edges import aoi_polygon, split_at_boundary
+from Generalization_Stages import SHARED_FCS
+
+
+DIGEST_VERSION = 2
+
+# the largest tolerance used by the generalization models, features further
+# than this from a change are not affected by it. Keep in step with the
+# models in CTM50KGeneralization.tbx
+MODEL_TOLERANCE = "500 Meters"
+
+# fields identifying a feature across edits, the ObjectID is used when a
+# feature class has none of them
+ID_FIELDS = ('UFI', 'GLOBALID')
+
+# fields the database maintains, they do not change what is generalized
+IGNORED_FIELDS = ('SHAPE_LENGTH', 'SHAPE_AREA', 'SHAPE.LEN', 'SHAPE.AREA')
+
+DIRTY_FC = 'Incremental_Dirty'
+REGION_FC = 'Incremental_Region'
+CONTEXT_FC = 'Incremental_Context'
+AOI_FC = 'Incremental_AOI'
+
+
+def linear_unit(value):
+    """ a distance for the buffer tool, plain numbers are meters"""
+    value = str(value).strip()
+    try:
+        float(value)
+        return value + " Meters"
+    except ValueError:
+        return value
+
+
+def feature_classes(workspace):
+    """ the feature classes of a workspace by name"""
+    paths = {}
+    for dirpath, dirnames, filenames in arcpy.da.Walk(workspace, datatype="FeatureClass"):
+        for filename in filenames:
+            paths[filename] = os.path.join(dirpath, filename)
+    return paths
+
+
+def feature_digests(fc):
+    """ returns {feature id: (digest, (xmin, ymin, xmax, ymax))} for the
+    features of a feature class, the ids are text so they can be saved as
+    JSON"""
+    desc = arcpy.Describe(fc)
+    names = [f.name for f in desc.fields]
+    upper = [name.upper() for name in names]
+    id_field = 'OID@'
+    for candidate in ID_FIELDS:
+        if candidate in upper:
+            id_field = names[upper.index(candidate)]
+            break
+    fields = [f.name for f in desc.fields
+              if f.type not in ('OID', 'Geometry') and f.name.upper() not in IGNORED_FIELDS]
+
+    digests = {}
+    with arcpy.da.SearchCursor(fc, [id_field, 'OID@', 'SHAPE@'] + fields) as cursor:
+        for row in cursor:
+            shape = row[2]
+            digest = hashlib.sha1(repr(row[3:]).encode('utf-8'))
+            if shape is None:
+                envelope = None
+            else:
+                digest.update(shape.WKB)
+                extent = shape.extent
+                envelope = (extent.XMin, extent.YMin, extent.XMax, extent.YMax)
+            key = 'id:%s' % (row[0],) if row[0] is not None else 'oid:%s' % (row[1],)
+            digests[key] = (digest.hexdigest()[:20], envelope)
+    return digests
+
+
+class SourceDigests(object):
+    """ the digests of the source features at the last run and the spatial
+    reference of the envelopes of each feature class, kept in a JSON file
+    next to the generalization workspace"""
+
+    def __init__(self, path):
+        self.path = path
+        self.digests = None
+        self.spatial_references = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as digest_file:
+                    data = json.load(digest_file)
+                if data.get('version') == DIGEST_VERSION:
+                    self.digests = data['digests']
+                    self.spatial_references = data['spatial_references']
+            except ValueError:
+                arcpy.AddWarning("Ignoring the unreadable source digests " + str(path))
+
+    @staticmethod
+    def path_for(gen_workspace):
+        return os.path.splitext(str(gen_workspace))[0] + '_digests.json'
+
+    @property
+    def exists(self):
+        return self.digests is not None
+
+    @staticmethod
+    def scan(workspace):
+        """ the digests of every feature class of a workspace and the spatial
+        reference of the envelopes of each"""
+        digests = {}
+        spatial_references = {}
+        for name, path in sorted(feature_classes(workspace).items()):
+            digests[name] = feature_digests(path)
+            spatial_references[name] = arcpy.Describe(path).spatialReference.exportToString()
+        return digests, spatial_references
+
+    def save(self, digests, spatial_references):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as digest_file:
+            json.dump({'version': DIGEST_VERSION, 'digests': digests,
+                       'spatial_references': spatial_references}, digest_file)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
+        self.digests = digests
+        self.spatial_references = spatial_references
+
+    def record(self, workspace):
+        """ records the source of a complete run"""
+        arcpy.AddMessage("Recording the source digests for incremental runs")
+        self.save(*self.scan(workspace))
+
+    def changes(self, digests, spatial_references):
+        """ returns the envelopes of the features added, changed or deleted
+        since the digests were saved, for changed features both the old and
+        the new envelope, each with the spatial reference it is in, and the
+        number of changed features"""
+        envelopes = []
+        changed = 0
+        for name in set(self.digests) | set(digests):
+            old = self.digests.get(name, {})
+            new = digests.get(name, {})
+            for key in set(old) | set(new):
+                before = old.get(key)
+                after = new.get(key)
+                if before is not None and after is not None and before[0] == after[0]:
+                    continue
+                changed += 1
+                for value, references in ((before, self.spatial_references),
+                                          (after, spatial_references)):
+                    if value is not None and value[1] is not None:
+                        envelopes.append((value[1], references[name]))
+        return envelopes, changed
+
+
+def extract_area(input_workspace, work_gdb, area_fc):
+    """ imports the schema of the input workspace into work_gdb and appends
+    the features intersecting the polygons of area_fc and all table rows"""
+    arcpy.AddMessage("Copying the source in " + os.path.basename(str(area_fc)) + " to " + str(work_gdb))
+    schema = os.path.splitext(str(work_gdb))[0] + '_schema.xml'
+    arcpy.ExportXMLWorkspaceDocument_management(input_workspace, schema, "SCHEMA_ONLY")
+    arcpy.ImportXMLWorkspaceDocument_management(work_gdb, schema, "SCHEMA_ONLY")
+    os.remove(schema)
+
+    targets = feature_classes(work_gdb)
+    for name, path in feature_classes(input_workspace).items():
+        if name not in targets:
+            continue
+        layer = arcpy.MakeFeatureLayer_management(path, "extract_source").getOutput(0)
+        try:
+            arcpy.SelectLayerByLocation_management(layer, "INTERSECT", area_fc)
+            arcpy.Append_management(layer, targets[name], "NO_TEST")
+        finally:
+            arcpy.Delete_management(layer)
+
+    for dirpath, dirnames, filenames in arcpy.da.Walk(input_workspace, datatype="Table"):
+        for filename in filenames:
+            target = os.path.join(work_gdb, filename)
+            if arcpy.Exists(target):
+                arcpy.Append_management(os.path.join(dirpath, filename), target, "NO_TEST")
+
+
+def replace_in_area(output_fc, work_fc, area_fc, area_polygon):
+    """ replaces the features of output_fc whose center is in area_fc by the
+    features of work_fc whose center is in it. Lines are split at the edge
+    of the area first so every piece is owned by one side. Returns the
+    number of features removed and added"""
+    if arcpy.Describe(output_fc).shapeType == 'Polyline':
+        split_at_boundary(output_fc, area_polygon)
+        split_at_boundary(work_fc, area_polygon)
+
+    output_layer = arcpy.MakeFeatureLayer_management(output_fc, "replace_output").getOutput(0)
+    work_layer = arcpy.MakeFeatureLayer_management(work_fc, "replace_work").getOutput(0)
+    try:
+        arcpy.SelectLayerByLocation_management(output_layer, "HAVE_THEIR_CENTER_IN", area_fc)
+        removed = int(arcpy.GetCount_management(output_layer).getOutput(0))
+        if removed:
+            arcpy.DeleteFeatures_management(output_layer)
+        arcpy.SelectLayerByLocation_management(work_layer, "HAVE_THEIR_CENTER_IN", area_fc)
+        added = int(arcpy.GetCount_management(work_layer).getOutput(0))
+        if added:
+            arcpy.Append_management(work_layer, output_fc, "NO_TEST")
+    finally:
+        arcpy.Delete_management(output_layer)
+        arcpy.Delete_management(work_layer)
+    return removed, added
+
+
+def rejoin_pieces(fc, edge, search_distance=None):
+    """ merges the features of fc that meet at edge, a polyline, and have the
+    same attributes: the pieces of lines split at the edge, and with
+    polygons the parts of a polygon cut by it. The ID fields keep the
+    pieces of different features apart. Returns the number of pieces that
+    were merged away"""
+    desc = arcpy.Describe(fc)
+    # the dissolve tool cannot group by blobs, representation overrides
+    # of the merged features are not kept
+    fields = [f.name for f in desc.fields
+              if f.editable and f.type not in ('OID', 'Geometry', 'Blob', 'Raster')
+              and f.name.upper() not in IGNORED_FIELDS]
+    unsplit = "UNSPLIT_LINES" if desc.shapeType == 'Polyline' else "DISSOLVE_LINES"
+    layer = arcpy.MakeFeatureLayer_management(fc, "rejoin_output").getOutput(0)
+    merged = "in_memory\\rejoin_" + os.path.basename(str(fc))
+    try:
+        arcpy.SelectLayerByLocation_management(layer, "INTERSECT", edge, search_distance)
+        pieces = int(arcpy.GetCount_management(layer).getOutput(0))
+        if pieces < 2:
+            return 0
+        arcpy.Dissolve_management(layer, merged, fields, multi_part="SINGLE_PART",
+                                  unsplit_lines=unsplit)
+        joined = int(arcpy.GetCount_management(merged).getOutput(0))
+        if joined >= pieces:
+            return 0
+        arcpy.DeleteFeatures_management(layer)
+        arcpy.Append_management(merged, fc, "NO_TEST")
+        return pieces - joined
+    finally:
+        arcpy.Delete_management(layer)
+        if arcpy.Exists(merged):
+            arcpy.Delete_management(merged)
+
+
+def _polygon(envelope, spatial_reference):
+    xmin, ymin, xmax, ymax = envelope
+    # points and straight lines have an empty envelope, give it some area
+    # so the buffer tool accepts it
+    if xmax - xmin <= 0:
+        xmin, xmax = xmin - 1e-6, xmax + 1e-6
+    if ymax - ymin <= 0:
+        ymin, ymax = ymin - 1e-6, ymax + 1e-6
+    array = arcpy.Array([arcpy.Point(xmin, ymin), arcpy.Point(xmin, ymax),
+                         arcpy.Point(xmax, ymax), arcpy.Point(xmax, ymin),
+                         arcpy.Point(xmin, ymin)])
+    return arcpy.Polygon(array, spatial_reference)
+
+
+class IncrementalUpdate(object):
+    """ updates a generalization workspace from the changes to its source"""
+
+    def __init__(self, input_workspace, gen_workspace, tolerance=None):
+        self.input_workspace = input_workspace
+        self.gen_workspace = gen_workspace
+        self.tolerance = linear_unit(tolerance or MODEL_TOLERANCE)
+        self.digests = SourceDigests(SourceDigests.path_for(gen_workspace))
+        folder, name = os.path.split(os.path.splitext(str(gen_workspace))[0])
+        self.folder = folder
+        self.work_name = name + '_incremental'
+        self.work_gdb = os.path.join(folder, self.work_name + '.gdb')
+        self.current = None
+
+    @property
+    def available(self):
+        return self.digests.exists and arcpy.Exists(self.gen_workspace)
+
+    def find_changes(self):
+        """ compares the source with the digests of the last run and writes
+        the dirty region to the work geodatabase. Returns the number of
+        changed features"""
+        arcpy.AddMessage("Comparing the source with the last generalized run")
+        self.current = SourceDigests.scan(self.input_workspace)
+        envelopes, changed = self.digests.changes(*self.current)
+        arcpy.AddMessage(str(changed) + " source features changed since the last run")
+        if not changed:
+            return 0
+
+        self._create_work_gdb()
+        # the envelopes are projected to the spatial reference of the first
+        # of them when their feature classes differ
+        references = {}
+        for envelope, text in envelopes:
+            if text not in references:
+                references[text] = arcpy.SpatialReference()
+                references[text].loadFromString(text)
+        target = envelopes[0][1]
+        dirty = os.path.join(self.work_gdb, DIRTY_FC)
+        arcpy.CreateFeatureclass_management(self.work_gdb, DIRTY_FC, "POLYGON",
+                                            spatial_reference=references[target])
+        with arcpy.da.InsertCursor(dirty, ['SHAPE@']) as cursor:
+            for envelope, text in envelopes:
+                polygon = _polygon(envelope, references[text])
+                if text != target:
+                    polygon = polygon.projectAs(references[target])
+                cursor.insertRow([polygon])
+
+        arcpy.AddMessage("Padding the changes by " + self.tolerance)
+        arcpy.Buffer_analysis(dirty, os.path.join(self.work_gdb, REGION_FC),
+                              self.tolerance, dissolve_option="ALL")
+        arcpy.Buffer_analysis(os.path.join(self.work_gdb, REGION_FC),
+                              os.path.join(self.work_gdb, CONTEXT_FC),
+                              self.tolerance, dissolve_option="ALL")
+        return changed
+
+    def _create_work_gdb(self):
+        if arcpy.Exists(self.work_gdb):
+            arcpy.Delete_management(self.work_gdb)
+        arcpy.CreateFileGDB_management(self.folder, self.work_name)
+
+    def prepare(self, aoi_fc):
+        """ copies the schema of the source and the source features around
+        the dirty region into the work geodatabase. Returns the workspace and
+        area of interest for the generalization stages"""
+        context = os.path.join(self.work_gdb, CONTEXT_FC)
+        extract_area(self.input_workspace, self.work_gdb, context)
+        work_aoi = os.path.join(self.work_gdb, AOI_FC)
+        arcpy.Clip_analysis(aoi_fc, context, work_aoi)
+        return {'gen_workspace': self.work_gdb, 'aoi_fc': work_aoi}
+
+    def splice(self):
+        """ replaces the features of the output whose center is in the dirty
+        region by the features generalized in the work geodatabase"""
+        region_fc = os.path.join(self.work_gdb, REGION_FC)
+        skip = set(SHARED_FCS) | set([DIRTY_FC, REGION_FC, CONTEXT_FC, AOI_FC])
+        outputs = feature_classes(self.gen_workspace)
+        # the region in the spatial reference of each output feature class
+        regions = {}
+        for name, work_fc in sorted(feature_classes(self.work_gdb).items()):
+            if name in skip or name not in outputs:
+                continue
+            desc = arcpy.Describe(outputs[name])
+            spatial_reference = desc.spatialReference.exportToString()
+            if spatial_reference not in regions:
+                regions[spatial_reference] = aoi_polygon(region_fc, desc.spatialReference)
+            region = regions[spatial_reference]
+            removed, added = replace_in_area(outputs[name], work_fc, region_fc, region)
+            arcpy.AddMessage(name + ": replaced " + str(removed) + " features with " + str(added))
+            if desc.shapeType == 'Polyline':
+                merged = rejoin_pieces(outputs[name], region.boundary())
+                if merged:
+                    arcpy.AddMessage(name + ": merged " + str(merged) + " line pieces at the "
+                                     "edge of the region")
+
+    def commit(self):
+        """ records the source of this run and removes the work geodatabase"""
+        if self.current is not None:
+            self.digests.save(*self.current)
+        if arcpy.Exists(self.work_gdb):
+            arcpy.Delete_management(self.work_gdb)
@@ -0,0 +1,219 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Scheduler
+# Purpose:     Runs generalization models that use different feature classes
+#              concurrently in worker processes.
+#
+#              Each model runs in its own process on a worker geodatabase that
+#              holds copies of the feature classes it reads and writes, with
+#              its own scratch geodatabase. The feature classes a model writes
+#              are merged back into the generalization workspace in stage
+#              order, so checkpoints and the run manifest stay the same as for
+#              a serial run.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import sys
+import time
+import shutil
+import multiprocessing
+import arcpy
+from Generalization_Stages import SHARED_FCS
+from Generalization_Telemetry import StageMeasure
+
+# the map generator starts its worker processes the same way, the helper is
+# in the MapGeneration folder of the repository
+_map_generation = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'MapGeneration')
+if _map_generation not in sys.path:
+    sys.path.append(_map_generation)
+from MapGenerator_Workers import configure_multiprocessing
+
+
+def create_pool(workers):
+    configure_multiprocessing()
+    return multiprocessing.Pool(workers)
+
+
+def feature_class_paths(workspace):
+    """ returns the path of every feature class relative to the workspace,
+    keyed by feature class name"""
+    paths = {}
+    for dirpath, dirnames, filenames in arcpy.da.Walk(workspace, datatype="FeatureClass"):
+        for filename in filenames:
+            paths[filename] = os.path.relpath(os.path.join(dirpath, filename), workspace)
+    return paths
+
+
+def copy_feature_classes(source, rel_paths, target):
+    """ copies feature classes into another geodatabase, recreating the
+    feature datasets they are in"""
+    for rel_path in rel_paths:
+        dataset = os.path.dirname(rel_path)
+        if dataset and not arcpy.Exists(os.path.join(target, dataset)):
+            spatial_ref = arcpy.Describe(os.path.join(source, dataset)).spatialReference
+            arcpy.CreateFeatureDataset_management(target, dataset, spatial_ref)
+        arcpy.Copy_management(os.path.join(source, rel_path), os.path.join(target, rel_path))
+
+
+def run_stage_worker(task):
+    """ runs one model in a worker process. task is a dictionary built by
+    StageScheduler, the returned dictionary is reported back to the driver"""
+    measure = StageMeasure()
+    result = {'name': task['name'], 'workspace': task['workspace'],
+              'error': None, 'messages': ''}
+    try:
+        arcpy.env.overwriteOutput = True
+        arcpy.CheckOutExtension('Spatial')
+        arcpy.CheckOutExtension('foundation')
+        arcpy.ImportToolbox(task['toolbox'])
+
+        folder = task['folder']
+        arcpy.CreateFileGDB_management(folder, os.path.basename(task['workspace']))
+        arcpy.CreateFileGDB_management(folder, os.path.basename(task['scratch']))
+        copy_feature_classes(task['source'], task['feature_classes'], task['workspace'])
+
+        tool = getattr(arcpy, task['tool'])
+        tool(*task['args'])
+        result['messages'] = arcpy.GetMessages()
+    except Exception as ex:
+        result['error'] = str(ex)
+        result['messages'] = arcpy.GetMessages()
+    result.update(measure.finish())
+    return result
+
+
+class StageScheduler(object):
+    """ runs a group of stages on a process pool. A stage starts once every
+    earlier stage it conflicts with has been merged into the workspace"""
+
+    def __init__(self, context, workers):
+        self.context = context
+        self.workers = workers
+        gen_workspace = context['gen_workspace']
+        self.folder = context.get('worker_folder') or \
+            os.path.splitext(str(gen_workspace))[0] + '_workers'
+
+    def _task(self, stage, paths):
+        folder = os.path.join(self.folder, stage.name)
+        if os.path.exists(folder):
+            shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        workspace = os.path.join(folder, 'stage.gdb')
+        scratch = os.path.join(folder, 'scratch.gdb')
+
+        args = []
+        for arg in stage.args:
+            value = self.context[arg]
+            if arg == 'gen_workspace':
+                value = workspace
+            elif arg == 'scratch_db':
+                value = scratch
+            elif arg == 'scratch_workspace' and value != 'in_memory':
+                value = scratch
+            args.append(value)
+
+        names = set(stage.reads) | set(SHARED_FCS)
+        return {'name': stage.name,
+                'tool': stage.tool,
+                'toolbox': self.context['toolbox'],
+                'args': args,
+                'folder': folder,
+                'workspace': workspace,
+                'scratch': scratch,
+                'source': str(self.context['gen_workspace']),
+                'feature_classes': sorted(paths[name] for name in names if name in paths)}
+
+    def _merge(self, stage, result, paths):
+        gen_workspace = self.context['gen_workspace']
+        for name in sorted(stage.writes):
+            rel_path = paths.get(name, name)
+            source = os.path.join(result['workspace'], rel_path)
+            target = os.path.join(gen_workspace, rel_path)
+            if not arcpy.Exists(source):
+                arcpy.AddWarning(stage.name + " did not produce " + name)
+                continue
+            if arcpy.Exists(target):
+                arcpy.DeleteFeatures_management(target)
+                arcpy.Append_management(source, target, "NO_TEST")
+            else:
+                arcpy.Copy_management(source, target)
+
+    def _cleanup(self, result):
+        for gdb in ('stage.gdb', 'scratch.gdb'):
+            path = os.path.join(os.path.dirname(result['workspace']), gdb)
+            if arcpy.Exists(path):
+                try:
+                    arcpy.Delete_management(path)
+                except:
+                    arcpy.AddWarning("Unable to delete worker workspace " + str(path))
+        shutil.rmtree(os.path.dirname(result['workspace']), ignore_errors=True)
+
+    def run(self, stages, offset, manifest, commit, telemetry):
+        """ runs stages, which start at index offset of the run, and calls
+        commit for each one in stage order once its output is merged"""
+        gen_workspace = self.context['gen_workspace']
+        paths = feature_class_paths(gen_workspace)
+        depends = [[j for j in range(i) if stages[j].conflicts(stages[i])]
+                   for i in range(len(stages))]
+
+        arcpy.AddMessage("Running " + ", ".join(stage.name for stage in stages) +
+                         " on " + str(min(self.workers, len(stages))) + " worker processes")
+        pending = list(range(len(stages)))
+        before = {}
+        running = {}
+        finished = {}
+        merged = set()
+        next_commit = 0
+        pool = create_pool(min(self.workers, len(stages)))
+        try:
+            while next_commit < len(stages):
+                progress = False
+                for i in list(pending):
+                    if len(running) >= self.workers:
+                        break
+                    if all(j in merged for j in depends[i]):
+                        stage = stages[i]
+                        arcpy.AddMessage(stage.label)
+                        manifest.mark_running(stage.name)
+                        before[i] = telemetry.counts(gen_workspace, stage.reads)
+                        running[i] = pool.apply_async(run_stage_worker,
+                                                      (self._task(stage, paths),))
+                        pending.remove(i)
+                        progress = True
+
+                for i in list(running):
+                    if running[i].ready():
+                        finished[i] = running.pop(i).get()
+                        progress = True
+
+                while next_commit in finished:
+                    stage = stages[next_commit]
+                    result = finished.pop(next_commit)
+                    arcpy.AddMessage(result['messages'])
+                    if result['error']:
+                        manifest.mark_failed(stage.name)
+                        telemetry.record(stage.name, 'failed', before.get(next_commit),
+                                         None, result['seconds'], result['cpu_seconds'],
+                                         result['peak_rss'], worker=True,
+                                         stage_rss=result['stage_rss'])
+                        arcpy.AddError(stage.name + " failed: " + result['error'])
+                        raise arcpy.ExecuteError
+                    self._merge(stage, result, paths)
+                    telemetry.record(stage.name, 'complete', before.get(next_commit),
+                                     telemetry.counts(gen_workspace, stage.reads),
+                                     result['seconds'], result['cpu_seconds'],
+                                     result['peak_rss'], worker=True,
+                                     stage_rss=result['stage_rss'])
+                    self._cleanup(result)
+                    commit(stage, offset + next_commit)
+                    merged.add(next_commit)
+                    next_commit += 1
+                    progress = True
+
+                if not progress:
+                    time.sleep(1)
+        finally:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,141 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Scratch
+# Purpose:     Chooses the scratch workspace of every generalization stage.
+#
+#              Stages whose input is small enough for the memory budget use
+#              in_memory, larger stages use a file geodatabase. The file
+#              geodatabases come from a pool that is created once per run and
+#              emptied after every stage, so intermediate data never outlives
+#              the stage that created it.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import shutil
+from contextlib import contextmanager
+import arcpy
+
+
+IN_MEMORY = 'in_memory'
+
+# default memory budget for in_memory intermediates, in megabytes
+MEMORY_BUDGET = 1024
+
+# estimated memory taken by the intermediates of a model for one input
+# feature, the models make several copies of every feature class they use
+BYTES_PER_FEATURE = 8 * 1024
+
+# scratch_workspace and scratch_db
+POOL_SIZE = 2
+
+
+def _clear_in_memory():
+    try:
+        arcpy.Delete_management(IN_MEMORY)
+    except:
+        arcpy.AddWarning("Unable to clear " + IN_MEMORY)
+
+
+class ScratchManager(object):
+    """ hands out the scratch workspaces for each stage and cleans them up
+    afterwards. memory_budget is in megabytes, 0 always uses disk"""
+
+    def __init__(self, folder, memory_budget=None, pool_size=POOL_SIZE):
+        self.folder = folder
+        self.memory_budget = MEMORY_BUDGET if memory_budget is None else memory_budget
+        self.pool_size = pool_size
+        self.free = []
+        self.created = []
+
+    def open(self):
+        """ creates the pool of scratch geodatabases"""
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        for index in range(self.pool_size):
+            self.free.append(self._create('scratch_' + str(index)))
+        arcpy.AddMessage("Scratch geodatabases in " + str(self.folder) +
+                         ", memory budget " + str(self.memory_budget) + " MB")
+        return self
+
+    def _create(self, name):
+        gdb = os.path.join(self.folder, name + '.gdb')
+        if arcpy.Exists(gdb):
+            arcpy.Delete_management(gdb)
+        arcpy.CreateFileGDB_management(self.folder, name)
+        if gdb not in self.created:
+            self.created.append(gdb)
+        return gdb
+
+    def acquire(self):
+        if self.free:
+            return self.free.pop(0)
+        return self._create('scratch_' + str(len(self.created)))
+
+    def release(self, gdb):
+        """ empties a scratch geodatabase and returns it to the pool,
+        recreating it is faster than deleting its contents one by one"""
+        self.free.append(self._create(os.path.splitext(os.path.basename(gdb))[0]))
+
+    def estimate(self, stage, workspace):
+        """ estimated memory in bytes the intermediates of a stage take, from
+        the number of features in the feature classes it reads"""
+        features = 0
+        for dirpath, dirnames, filenames in arcpy.da.Walk(workspace, datatype="FeatureClass"):
+            for filename in filenames:
+                if stage.reads and filename not in stage.reads:
+                    continue
+                path = os.path.join(dirpath, filename)
+                features += int(arcpy.GetCount_management(path).getOutput(0))
+        return features * BYTES_PER_FEATURE
+
+    @contextmanager
+    def stage(self, stage, context):
+        """ yields the context a stage runs with, with scratch workspaces
+        chosen for it, and cleans them up when the stage finishes"""
+        uses = [arg for arg in ('scratch_workspace', 'scratch_db') if arg in stage.args]
+        if not uses:
+            yield context
+            return
+
+        stage_context = dict(context)
+        acquired = []
+        in_memory = False
+        try:
+            if 'scratch_workspace' in uses:
+                estimate = self.estimate(stage, context['gen_workspace'])
+                in_memory = estimate <= self.memory_budget * 1024 * 1024
+                if in_memory:
+                    stage_context['scratch_workspace'] = IN_MEMORY
+                else:
+                    stage_context['scratch_workspace'] = self.acquire()
+                    acquired.append(stage_context['scratch_workspace'])
+                arcpy.AddMessage("Scratch workspace for " + stage.name + ": " +
+                                 str(stage_context['scratch_workspace']) + " (estimated " +
+                                 str(estimate // (1024 * 1024)) + " MB)")
+            if 'scratch_db' in uses:
+                stage_context['scratch_db'] = self.acquire()
+                acquired.append(stage_context['scratch_db'])
+            yield stage_context
+        finally:
+            if in_memory:
+                _clear_in_memory()
+            for gdb in acquired:
+                try:
+                    self.release(gdb)
+                except:
+                    arcpy.AddWarning("Unable to clean up scratch workspace " + str(gdb))
+
+    def close(self):
+        """ deletes the scratch geodatabases and in_memory"""
+        _clear_in_memory()
+        for gdb in self.created:
+            if arcpy.Exists(gdb):
+                try:
+                    arcpy.Delete_management(gdb)
+                except:
+                    arcpy.AddWarning("Unable to delete scratch workspace " + str(gdb))
+        self.free = []
+        self.created = []
+        if os.path.isdir(self.folder) and not os.listdir(self.folder):
+            shutil.rmtree(self.folder, ignore_errors=True)
@@ -0,0 +1,248 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Snapshots
+# Purpose:     Incremental copy-on-write backups of a file geodatabase.
+#
+#              Every snapshot is a complete file geodatabase folder inside the
+#              store. The files of a table (feature class) that did not change
+#              since the previous snapshot are hard links to the previous
+#              copy, only the tables that changed are copied.
+#
+#              python Generalization_Snapshots.py <store> list
+#              python Generalization_Snapshots.py <store> restore <snapshot> [<output gdb>]
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import datetime
+
+
+INDEX_NAME = 'snapshots.json'
+HASH_BLOCK = 1024 * 1024
+
+
+def _message(text):
+    try:
+        import arcpy
+        arcpy.AddMessage(text)
+    except ImportError:
+        print(text)
+
+
+def _hardlink(source, target):
+    """ creates a hard link, falls back to a copy where the file system or
+    python version does not support them"""
+    if hasattr(os, 'link'):
+        try:
+            os.link(source, target)
+            return True
+        except OSError:
+            pass
+    elif os.name == 'nt':
+        import ctypes
+        if ctypes.windll.kernel32.CreateHardLinkW(unicode(target), unicode(source), None):
+            return True
+    shutil.copy2(source, target)
+    return False
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as data:
+        block = data.read(HASH_BLOCK)
+        while block:
+            digest.update(block)
+            block = data.read(HASH_BLOCK)
+    return digest.hexdigest()
+
+
+def table_key(filename):
+    """ groups the files of a file geodatabase by table, e.g. a0000000b.gdbtable,
+    a0000000b.gdbtablx and a0000000b.spx all belong to table a0000000b"""
+    return filename.split('.')[0]
+
+
+def gdb_files(gdb):
+    """ returns the data files of a file geodatabase, lock files are skipped"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(gdb):
+        for filename in filenames:
+            if filename.endswith('.lock'):
+                continue
+            files.append(os.path.relpath(os.path.join(dirpath, filename), gdb))
+    return sorted(files)
+
+
+class SnapshotStore(object):
+    """ a folder of incremental geodatabase snapshots with an index of the
+    size, modification time and hash of every file in every snapshot"""
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.snapshots = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                self.snapshots = json.load(index_file).get('snapshots', [])
+
+    @staticmethod
+    def for_output(output_folder, output_name):
+        return SnapshotStore(os.path.join(output_folder, output_name + '_snapshots'))
+
+    def _save(self):
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump({'snapshots': self.snapshots}, index_file, indent=1, sort_keys=True)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        os.rename(temp_path, self.index_path)
+
+    def path(self, snapshot):
+        return os.path.join(self.root, snapshot['name'])
+
+    def find(self, key):
+        """ finds a snapshot by name (after_3_Hydro), model name (Hydro) or
+        stage number (3)"""
+        key = str(key)
+        for snapshot in reversed(self.snapshots):
+            if key.lower() in (snapshot['name'].lower(),
+                               snapshot['model'].lower(),
+                               str(snapshot['count'])):
+                return snapshot
+        return None
+
+    def snapshot(self, gen_workspace, model, count=None):
+        """ snapshots gen_workspace, returns the path of the snapshot, which
+        is a complete file geodatabase"""
+        if count is None:
+            name = 'after_' + model + '.gdb'
+        else:
+            name = 'after_' + str(count) + '_' + model + '.gdb'
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+
+        previous = self.snapshots[-1] if self.snapshots else None
+        previous_files = previous['files'] if previous else {}
+        previous_path = self.path(previous) if previous else None
+
+        target = os.path.join(self.root, name)
+        staging = target + '.partial'
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+
+        # a table is unchanged when every one of its files has the size and
+        # modification time recorded in the previous snapshot
+        current = gdb_files(gen_workspace)
+        stats = {}
+        groups = {}
+        for rel in current:
+            stat = os.stat(os.path.join(gen_workspace, rel))
+            stats[rel] = [stat.st_size, stat.st_mtime]
+            groups.setdefault(table_key(os.path.basename(rel)), []).append(rel)
+
+        files = {}
+        changed = []
+        linked_bytes = 0
+        copied_bytes = 0
+        for key in sorted(groups):
+            rels = groups[key]
+            same_stat = all(rel in previous_files and previous_files[rel][:2] == stats[rel]
+                            for rel in rels)
+            group_changed = False
+            for rel in rels:
+                source = os.path.join(gen_workspace, rel)
+                target_file = os.path.join(staging, rel)
+                if not os.path.isdir(os.path.dirname(target_file)):
+                    os.makedirs(os.path.dirname(target_file))
+                if same_stat:
+                    digest = previous_files[rel][2]
+                else:
+                    digest = file_hash(source)
+                if rel in previous_files and previous_files[rel][2] == digest:
+                    _hardlink(os.path.join(previous_path, rel), target_file)
+                    linked_bytes += stats[rel][0]
+                else:
+                    shutil.copy2(source, target_file)
+                    copied_bytes += stats[rel][0]
+                    group_changed = True
+                files[rel] = stats[rel] + [digest]
+            if group_changed:
+                changed.append(key)
+
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+
+        self.snapshots = [s for s in self.snapshots if s['name'] != name]
+        self.snapshots.append({'name': name,
+                               'model': model,
+                               'count': count,
+                               'source': str(gen_workspace),
+                               'created': datetime.datetime.now().replace(microsecond=0).isoformat(),
+                               'changed': changed,
+                               'files': files})
+        self._save()
+        _message("Snapshot " + name + ": " + str(len(changed)) + " of " +
+                 str(len(groups)) + " tables changed, copied " +
+                 str(copied_bytes // 1024) + " KB, linked " +
+                 str(linked_bytes // 1024) + " KB")
+        return target
+
+    def restore(self, key, output_gdb, link=False):
+        """ rebuilds a snapshot as an independent file geodatabase. With link
+        the files are hard linked, the result must then not be edited"""
+        snapshot = self.find(key)
+        if snapshot is None:
+            raise ValueError("No snapshot " + str(key) + " in " + self.root)
+        source = self.path(snapshot)
+        if os.path.exists(output_gdb):
+            shutil.rmtree(output_gdb)
+        os.makedirs(output_gdb)
+        for rel in sorted(snapshot['files']):
+            target = os.path.join(output_gdb, rel)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            if link:
+                _hardlink(os.path.join(source, rel), target)
+            else:
+                shutil.copy2(os.path.join(source, rel), target)
+        _message("Restored " + snapshot['name'] + " to " + str(output_gdb))
+        return output_gdb
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or restore generalization snapshots.")
+    parser.add_argument('store', help="snapshot folder, <output folder>\\<output name>_snapshots")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('list')
+    restore = commands.add_parser('restore')
+    restore.add_argument('snapshot', help="snapshot name, model name or stage number")
+    restore.add_argument('output', nargs='?',
+                         help="output geodatabase, defaults to the snapshot name "
+                              "in the folder containing the store")
+    restore.add_argument('--link', action='store_true',
+                         help="hard link the files instead of copying them")
+    args = parser.parse_args(argv)
+
+    store = SnapshotStore(args.store)
+    if args.command == 'list':
+        for snapshot in store.snapshots:
+            print(snapshot['name'] + "  " + snapshot['created'] + "  " +
+                  str(len(snapshot['changed'])) + " changed tables")
+        return
+    snapshot = store.find(args.snapshot)
+    if snapshot is None:
+        parser.error("no snapshot " + args.snapshot)
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.store)),
+                                         snapshot['name'])
+    store.restore(snapshot['name'], output, args.link)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
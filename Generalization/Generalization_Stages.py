@@ -0,0 +1,417 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Stages
+# Purpose:     Declarative stage list, run manifest and resumable stage runner
+#              shared by the CTM generalization drivers.
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import json
+import hashlib
+import datetime
+import arcpy
+from Generalization_Telemetry import RunTelemetry
+
+
+MANIFEST_VERSION = 1
+
+# feature classes read and written by the theme models. Models whose feature
+# classes do not overlap can run concurrently, keep these in step with the
+# models in CTM50KGeneralization.tbx
+TRANSPORTATION_FCS = ('TransportationGroundCrv', 'TransportationGroundPnt',
+                      'TransportationGroundSrf', 'TransportationWaterCrv',
+                      'TransportationWaterPnt', 'TransportationWaterSrf')
+BUILDING_FCS = ('StructurePnt', 'StructureSrf', 'SettlementSrf')
+HYDRO_FCS = ('HydrographyCrv', 'HydrographyPnt', 'HydrographySrf')
+LANDCOV_FCS = ('VegetationSrf', 'AgricultureSrf', 'PhysiographySrf')
+ELEV_FCS = ('HypsographyCrv', 'HypsographyPnt')
+
+# created by the prepare model and used by the models that follow it
+SHARED_FCS = ('AOI_Boundary_line', 'Partition')
+
+
+class Stage(object):
+    """ a single step of a generalization run. A stage either calls a model
+    from the generalization toolbox (tool) with values looked up in the run
+    context (args), or calls a python function (func) with the context.
+
+    reads and writes list the feature classes a model uses. Only models that
+    declare them can run concurrently, all other stages run on their own"""
+
+    def __init__(self, name, label, tool=None, args=(), func=None,
+                 reads=(), writes=()):
+        self.name = name
+        self.label = label
+        self.tool = tool
+        self.args = tuple(args)
+        self.func = func
+        self.reads = frozenset(reads) | frozenset(writes)
+        self.writes = frozenset(writes)
+
+    @property
+    def concurrent(self):
+        return self.tool is not None and bool(self.writes)
+
+    def conflicts(self, other):
+        """ True if the two stages cannot run at the same time"""
+        return bool(self.writes & other.reads or other.writes & self.reads)
+
+    def run(self, context):
+        if self.func is not None:
+            return self.func(context)
+        tool = getattr(arcpy, self.tool)
+        return tool(*[context[arg] for arg in self.args])
+
+
+def stage_names(stages):
+    return [stage.name for stage in stages]
+
+
+def find_stage(stages, name):
+    """ returns the index of the stage with the given name, the comparison
+    is not case sensitive"""
+    for index, stage in enumerate(stages):
+        if stage.name.lower() == str(name).lower():
+            return index
+    arcpy.AddError("Unknown stage " + str(name) + ". Valid stages are: " +
+                   ", ".join(stage_names(stages)))
+    raise arcpy.ExecuteError
+
+
+def parse_run_options(argv):
+    """ removes the --resume, --from-stage, --to-stage, --force, --workers,
+    --telemetry, --memory-budget, --incremental and --tolerance options from
+    argv so the positional tool parameters can still be read with
+    arcpy.GetParameterAsText, and returns them as a dictionary"""
+    options = {'resume': False, 'from_stage': None, 'to_stage': None,
+               'force': False, 'workers': 1, 'telemetry': 'basic', 'memory_budget': None,
+               'incremental': False, 'tolerance': None}
+    remaining = []
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        value = None
+        if arg.startswith('--') and '=' in arg:
+            arg, value = arg.split('=', 1)
+        if arg in ('--resume', '--incremental', '--force'):
+            options[arg[2:]] = True
+        elif arg in ('--from-stage', '--to-stage', '--workers', '--telemetry',
+                     '--memory-budget', '--tolerance'):
+            if value is None:
+                index += 1
+                if index >= len(argv):
+                    arcpy.AddError(arg + " requires a value")
+                    raise arcpy.ExecuteError
+                value = argv[index]
+            options[arg[2:].replace('-', '_')] = value
+        else:
+            remaining.append(argv[index])
+        index += 1
+    argv[:] = remaining
+    try:
+        options['workers'] = max(1, int(options['workers']))
+    except ValueError:
+        arcpy.AddError("--workers must be a number")
+        raise arcpy.ExecuteError
+    if options['memory_budget'] is not None:
+        try:
+            options['memory_budget'] = max(0, int(options['memory_budget']))
+        except ValueError:
+            arcpy.AddError("--memory-budget must be a number of megabytes")
+            raise arcpy.ExecuteError
+    return options
+
+
+def _hash_path(digest, path):
+    """ adds the size and modification time of a file, or of every file in
+    a folder (file geodatabases are folders), to the digest"""
+    if os.path.isdir(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.lock'):
+                    continue
+                full = os.path.join(dirpath, filename)
+                stat = os.stat(full)
+                digest.update(os.path.relpath(full, path).encode('utf-8'))
+                digest.update(str((stat.st_size, int(stat.st_mtime))).encode('utf-8'))
+    elif os.path.isfile(path):
+        stat = os.stat(path)
+        digest.update(str((stat.st_size, int(stat.st_mtime))).encode('utf-8'))
+
+
+def _storage_path(path):
+    """ returns the file or folder on disk holding a dataset, e.g. the file
+    geodatabase for a feature class inside it"""
+    path = str(path)
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    return path or None
+
+
+def input_fingerprint(*inputs):
+    """ fingerprints the inputs of a run from their paths, sizes and
+    modification times so a rerun can tell whether a manifest still applies"""
+    digest = hashlib.sha1()
+    for item in inputs:
+        digest.update(str(item).encode('utf-8'))
+        storage = _storage_path(item) if item else None
+        if storage:
+            _hash_path(digest, storage)
+    return digest.hexdigest()
+
+
+def _now():
+    return datetime.datetime.now().replace(microsecond=0).isoformat()
+
+
+class RunManifest(object):
+    """ records which stages of a run completed against which input
+    fingerprint. It is written next to the generalization workspace"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as manifest_file:
+                    self.data = json.load(manifest_file)
+            except ValueError:
+                arcpy.AddWarning("Ignoring unreadable run manifest " + str(path))
+                self.data = {}
+        if self.data.get('version') != MANIFEST_VERSION:
+            self.data = {}
+
+    @staticmethod
+    def path_for(gen_workspace):
+        return os.path.splitext(str(gen_workspace))[0] + '_manifest.json'
+
+    @property
+    def fingerprint(self):
+        return self.data.get('fingerprint')
+
+    def reset(self, fingerprint, stages):
+        self.data = {'version': MANIFEST_VERSION,
+                     'fingerprint': fingerprint,
+                     'created': _now(),
+                     'order': stage_names(stages),
+                     'stages': {}}
+        self.save()
+
+    def stage(self, name):
+        return self.data.get('stages', {}).get(name, {})
+
+    def status(self, name):
+        return self.stage(name).get('status')
+
+    def is_complete(self, name):
+        return self.status(name) == 'complete'
+
+    def checkpoint(self, name):
+        checkpoint = self.stage(name).get('checkpoint')
+        if checkpoint and arcpy.Exists(checkpoint):
+            return checkpoint
+        return None
+
+    def _update(self, name, **values):
+        entry = self.data.setdefault('stages', {}).setdefault(name, {})
+        entry.update(values)
+        self.save()
+
+    def mark_running(self, name):
+        self._update(name, status='running', started=_now(), finished=None,
+                     checkpoint=None)
+
+    def mark_complete(self, name, checkpoint=None):
+        self._update(name, status='complete', finished=_now(),
+                     checkpoint=checkpoint)
+
+    def mark_failed(self, name):
+        self._update(name, status='failed', finished=_now())
+
+    def invalidate_from(self, stages, start):
+        """ forgets the results of every stage from start onwards, they are
+        about to be rerun on the workspace"""
+        for stage in stages[start:]:
+            self.data.get('stages', {}).pop(stage.name, None)
+        self.save()
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(self.data, manifest_file, indent=2, sort_keys=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
+
+
+class RunPlan(object):
+    """ the stages a run executes and how the workspace has to be prepared"""
+
+    def __init__(self, start, end, fresh, restore_from=None):
+        self.start = start
+        self.end = end
+        self.fresh = fresh
+        self.restore_from = restore_from
+
+    @property
+    def complete(self):
+        """ True when every planned stage completed in a previous run"""
+        return self.start > self.end
+
+
+def plan_run(stages, manifest, fingerprint, options, gen_workspace):
+    """ works out which stages to run from the run options and the manifest
+    of the previous run"""
+    end = len(stages) - 1
+    if options.get('to_stage'):
+        end = find_stage(stages, options['to_stage'])
+
+    from_stage = options.get('from_stage')
+    resume = options.get('resume') or from_stage
+
+    if not resume:
+        return RunPlan(0, end, True)
+
+    if not arcpy.Exists(gen_workspace) or manifest.fingerprint is None:
+        if from_stage:
+            arcpy.AddError("Cannot start from stage " + str(from_stage) +
+                           ", there is no previous run in " + str(gen_workspace))
+            raise arcpy.ExecuteError
+        arcpy.AddWarning("No previous run to resume, starting a new run.")
+        return RunPlan(0, end, True)
+
+    if manifest.fingerprint != fingerprint:
+        if from_stage:
+            arcpy.AddError("The inputs changed since the previous run, cannot "
+                           "start from stage " + str(from_stage) + ".")
+            raise arcpy.ExecuteError
+        arcpy.AddWarning("The inputs changed since the previous run, "
+                         "starting a new run.")
+        return RunPlan(0, end, True)
+
+    if from_stage:
+        start = find_stage(stages, from_stage)
+        for stage in stages[:start]:
+            if not manifest.is_complete(stage.name):
+                arcpy.AddError("Cannot start from stage " + stages[start].name +
+                               ", stage " + stage.name + " has not completed.")
+                raise arcpy.ExecuteError
+    else:
+        start = 0
+        while start < len(stages) and manifest.is_complete(stages[start].name):
+            start += 1
+
+    if start == 0:
+        return RunPlan(0, end, True)
+
+    if start > end:
+        arcpy.AddMessage("Every stage up to " + stages[end].name + " completed in "
+                         "the previous run, nothing to do.")
+        return RunPlan(start, end, False)
+
+    # the workspace only matches the last good checkpoint when nothing ran
+    # after it, otherwise it has to be rolled back
+    restore_from = None
+    dirty = [stage.name for stage in stages[start:]
+             if manifest.status(stage.name) is not None]
+    if dirty:
+        restore_from = manifest.checkpoint(stages[start - 1].name)
+        if restore_from is None and from_stage and not options.get('force'):
+            arcpy.AddError("No checkpoint was kept after stage " +
+                           stages[start - 1].name + ", stage(s) " + ", ".join(dirty) +
+                           " already changed the workspace. Run with backups "
+                           "enabled to keep checkpoints, or add --force to rerun "
+                           "them on the current workspace.")
+            raise arcpy.ExecuteError
+        if restore_from is None:
+            arcpy.AddWarning("No checkpoint was kept after stage " +
+                             stages[start - 1].name + ", stage(s) " +
+                             ", ".join(dirty) + " will be rerun on the "
+                             "current workspace. Run with backups enabled to "
+                             "keep checkpoints.")
+    return RunPlan(start, end, False, restore_from)
+
+
+def _run_stage(stage, context, scratch):
+    """ runs a stage in this process and returns its messages, which are
+    read before the scratch workspaces are cleaned up"""
+    if scratch is None:
+        stage.run(context)
+        return arcpy.GetMessages()
+    with scratch.stage(stage, context) as stage_context:
+        stage.run(stage_context)
+        return arcpy.GetMessages()
+
+
+def run_stages(stages, context, manifest, plan, backup=None, restore=None,
+               workers=1, telemetry=None, scratch=None):
+    """ runs the planned stages and records each completed stage in the
+    manifest. backup is called after every stage and returns the path of
+    the checkpoint it created, if any. restore rebuilds the workspace from
+    a checkpoint, by default the checkpoint is copied. telemetry records
+    what every stage cost, see Generalization_Telemetry. scratch chooses the
+    scratch workspaces of each stage, see Generalization_Scratch.
+
+    With more than one worker, consecutive stages that declare their feature
+    classes are handed to the scheduler and run in worker processes"""
+    if plan.restore_from:
+        arcpy.AddMessage("Restoring " + str(context['gen_workspace']) +
+                         " from checkpoint " + str(plan.restore_from))
+        if restore is not None:
+            restore(plan.restore_from, context['gen_workspace'])
+        else:
+            arcpy.Delete_management(context['gen_workspace'])
+            arcpy.Copy_management(plan.restore_from, context['gen_workspace'])
+
+    if telemetry is None:
+        telemetry = RunTelemetry()
+
+    manifest.invalidate_from(stages, plan.start)
+    for stage in stages[:plan.start]:
+        arcpy.AddMessage("Skipping " + stage.name + ", completed in a previous run")
+
+    def commit(stage, index):
+        checkpoint = None
+        if backup is not None:
+            checkpoint = backup(stage, index)
+        manifest.mark_complete(stage.name, checkpoint)
+
+    index = plan.start
+    while index <= plan.end:
+        stage = stages[index]
+
+        last = index
+        if workers > 1:
+            while (last + 1 <= plan.end and stages[last].concurrent and
+                   stages[last + 1].concurrent):
+                last += 1
+        if last > index:
+            from Generalization_Scheduler import StageScheduler
+            scheduler = StageScheduler(context, workers)
+            scheduler.run(stages[index:last + 1], index, manifest, commit, telemetry)
+            index = last + 1
+            continue
+
+        manifest.mark_running(stage.name)
+        arcpy.AddMessage(stage.label)
+        # stages that do not declare their feature classes may change any
+        started = telemetry.start(stage.name, context['gen_workspace'],
+                                  stage.reads or None)
+        try:
+            messages = _run_stage(stage, context, scratch)
+        except:
+            manifest.mark_failed(stage.name)
+            telemetry.finish(started, 'failed')
+            raise
+        arcpy.AddMessage(messages)
+        telemetry.finish(started)
+
+        commit(stage, index)
+        index += 1
+
+    return all(manifest.is_complete(stage.name) for stage in stages)
@@ -0,0 +1,282 @@
+#-------------------------------------------------------------------------------
+# Name:        Generalization_Telemetry
+# Purpose:     Records what every stage of a generalization run costs.
+#
+#              For each stage the wall time, CPU time, the most memory
+#              sampled while it ran and the peak memory of the process
+#              running it are recorded and, depending on the level,
+#              the number of features and vertices of each feature class
+#              before and after the stage. Records are appended to a JSON
+#              lines log next to the generalization workspace and a summary
+#              table is written at the end of the run.
+#
+#              Levels: off, basic (times and memory), counts (adds feature
+#              counts) and vertices (adds vertex counts, reads every geometry)
+#
+# Created:     18/10/2026
+# Licence:     Apache License, Version 2.0
+#-------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import datetime
+import threading
+import arcpy
+
+
+LEVELS = ('off', 'basic', 'counts', 'vertices')
+
+
+def cpu_seconds():
+    """ user and system CPU time of this process"""
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _memory():
+    """ (current, peak) resident memory of this process in bytes, either
+    is None where it cannot be read"""
+    try:
+        if os.name == 'nt':
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD),
+                            ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t),
+                            ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t),
+                            ('PeakPagefileUsage', ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters),
+                                                        counters.cb):
+                return int(counters.WorkingSetSize), int(counters.PeakWorkingSetSize)
+            return None, None
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak = int(peak) if sys.platform == 'darwin' else int(peak) * 1024
+        current = None
+        if os.path.exists('/proc/self/statm'):
+            with open('/proc/self/statm') as statm:
+                current = int(statm.read().split()[1]) * resource.getpagesize()
+        return current, peak
+    except Exception:
+        return None, None
+
+
+def current_rss():
+    """ resident memory of this process in bytes, or None where it cannot
+    be read"""
+    return _memory()[0]
+
+
+def peak_rss():
+    """ peak resident memory of this process since it started in bytes, or
+    None where it cannot be read"""
+    return _memory()[1]
+
+
+def feature_classes(workspace, names=None):
+    """ returns the paths of the feature classes in a workspace keyed by
+    name, only the named ones when names is given"""
+    paths = {}
+    for dirpath, dirnames, filenames in arcpy.da.Walk(workspace, datatype="FeatureClass"):
+        for filename in filenames:
+            if names is None or filename in names:
+                paths[filename] = os.path.join(dirpath, filename)
+    return paths
+
+
+def count_features(workspace, names=None, vertices=False):
+    """ returns {name: [features, vertices]} for the feature classes of a
+    workspace, vertices is None unless they are counted"""
+    counts = {}
+    for name, path in feature_classes(workspace, names).items():
+        if vertices:
+            features = 0
+            points = 0
+            with arcpy.da.SearchCursor(path, ['SHAPE@']) as cursor:
+                for row in cursor:
+                    features += 1
+                    if row[0] is not None:
+                        points += row[0].pointCount
+            counts[name] = [features, points]
+        else:
+            counts[name] = [int(arcpy.GetCount_management(path).getOutput(0)), None]
+    return counts
+
+
+class StageMeasure(object):
+    """ measures the stage running in this process. The peak memory of the
+    process covers everything it ran before, so the memory of the stage is
+    sampled every SAMPLE_SECONDS by a thread while it runs"""
+
+    SAMPLE_SECONDS = 0.25
+
+    def __init__(self):
+        self.wall = time.time()
+        self.cpu = cpu_seconds()
+        self.stage_rss = current_rss()
+        self._stop = threading.Event()
+        self._sampler = None
+        if self.stage_rss is not None:
+            self._sampler = threading.Thread(target=self._sample)
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.SAMPLE_SECONDS):
+            self._update(current_rss())
+
+    def _update(self, rss):
+        if rss is not None and rss > self.stage_rss:
+            self.stage_rss = rss
+
+    def finish(self):
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._update(current_rss())
+        return {'seconds': round(time.time() - self.wall, 3),
+                'cpu_seconds': round(cpu_seconds() - self.cpu, 3),
+                'stage_rss': self.stage_rss,
+                'peak_rss': peak_rss()}
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return ''
+    return str(datetime.timedelta(seconds=int(round(seconds))))
+
+
+def _format_bytes(value):
+    if value is None:
+        return ''
+    return str(value // (1024 * 1024)) + ' MB'
+
+
+class RunTelemetry(object):
+    """ collects the stage records of a run and appends them to the log.
+    Without a path the records are only reported as messages"""
+
+    def __init__(self, path=None, level='basic', run_id=None):
+        if level not in LEVELS:
+            arcpy.AddWarning("Unknown telemetry level " + str(level) + ", using basic")
+            level = 'basic'
+        self.path = path if level != 'off' else None
+        self.level = level
+        self.run_id = run_id or datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.records = []
+        self.started = time.time()
+
+    @staticmethod
+    def path_for(gen_workspace):
+        return os.path.splitext(str(gen_workspace))[0] + '_telemetry.jsonl'
+
+    def log_to(self, path):
+        """ sets the log once the workspace is known, ignored when off"""
+        self.path = path if self.level != 'off' else None
+
+    def counts(self, workspace, names=None):
+        """ the feature counts recorded around a stage at this level"""
+        if self.level not in ('counts', 'vertices') or not workspace:
+            return None
+        try:
+            return count_features(workspace, names, self.level == 'vertices')
+        except Exception as ex:
+            arcpy.AddWarning("Unable to count features in " + str(workspace) + ": " + str(ex))
+            return None
+
+    def start(self, name, workspace=None, names=None):
+        """ starts measuring a stage running in this process, names limits
+        the feature classes counted"""
+        return {'name': name, 'workspace': workspace, 'names': names,
+                'before': self.counts(workspace, names), 'measure': StageMeasure()}
+
+    def finish(self, started, status='complete'):
+        values = started['measure'].finish()
+        return self.record(started['name'], status, started['before'],
+                           self.counts(started['workspace'], started['names']),
+                           **values)
+
+    def record(self, name, status, before=None, after=None, seconds=None,
+               cpu_seconds=None, peak_rss=None, worker=False, stage_rss=None):
+        """ adds the record of a stage, stages run by the scheduler are
+        measured in the worker and recorded by the driver. stage_rss is the
+        most memory sampled during the stage, peak_rss the peak of the
+        process running it since the process started"""
+        entry = {'run': self.run_id,
+                 'stage': name,
+                 'status': status,
+                 'finished': datetime.datetime.now().replace(microsecond=0).isoformat(),
+                 'seconds': seconds,
+                 'cpu_seconds': cpu_seconds,
+                 'stage_rss': stage_rss,
+                 'peak_rss': peak_rss,
+                 'worker': worker,
+                 'feature_classes': self._changes(before, after)}
+        self.records.append(entry)
+        arcpy.AddMessage(name + " took " + _format_seconds(seconds) +
+                         " (CPU " + _format_seconds(cpu_seconds) + ", stage memory " +
+                         (_format_bytes(stage_rss) or 'unknown') + ", process peak memory " +
+                         (_format_bytes(peak_rss) or 'unknown') + ")")
+        self._write(entry)
+        return entry
+
+    @staticmethod
+    def _changes(before, after):
+        if before is None and after is None:
+            return None
+        before = before or {}
+        after = after or {}
+        changes = {}
+        for name in sorted(set(before) | set(after)):
+            old = before.get(name, [None, None])
+            new = after.get(name, [None, None])
+            changes[name] = {'features_before': old[0], 'features_after': new[0],
+                             'vertices_before': old[1], 'vertices_after': new[1]}
+        return changes
+
+    def _write(self, entry):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'a') as log:
+                log.write(json.dumps(entry, sort_keys=True) + '\n')
+        except (IOError, OSError) as ex:
+            arcpy.AddWarning("Unable to write telemetry to " + str(self.path) + ": " + str(ex))
+
+    def summary(self):
+        """ reports a table of the stages of this run and writes the total
+        to the log"""
+        total = time.time() - self.started
+        rows = [('Stage', 'Status', 'Wall', 'CPU', 'Stage memory', 'Process peak', 'Features')]
+        for entry in self.records:
+            features = ''
+            if entry['feature_classes']:
+                before = sum(c['features_before'] or 0 for c in entry['feature_classes'].values())
+                after = sum(c['features_after'] or 0 for c in entry['feature_classes'].values())
+                features = str(before) + ' -> ' + str(after)
+            rows.append((entry['stage'], entry['status'],
+                         _format_seconds(entry['seconds']),
+                         _format_seconds(entry['cpu_seconds']),
+                         _format_bytes(entry['stage_rss']),
+                         _format_bytes(entry['peak_rss']), features))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            arcpy.AddMessage("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+        arcpy.AddMessage("Took Total " + _format_seconds(total))
+        self._write({'run': self.run_id, 'stage': None, 'status': 'total',
+                     'seconds': round(total, 3), 'peak_rss': peak_rss(),
+                     'finished': datetime.datetime.now().replace(microsecond=0).isoformat()})
+        return total
@@ -9,9 +9,18 @@
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
 import os
+import sys
 import arcpy
-import datetime
 import arcpywmx
+from Generalization_Edges import set_edge_hierarchy, aoi_polygon, split_at_boundary
+from Generalization_Finalize import finalize
+from Generalization_Scratch import ScratchManager
+from Generalization_Snapshots import SnapshotStore
+from Generalization_Telemetry import RunTelemetry
+from Generalization_Stages import (Stage, RunManifest, RunPlan, run_stages,
+                                   parse_run_options, TRANSPORTATION_FCS,
+                                   BUILDING_FCS, HYDRO_FCS, LANDCOV_FCS,
+                                   ELEV_FCS)
 
 
 def getfcs(in_workspace):
@@ -30,22 +39,22 @@ def getfcs(in_workspace):
 
 
 
-def setEdgeHierarchy(fcs, aoi, hier_field):
-    """ sets the hierarchy of all features touching the aoi to 0"""
+def setEdgeHierarchy(fcs, aoi, hier_field, workers=1):
+    """ sets the hierarchy of all features touching the boundary of the aoi
+    to 0. aoi can be the job polygon or its boundary lines"""
     arcpy.AddMessage("Setting hierarcy for edge features")
-    for fc in fcs:
-        fields = [f.name for f in arcpy.ListFields(fc)]
-        if hier_field in fields:
-            lyr = arcpy.MakeFeatureLayer_management(fc, "layera")
-            arcpy.SelectLayerByLocation_management(lyr, "INTERSECT", aoi)
-            arcpy.CalculateField_management(lyr, hier_field, "0")
-            arcpy.Delete_management(lyr)
+    return set_edge_hierarchy(fcs, aoi, hier_field, 0, workers)
 
 
 
-def splitLines(in_workspace, job_aoi, names=[]):
-    """ gets a list of all feature classes in a database, includes feature
-    classes inside and outside of the feature datasets"""
+def splitLines(in_workspace, job_aoi, names=[], boundary_only=True):
+    """ splits the lines of the named line feature classes at the boundary
+    of the job aoi.
+
+    With boundary_only the lines crossing the boundary and the multipart
+    lines are split in place, the other lines are left as they are. The
+    lines are single part afterwards either way. Otherwise the feature
+    class is rebuilt from an identity with the aoi"""
 
     fcs = []
 
@@ -55,6 +64,22 @@ def splitLines(in_workspace, job_aoi, names=[]):
         for filename in filenames:
             if filename in names:
                 fc = os.path.join(dirpath, filename)
+                fcs.append(fc)
+                desc = arcpy.Describe(fc)
+                if desc.shapeType != 'Polyline':
+                    arcpy.AddWarning("Not splitting " + filename + ", it is not a line feature class")
+                    continue
+
+                if boundary_only:
+                    polygon = aoi_polygon(job_aoi, desc.spatialReference)
+                    if polygon is None:
+                        arcpy.AddWarning("The job aoi has no polygon, not splitting " + filename)
+                        continue
+                    split, inserted = split_at_boundary(fc, polygon)
+                    arcpy.AddMessage("Split " + str(split) + " features of " + filename +
+                                     " at the aoi boundary, added " + str(inserted))
+                    continue
+
                 split = arcpy.Identity_analysis(fc, job_aoi, "in_memory\\split_"+filename)
                 single = arcpy.MultipartToSinglepart_management(split, "in_memory\\split"+filename)
                 arcpy.DeleteFeatures_management(fc)
@@ -67,40 +92,90 @@ def splitLines(in_workspace, job_aoi, names=[]):
     return fcs
 
 
-def updateOverrides(fcs):
-    """ loops through all feature classes and applies overrides to the geometry"""
-    for fc in fcs:
-        arcpy.env.overwriteOutput = True
-        arcpy.env.addOutputsToMap = False
-        desc = arcpy.Describe(fc)
-        rep_name = ""
-        if hasattr(desc, "representations"):
-            reps = desc.representations
-            for rep in reps:
-                rep_name = rep.name
-                arcpy.AddMessage("Applying Rep Overrides for " + str(fc))
-                arcpy.UpdateOverride_cartography(fc, rep_name, "BOTH")
-        arcpy.AddMessage("Repairing Geometry for " + str(fc))
-        arcpy.RepairGeometry_management(fc)
-
+def updateOverrides(fcs, workers=1):
+    """ applies overrides to the geometry and repairs the geometry of all
+    feature classes, concurrently with more than one worker"""
+    finalize(fcs, workers)
     return fcs
 
 
 
 
 
-def create_backup(backup, gen_workspace, output_folder, model, count):
+def create_backup(backup, gen_workspace, store, model, count):
+    """ snapshots the workspace into the snapshot store, only the feature
+    classes changed by the model are copied"""
     if backup == 'true':
         arcpy.AddMessage("Creating Backup")
-        out = output_folder + '\\after_' +  model + '.gdb'
-        arcpy.Copy_management(gen_workspace, out)
+        store.snapshot(gen_workspace, model)
     count += 1
     return count
 
+def split_transportation(context):
+    splitLines(context['gen_workspace'], context['job_lyr'], names=['TransportationGroundCrv'])
+
+
+def edge_hierarchy(context):
+    #update hierarchy for edge features
+    feature_classes = getfcs(context['gen_workspace'])
+    setEdgeHierarchy(feature_classes, context['job_lyr'], "Hierarchy",
+                     context.get('workers', 1))
+
+
+# the generalization steps in the order they are run. The theme models
+# declare the feature classes they use so they can run concurrently
+STAGES = [
+    Stage('PrepareData', "Running Prepare Model",
+          'PrepareData_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace', 'aoi_fc', 'vvs']),
+    Stage('SplitLines', "Prepping Transportation", func=split_transportation),
+    Stage('Transportation', "Running Transportation Model",
+          'Transportation_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace'],
+          writes=TRANSPORTATION_FCS),
+    Stage('Building', "Running Building Model",
+          'Buildings_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace'],
+          reads=['TransportationGroundCrv'], writes=BUILDING_FCS),
+    Stage('Hydro', "Running Hydrography Model",
+          'Hydro_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace', 'scratch_db'],
+          writes=HYDRO_FCS),
+    Stage('LandCov', "Running Land Cover Model",
+          'LandCov_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace', 'scratch_db'],
+          writes=LANDCOV_FCS),
+    Stage('Elev', "Running Elevation Model",
+          'Elev_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_db'],
+          writes=ELEV_FCS),
+    Stage('Symbology', "Running Apply Symbology Model",
+          'ApplySymbology_CTM50KGeneralization',
+          ['gen_workspace', 'product_library', 'vvs']),
+    Stage('EdgeHierarchy', "Updating hierarchy for edge features", func=edge_hierarchy),
+    Stage('ResolveLine', "Running Line Conflicts Model",
+          'ResolveLine_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace']),
+    Stage('ResolveStructure', "Running Structure Conflicts Model",
+          'ResolveStructure_CTM50KGeneralization',
+          ['gen_workspace']),
+    Stage('ResolveHydro', "Running Hydro Conflicts Model",
+          'ResolveHydro_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_db']),
+    Stage('ResolveVeg', "Running Vegetation Conflicts Model",
+          'ResolveVeg_CTM50KGeneralization',
+          ['gen_workspace', 'scratch_workspace']),
+]
+
+
 def main():
 
     arcpy.env.overwriteOutput = True
 
+    # --workers, --telemetry and --memory-budget are removed from the
+    # arguments before the tool parameters are read
+    options = parse_run_options(sys.argv)
+
     if arcpy.CheckExtension("Spatial") != "Available":
 
         arcpy.AddError("The Spatial Analyst Extension is not available.")
@@ -137,6 +212,8 @@ def main():
     arcpy.AddMessage(backup)
 
     count = 0
+    telemetry = RunTelemetry(level=options['telemetry'])
+    scratch = None
 
 
     try:
@@ -182,7 +259,7 @@ def main():
 
                     #input_path = os.path.dirname(input_workspace)
 
-                    start_start = datetime.datetime.now().replace(microsecond=0)
+                    telemetry.log_to(RunTelemetry.path_for(gen_workspace))
 
                     #create the output database
                     arcpy.AddMessage("Creating generalization database")
@@ -195,142 +272,42 @@ def main():
                     #scratch_workspace = arcpy.CreateFileGDB_management(output_folder, "Scratch")
                     scratch_workspace = 'in_memory'
 
-                    #Run the prepare script
-                    arcpy.AddMessage("Running Prepare Model")
-
-                    start = datetime.datetime.now().replace(microsecond=0)
-
-                    arcpy.PrepareData_CTM50KGeneralization(gen_workspace, scratch_workspace, aoi_fc, vvs)
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-                    arcpy.AddMessage("Prepping Transportation")
-                    splitLines(gen_workspace, job_lyr, names=['TransportationGroundCrv'])
-
-                    #Run the transportation script
-                    arcpy.AddMessage("Running Transportation Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.Transportation_CTM50KGeneralization(gen_workspace, scratch_workspace)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the buildings script
-                    arcpy.AddMessage("Running Building Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.Buildings_CTM50KGeneralization(gen_workspace, scratch_workspace)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the hydro script
-                    arcpy.AddMessage("Running Hydrography Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.Hydro_CTM50KGeneralization(gen_workspace, scratch_workspace, scratch_db)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the Land Cover script
-                    arcpy.AddMessage("Running Land Cover Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.arcpy.LandCov_CTM50KGeneralization(gen_workspace, scratch_workspace, scratch_db)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the Elev script
-                    arcpy.AddMessage("Running Elevation Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.Elev_CTM50KGeneralization(gen_workspace, scratch_db)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the Symbology script
-                    arcpy.AddMessage("Running Apply Symbology Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.ApplySymbology_CTM50KGeneralization(gen_workspace, product_library, vvs)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-                    #update hierarchy for edge features
-                    feature_classes = getfcs(gen_workspace)
-                    job_lines = arcpy.FeatureToLine_management(job_lyr, "job_lines")
-                    setEdgeHierarchy(feature_classes, job_lines, "Hierarchy")
-
-
-
-                    #Run the line conflicts script
-                    arcpy.AddMessage("Running Line Conflicts Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.ResolveLine_CTM50KGeneralization(gen_workspace, scratch_workspace)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the point conflicts script
-                    arcpy.AddMessage("Running Structure Conflicts Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.ResolveStructure_CTM50KGeneralization(gen_workspace)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the hydro conflicts script
-                    arcpy.AddMessage("Running Hydro Conflicts Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.ResolveHydro_CTM50KGeneralization(gen_workspace, scratch_db)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
-                    #Run the veg conflicts script
-                    arcpy.AddMessage("Running Vegetation Conflicts Model")
-                    start = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.ResolveVeg_CTM50KGeneralization(gen_workspace, scratch_workspace)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    end = datetime.datetime.now().replace(microsecond=0)
-                    arcpy.AddMessage(arcpy.GetMessages())
-                    arcpy.AddMessage("Took " + str(end - start))
-
-
-
+                    context = {'toolbox': tbx,
+                               'gen_workspace': gen_workspace,
+                               'scratch_workspace': scratch_workspace,
+                               'scratch_db': scratch_db,
+                               'aoi_fc': aoi_fc,
+                               'job_lyr': job_lyr,
+                               'product_library': product_library,
+                               'vvs': vvs,
+                               'workers': options['workers']}
+
+                    # in_memory or a scratch geodatabase is chosen for each
+                    # model from the size of its input
+                    scratch = ScratchManager(os.path.join(output_folder, job_name + '_scratch'),
+                                             options['memory_budget']).open()
+
+                    store = SnapshotStore.for_output(output_folder, job_name)
+                    manifest = RunManifest(RunManifest.path_for(gen_workspace))
+                    manifest.reset(None, STAGES)
+
+                    def backup_stage(stage, index):
+                        create_backup(backup, gen_workspace, store, stage.name, index)
+
+                    run_stages(STAGES, context, manifest, RunPlan(0, len(STAGES) - 1, True),
+                               backup_stage, workers=options['workers'],
+                               telemetry=telemetry, scratch=scratch)
+
+                    # restore <job>after_generalization.gdb on demand with
+                    # Generalization_Snapshots.py <job>_snapshots restore generalization
                     arcpy.AddMessage("Creating Backup")
-                    out = output_folder + '\\' + job_name + 'after_generalization.gdb'
-                    arcpy.Copy_management(gen_workspace, out)
+                    store.snapshot(gen_workspace, 'generalization')
 
                     #final updates
+                    started = telemetry.start('Finalize')
                     feature_classes = getfcs(gen_workspace)
-                    updateOverrides(feature_classes)
+                    updateOverrides(feature_classes, options['workers'])
+                    telemetry.finish(started)
 
 
                 else:
@@ -344,10 +321,10 @@ def main():
         arcpy.AddError(arcpy.GetMessages(2))
 
     finally:
+        if scratch is not None:
+            scratch.close()
 
-        end_end = datetime.datetime.now().replace(microsecond=0)
-
-        arcpy.AddMessage("Took Total " + str(end_end - start_start))
+        telemetry.summary()
 
 
 
@@ -0,0 +1,95 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Assembles a multi-page PDF map book while the sheets are generated.
+
+Pages are appended as soon as the sheet before them is in the book, sheets
+that finish early wait in a buffer so the book keeps the order of the
+sheets. The book is saved every few pages and the single page PDFs saved
+into it are deleted then, so they do not pile up until the end."""
+import os
+import arcpy
+
+# pages appended between saves of the book
+SAVE_EVERY = 10
+
+
+class MapBookWriter(object):
+    """Writes the pages of a map book in sheet order, sheets are numbered
+    from 0 and every number has to be added or skipped once"""
+
+    def __init__(self, path, save_every=SAVE_EVERY):
+        self.path = path
+        self.save_every = save_every
+        self.pdfdoc = None
+        self.next_index = 0
+        # pages that finished before the sheets in front of them
+        self.waiting = {}
+        # pages appended since the book was last saved
+        self.unsaved = []
+        self.pages = 0
+
+    def add(self, index, pdf_path):
+        """Adds the single page PDF of a sheet"""
+        self.waiting[index] = pdf_path
+        self._append_ready()
+
+    def skip(self, index):
+        """Records that a sheet has no page, such as a sheet that failed"""
+        self.waiting[index] = None
+        self._append_ready()
+
+    def _append_ready(self):
+        while self.next_index in self.waiting:
+            pdf_path = self.waiting.pop(self.next_index)
+            self.next_index += 1
+            if pdf_path:
+                self._append(pdf_path)
+
+    def _append(self, pdf_path):
+        if self.pdfdoc is None:
+            if self.pages:
+                self.pdfdoc = arcpy.mapping.PDFDocumentOpen(self.path)
+            else:
+                self.pdfdoc = arcpy.mapping.PDFDocumentCreate(self.path)
+        self.pdfdoc.appendPages(pdf_path)
+        self.unsaved.append(pdf_path)
+        self.pages += 1
+        if len(self.unsaved) >= self.save_every:
+            self._save()
+
+    def _save(self):
+        """Saves the book and deletes the pages that are now in it"""
+        self.pdfdoc.saveAndClose()
+        self.pdfdoc = None
+        for pdf_path in self.unsaved:
+            try:
+                arcpy.Delete_management(pdf_path)
+            except:
+                arcpy.AddWarning("Unable to delete " + pdf_path)
+        self.unsaved = []
+
+    def close(self):
+        """Appends the pages still waiting for a sheet that never arrived
+        and saves the book. Returns the path of the book, or None when it
+        has no pages"""
+        for index in sorted(self.waiting):
+            if self.waiting[index]:
+                self._append(self.waiting[index])
+        self.waiting = {}
+        if self.pdfdoc is not None:
+            self._save()
+        if not self.pages:
+            return None
+        return self.path
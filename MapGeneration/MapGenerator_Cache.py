@@ -0,0 +1,555 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Caches shared by the map generation tools.
+
+The caches live in a folder that is kept between runs, CTM_MAP_CACHE
+overrides the default folder in the temp directory."""
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import itertools
+import arcpy
+import MapGenerator_Index
+
+
+def cache_root():
+    return os.environ.get('CTM_MAP_CACHE') or \
+        os.path.join(tempfile.gettempdir(), 'ctm_map_cache')
+
+
+def _hash(*values):
+    digest = hashlib.sha1()
+    for value in values:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _remove(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        arcpy.AddWarning("Unable to remove " + path + " from the cache.")
+
+
+class TemplateCache(object):
+    """Map document templates with their layers resourced to a production
+    workspace. A template is resourced once for each production workspace
+    and again when the template changes, maps start from a copy of it"""
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or cache_root(), 'templates')
+
+    def _names(self, template, workspace):
+        """The file name of the cached template, the first part identifies
+        the template and workspace, the second the version of the template"""
+        template = os.path.normcase(os.path.abspath(str(template)))
+        workspace = os.path.normcase(os.path.abspath(str(workspace)))
+        stat = os.stat(template)
+        prefix = _hash(template, workspace)[:16]
+        return prefix, prefix + '_' + _hash(stat.st_mtime, stat.st_size)[:16] + '.mxd'
+
+    def resourced(self, template, workspace):
+        """Returns the path of the cached template resourced to workspace,
+        creating it when needed"""
+        prefix, name = self._names(template, workspace)
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            arcpy.AddMessage("Using the cached template resourced to " + str(workspace) + ".")
+            return path
+
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        arcpy.AddMessage("Resourcing the template to " + str(workspace) + ".")
+        temp_path = os.path.join(self.root, prefix + '_' + str(os.getpid()) + '_partial.mxd')
+        shutil.copy(template, temp_path)
+        mxd = arcpy.mapping.MapDocument(temp_path)
+        for layer in arcpy.mapping.ListLayers(mxd):
+            if layer.supports("DATASOURCE"):
+                layer.replaceDataSource(workspace, "FILEGDB_WORKSPACE", "", True)
+        # the copies of the template are made in other folders
+        mxd.relativePaths = False
+        mxd.save()
+        del mxd
+
+        # older versions of the template are no longer used
+        for old in glob.glob(os.path.join(self.root, prefix + '_*.mxd')):
+            if old != temp_path and not old.endswith('_partial.mxd'):
+                _remove(old)
+        if os.path.exists(path):
+            # another process cached it first
+            _remove(temp_path)
+        else:
+            os.rename(temp_path, path)
+        return path
+
+    def clone(self, template, workspace, target):
+        """Copies the cached template resourced to workspace to target"""
+        shutil.copy(self.resourced(template, workspace), target)
+        return target
+
+
+def normalize_geometry(geometry):
+    """Returns an esri JSON geometry as a string with sorted keys and the
+    coordinates rounded, so equal areas give equal strings"""
+    def normalize(value):
+        if isinstance(value, float):
+            return round(value, 6)
+        if isinstance(value, list):
+            return [normalize(item) for item in value]
+        if isinstance(value, dict):
+            return dict((key, normalize(item)) for key, item in value.items())
+        return value
+    if not isinstance(geometry, dict):
+        geometry = json.loads(geometry)
+    return json.dumps(normalize(geometry), sort_keys=True, separators=(',', ':'))
+
+
+def folder_size(path):
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+class CacheLock(object):
+    """A lock file shared by the processes using a cache folder"""
+
+    def __init__(self, path, timeout=120, stale=1800):
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+        self.locked = False
+
+    def acquire(self):
+        start = time.time()
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                self.locked = True
+                return True
+            except OSError:
+                # a process that died while holding the lock left it behind
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    pass
+            if time.time() - start > self.timeout:
+                return False
+            time.sleep(0.5)
+
+    def release(self):
+        if self.locked:
+            self.locked = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+_mask_names = itertools.count(1)
+
+
+def unique_name(prefix):
+    """A feature class name not used before by this process or by another
+    process running at the same time, without listing the workspace"""
+    return prefix + '_' + str(os.getpid()) + '_' + str(next(_mask_names))
+
+
+class DatasetCache(object):
+    """Datasets kept in a cache geodatabase, with an index file recording
+    their size and when they were last used. The least recently used are
+    removed when the cache is larger than max_size bytes.
+
+    The lock is only held to read and write the index. A dataset that is
+    not cached is claimed in the index, made without the lock and then
+    published, other processes make their own copy meanwhile. Entries used
+    within the last LEASE seconds may still be read by another process and
+    are never removed"""
+
+    # seconds an entry is kept after it was last used, whatever the size
+    LEASE = 900
+    # seconds after which a claim is taken to be left by a process that died
+    CLAIM_TIMEOUT = 3600
+
+    def __init__(self, name, max_size, root=None):
+        self.root = os.path.join(root or cache_root(), name)
+        self.gdb = os.path.join(self.root, name + '.gdb')
+        self.index_path = os.path.join(self.root, name + '.json')
+        self.lock = CacheLock(os.path.join(self.root, name + '.lock'))
+        self.max_size = max_size
+
+    def _open(self):
+        """Takes the lock and returns the index, or None when the cache is
+        busy"""
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        if not self.lock.acquire():
+            return None
+        try:
+            self._create()
+        except:
+            self.lock.release()
+            raise
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as index_file:
+                    return json.load(index_file)
+            except ValueError:
+                arcpy.AddWarning("Ignoring the unreadable cache index " + self.index_path)
+        return {}
+
+    def _create(self):
+        if not arcpy.Exists(self.gdb):
+            arcpy.CreateFileGDB_management(self.root, os.path.basename(self.gdb))
+
+    def _close(self, entries, keep=None):
+        """Evicts, saves the index and releases the lock"""
+        try:
+            if entries is not None:
+                self._evict(entries, keep)
+                temp_path = self.index_path + '.tmp'
+                with open(temp_path, 'w') as index_file:
+                    json.dump(entries, index_file, indent=1, sort_keys=True)
+                if os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+                os.rename(temp_path, self.index_path)
+        finally:
+            self.lock.release()
+
+    def _valid(self, entry):
+        return arcpy.Exists(os.path.join(self.gdb, entry['dataset']))
+
+    def _building(self, entry):
+        """True when another process claimed the entry and is making it"""
+        return entry is not None and bool(entry.get('building')) and \
+            time.time() - entry.get('claimed', 0) < self.CLAIM_TIMEOUT
+
+    def _lookup(self, entries, key):
+        entry = entries.get(key)
+        if entry is not None and entry.get('building'):
+            return None
+        if entry is not None and not self._valid(entry):
+            entries.pop(key)
+            entry = None
+        if entry is not None:
+            entry['last_used'] = time.time()
+        return entry
+
+    def _add(self, entries, key, dataset, size_before, **values):
+        """Records a new dataset, its size is what the geodatabase grew
+        since size_before"""
+        entry = dict(values, dataset=dataset, created=time.time(), last_used=time.time(),
+                     size=max(folder_size(self.gdb) - size_before, 0))
+        entries[key] = entry
+        return entry
+
+    def _remove_entry(self, entry):
+        dataset = os.path.join(self.gdb, entry['dataset'])
+        if arcpy.Exists(dataset):
+            arcpy.Delete_management(dataset)
+
+    def _evict(self, entries, keep):
+        total = sum(entry.get('size', 0) for entry in entries.values())
+        leased = time.time() - self.LEASE
+        for key in sorted(entries, key=lambda k: entries[k].get('last_used', 0)):
+            if total <= self.max_size:
+                break
+            entry = entries[key]
+            if key == keep or entry.get('building') or entry['last_used'] > leased:
+                continue
+            entries.pop(key)
+            arcpy.AddMessage("Removing " + entry['dataset'] + " from the cache.")
+            self._remove_entry(entry)
+            total -= entry['size']
+
+
+    def _fetch_or_build(self, key, dataset, build):
+        """Returns (entry, cached) for key. When the dataset is not cached it
+        is claimed and build(), which returns the values to record with it,
+        is called without the lock. Returns (None, False) when the cache is
+        busy or another process is making the same dataset"""
+        entries = self._open()
+        if entries is None:
+            return None, False
+        try:
+            entry = self._lookup(entries, key)
+            if entry is None and self._building(entries.get(key)):
+                arcpy.AddMessage("Another process is making " + dataset + ".")
+                return None, False
+            if entry is None:
+                entries[key] = {'dataset': dataset, 'building': os.getpid(),
+                                'claimed': time.time(), 'last_used': time.time(), 'size': 0}
+        finally:
+            self._close(entries)
+        if entry is not None:
+            return entry, True
+
+        size_before = folder_size(self.gdb)
+        try:
+            values = build()
+        except:
+            self._unclaim(key)
+            raise
+        entries = self._open()
+        if entries is None:
+            arcpy.AddWarning("The cache is busy, " + dataset + " was not added to it.")
+            return dict(values, dataset=dataset), False
+        try:
+            # the size is what the geodatabase grew while the dataset was made
+            entry = self._add(entries, key, dataset, size_before, **values)
+        finally:
+            self._close(entries, key)
+        return entry, False
+
+    def _unclaim(self, key):
+        entries = self._open()
+        if entries is None:
+            return
+        try:
+            if entries.get(key, {}).get('building') == os.getpid():
+                entries.pop(key)
+        finally:
+            self._close(entries)
+
+
+class GridCache(DatasetCache):
+    """Grids and graticules made by MakeGridsAndGraticulesLayer, with a layer
+    file for each grid. A grid is found by the contents of the grid XML, the
+    area of interest and the grid name. CTM_GRID_CACHE_MB sets the size of
+    the cache, 512 MB by default"""
+
+    def __init__(self, root=None, max_size=None):
+        if max_size is None:
+            max_size = int(os.environ.get('CTM_GRID_CACHE_MB', 512)) * 1024 * 1024
+        DatasetCache.__init__(self, 'grids', max_size, root)
+
+    @staticmethod
+    def key(grid_xml, geometry, name):
+        with open(grid_xml, 'rb') as xml_file:
+            return _hash(xml_file.read(), normalize_geometry(geometry), name)[:24]
+
+    def _valid(self, entry):
+        return os.path.exists(os.path.join(self.root, entry['layer'])) and \
+            DatasetCache._valid(self, entry)
+
+    def _remove_entry(self, entry):
+        DatasetCache._remove_entry(self, entry)
+        _remove(os.path.join(self.root, entry['layer']))
+
+    def grid(self, grid_xml, aoi, geometry, map_name, layer_name, spatial_reference):
+        """Returns the grid layer and its feature dataset for the area of
+        interest, made by MakeGridsAndGraticulesLayer the first time. Returns
+        None when the cache is busy or another process is making the same
+        grid, the caller then makes the grid itself"""
+        key = self.key(grid_xml, geometry, map_name)
+        dataset = 'Grid_' + key
+        made = []
+
+        def build():
+            if arcpy.Exists(os.path.join(self.gdb, dataset)):
+                arcpy.Delete_management(os.path.join(self.gdb, dataset))
+            gfds = str(arcpy.CreateFeatureDataset_management(self.gdb, dataset, spatial_reference))
+            arcpy.AddMessage("Creating the Grid...")
+            grid_result = arcpy.MakeGridsAndGraticulesLayer_cartography(grid_xml, aoi, gfds,
+                                                                        layer_name, map_name)
+            arcpy.AddMessage(grid_result.getMessages())
+            made.append(grid_result.getOutput(0))
+            layer_file = key + '.lyr'
+            made[0].saveACopy(os.path.join(self.root, layer_file))
+            return {'layer': layer_file}
+
+        entry, cached = self._fetch_or_build(key, dataset, build)
+        if entry is None:
+            arcpy.AddWarning("The grid cache is busy, making the grid without it.")
+            return None
+        if cached:
+            arcpy.AddMessage("Using the cached grid " + entry['dataset'] + ".")
+            grid_layer = arcpy.mapping.Layer(os.path.join(self.root, entry['layer']))
+        else:
+            arcpy.AddMessage("Added the grid to the grid cache.")
+            grid_layer = made[0]
+        return grid_layer, os.path.join(self.gdb, entry['dataset'])
+
+
+class MaskCache(DatasetCache):
+    """Annotation outline masks made by FeatureOutlineMasks. A mask is found
+    by the annotation data source and its definition query, the version of
+    its data, the reference scale, spatial reference and mask settings, and
+    the area of interest when only the placed features are masked.
+    CTM_MASK_CACHE_MB sets the size of the cache, 256 MB by default"""
+
+    def __init__(self, root=None, max_size=None):
+        if max_size is None:
+            max_size = int(os.environ.get('CTM_MASK_CACHE_MB', 256)) * 1024 * 1024
+        DatasetCache.__init__(self, 'masks', max_size, root)
+
+    @staticmethod
+    def key(anno_layer, geometry, scale, spatial_reference, margin, method, mask_for):
+        source = os.path.normcase(str(anno_layer.dataSource))
+        query = anno_layer.definitionQuery if anno_layer.supports("DEFINITIONQUERY") else ''
+        # masks of all features do not depend on the area of interest
+        area = normalize_geometry(geometry) if mask_for != 'ALL_FEATURES' else ''
+        return _hash(source, query, MapGenerator_Index.data_version(anno_layer.dataSource),
+                     area, scale, spatial_reference.factoryCode or spatial_reference.name,
+                     margin, method, mask_for)[:24]
+
+    def masks(self, anno_layer, geometry, scale, spatial_reference, scratch_workspace,
+              margin='2.5 Points', method='CONVEX_HULL', mask_for='ALL_FEATURES'):
+        """Returns the path of the outline masks of an annotation layer, made
+        by FeatureOutlineMasks the first time. When the cache is busy, or
+        another process is making the same masks, the masks are made in the
+        scratch workspace"""
+        key = self.key(anno_layer, geometry, scale, spatial_reference, margin, method, mask_for)
+        dataset = 'AnnoMask_' + key
+
+        def build():
+            output = os.path.join(self.gdb, dataset)
+            if arcpy.Exists(output):
+                arcpy.Delete_management(output)
+            arcpy.AddMessage("making the feature outline masks")
+            arcpy.FeatureOutlineMasks_cartography(anno_layer, output, scale, spatial_reference,
+                                                  margin, method, mask_for)
+            return {}
+
+        entry, cached = self._fetch_or_build(key, dataset, build)
+        if entry is None:
+            arcpy.AddWarning("The mask cache is busy, making the masks without it.")
+            output = os.path.join(scratch_workspace, unique_name('AnnoMask'))
+            arcpy.FeatureOutlineMasks_cartography(anno_layer, output, scale, spatial_reference,
+                                                  margin, method, mask_for)
+            return output
+        if cached:
+            arcpy.AddMessage("Using the cached outline masks " + entry['dataset'] + ".")
+        return os.path.join(self.gdb, entry['dataset'])
+
+
+def template_workspaces(template):
+    """The workspaces of the layers of a map document"""
+    mxd = arcpy.mapping.MapDocument(template)
+    try:
+        return sorted(set(layer.workspacePath for layer in arcpy.mapping.ListLayers(mxd)
+                          if layer.supports("WORKSPACEPATH")))
+    finally:
+        del mxd
+
+
+class ExportCache(DatasetCache):
+    """Exported maps of Product on Demand requests. A map is found by the
+    product JSON, without the options that do not change the map, and the
+    versions of the template, grid XML and the workspaces of its layers it
+    was made from. Maps made from data whose version cannot be told, in an
+    enterprise geodatabase, are not cached. CTM_EXPORT_CACHE_MB sets the
+    size of the cache, 2048 MB by default. The hits and misses are counted
+    in a file next to the index"""
+
+    # product options that do not change the exported map
+    IGNORED = ('keep_mxd_backup', 'workingDirectory', 'quad_id')
+
+    def __init__(self, root=None, max_size=None):
+        if max_size is None:
+            max_size = int(os.environ.get('CTM_EXPORT_CACHE_MB', 2048)) * 1024 * 1024
+        DatasetCache.__init__(self, 'exports', max_size, root)
+        self.stats_path = os.path.join(self.root, 'exports_stats.json')
+
+    @staticmethod
+    def versioned(source):
+        """True when a change of the source can be seen from its files. The
+        data of an enterprise geodatabase is not in its connection file"""
+        path = os.path.normcase(str(source))
+        if path.endswith('.sde') or '.sde' + os.sep in path:
+            return False
+        return MapGenerator_Index.data_version(source) is not None
+
+    @classmethod
+    def key(cls, product, sources):
+        """The key of a product, a dictionary, made from the sources
+        listed, the paths of its template, grid XML and workspace"""
+        product = dict((name, value) for name, value in product.items()
+                       if name not in cls.IGNORED)
+        if isinstance(product.get('geometry'), dict):
+            product['geometry'] = json.loads(normalize_geometry(product['geometry']))
+        versions = [(os.path.normcase(str(source)), MapGenerator_Index.data_version(source))
+                    for source in sources if source]
+        return _hash(json.dumps(product, sort_keys=True), versions)[:24]
+
+    def _create(self):
+        pass
+
+    def _valid(self, entry):
+        return os.path.isfile(os.path.join(self.root, entry['dataset']))
+
+    def _remove_entry(self, entry):
+        _remove(os.path.join(self.root, entry['dataset']))
+
+    def _count(self, counter):
+        """Adds one to the hits or misses, the lock has to be held"""
+        stats = {'hits': 0, 'misses': 0}
+        if os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path) as stats_file:
+                    stats.update(json.load(stats_file))
+            except ValueError:
+                pass
+        stats[counter] += 1
+        with open(self.stats_path, 'w') as stats_file:
+            json.dump(stats, stats_file)
+        arcpy.AddMessage("Export cache: " + str(stats['hits']) + " hits, " +
+                         str(stats['misses']) + " misses.")
+        return stats
+
+    def fetch(self, key, target):
+        """Copies the cached map to target, the path without an extension.
+        Returns the path of the copy, or None when the map is not cached"""
+        entries = self._open()
+        if entries is None:
+            return None
+        try:
+            entry = self._lookup(entries, key)
+            self._count('hits' if entry else 'misses')
+            if entry is None:
+                return None
+            arcpy.AddMessage("Using the cached export " + entry['dataset'] + ".")
+            path = target + os.path.splitext(entry['dataset'])[1]
+            shutil.copy(os.path.join(self.root, entry['dataset']), path)
+            return path
+        finally:
+            self._close(entries)
+
+    def store(self, key, path):
+        """Adds a copy of an exported map to the cache"""
+        entries = self._open()
+        if entries is None:
+            return
+        try:
+            name = key + os.path.splitext(path)[1].lower()
+            shutil.copy(path, os.path.join(self.root, name))
+            entries[key] = {'dataset': name, 'created': time.time(), 'last_used': time.time(),
+                            'size': os.path.getsize(path)}
+        finally:
+            self._close(entries, key)
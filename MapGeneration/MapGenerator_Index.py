@@ -0,0 +1,104 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""In memory indexes of the polygons map generation looks up for every
+map, such as the UTM zones and the US states.
+
+An index is loaded once per process and reloaded when its feature class
+changes. Lookups compare envelopes first and only run the exact geometry
+test on the polygons whose envelope overlaps the area of interest."""
+import os
+import arcpy
+
+# the indexes loaded by this process
+_indexes = {}
+
+
+def data_version(source):
+    """The modification time of the files of a dataset, used to notice
+    that it changed"""
+    path = str(source)
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    if not path:
+        return None
+    if os.path.isdir(path):
+        return max([os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)] or [0])
+    return os.path.getmtime(path)
+
+
+class PolygonIndex(object):
+    """The polygons of a feature class with the values of some fields"""
+
+    def __init__(self, source, fields):
+        self.source = source
+        self.fields = list(fields)
+        self.spatial_reference = arcpy.Describe(source).spatialReference
+        self.items = []
+        with arcpy.da.SearchCursor(source, ['SHAPE@'] + self.fields) as cursor:
+            for row in cursor:
+                shape = row[0]
+                if shape is None:
+                    continue
+                extent = shape.extent
+                self.items.append(((extent.XMin, extent.YMin, extent.XMax, extent.YMax),
+                                   shape, row[1:]))
+
+    def project(self, geometry):
+        """Projects a geometry to the spatial reference of the index, do this
+        once and pass the result to the lookups"""
+        if geometry.spatialReference is None or \
+                geometry.spatialReference.name == self.spatial_reference.name:
+            return geometry
+        return geometry.projectAs(self.spatial_reference)
+
+    def _candidates(self, geometry):
+        extent = geometry.extent
+        for envelope, shape, values in self.items:
+            if (envelope[0] <= extent.XMax and extent.XMin <= envelope[2] and
+                    envelope[1] <= extent.YMax and extent.YMin <= envelope[3]):
+                yield envelope, shape, values
+
+    def intersecting(self, geometry):
+        """The field values of the polygons intersecting the geometry"""
+        return [values for envelope, shape, values in self._candidates(geometry)
+                if not shape.disjoint(geometry)]
+
+    def containing(self, geometry):
+        """The field values and shape of the first polygon containing the
+        geometry, or None"""
+        extent = geometry.extent
+        for envelope, shape, values in self._candidates(geometry):
+            # a polygon can only contain the geometry if its envelope does
+            if (envelope[0] <= extent.XMin and extent.XMax <= envelope[2] and
+                    envelope[1] <= extent.YMin and extent.YMax <= envelope[3] and
+                    shape.contains(geometry)):
+                return values, shape
+        return None
+
+
+def polygon_index(source, fields):
+    """Returns the index of a feature class, loading it the first time it
+    is used in this process or when it changed since"""
+    key = (os.path.normcase(str(source)), tuple(fields))
+    version = data_version(source)
+    cached = _indexes.get(key)
+    if cached is None or cached[0] != version:
+        arcpy.AddMessage("Loading " + str(source) + " into memory.")
+        cached = (version, PolygonIndex(source, fields))
+        _indexes[key] = cached
+    return cached[1]
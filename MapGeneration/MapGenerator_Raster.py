@@ -0,0 +1,231 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Raster exports of the page layout that never hold the whole page in
+memory.
+
+ExportToTIFF, ExportToJPEG and ExportToLayoutGeoTIFF render the page in one
+raster, several GB for a 63x88 cm sheet at print resolution. Here the
+ArcGIS exporter renders the page in horizontal strips: the page layout is
+drawn through ArcObjects (IActiveView.Output) into an ExportTIFF whose
+pixel bounds are one strip and whose visible bounds are the slice of the
+page under it, as ExportToTIFF does for the whole page. GDAL copies each
+strip into the output before the next is rendered. The memory used is set
+by CTM_EXPORT_MEMORY_MB, 256 MB by default, half for the strip and half for
+the GDAL block cache.
+
+The pixels are drawn by the same renderer as a single export, only the
+output is cut. The JPEG is encoded by GDAL rather than ArcGIS, at the same
+quality.
+
+comtypes, with the ArcObjects type libraries of ArcGIS Desktop, and GDAL
+are needed. Without them a tiled export fails, it does not fall back to
+rendering the page in one piece."""
+import os
+import ctypes
+import arcpy
+
+try:
+    from osgeo import gdal, osr
+except ImportError:
+    gdal = None
+
+try:
+    import comtypes.client
+except ImportError:
+    comtypes = None
+
+DEFAULT_MEMORY_MB = 256
+BANDS = 3
+
+# the inches in a page unit, by esriUnits
+INCHES = {1: 1.0, 2: 1.0 / 72, 7: 1.0 / 25.4, 8: 1.0 / 2.54, 12: 10.0 / 2.54}
+
+
+def memory_budget():
+    """The bytes an export may use, CTM_EXPORT_MEMORY_MB sets the budget"""
+    return max(int(os.environ.get('CTM_EXPORT_MEMORY_MB', DEFAULT_MEMORY_MB)), 16) * 1024 * 1024
+
+
+def strip_rows(width, budget):
+    """The rows of a strip of a page width pixels wide, half the budget is
+    kept for the GDAL block cache. ArcGIS draws the strip in 32 bits"""
+    return max(1, int(budget // 2 // (width * 4)))
+
+
+def _arcobjects():
+    """The comtypes modules of the ArcObjects libraries used to draw the
+    page, None when they cannot be loaded"""
+    if comtypes is None or os.name != 'nt':
+        return None
+    folder = os.path.join(arcpy.GetInstallInfo()['InstallDir'], 'com')
+    try:
+        return dict((name, comtypes.client.GetModule(os.path.join(folder, name + '.olb')))
+                    for name in ('esriGeometry', 'esriDisplay', 'esriCarto', 'esriOutput'))
+    except Exception:
+        return None
+
+
+def unavailable():
+    """The reason the page cannot be rendered in strips, None when it can"""
+    if gdal is None:
+        return "GDAL (the osgeo package) is not installed"
+    if _arcobjects() is None:
+        return "comtypes with the ArcObjects type libraries of ArcGIS Desktop is not available"
+    return None
+
+
+class _Page(object):
+    """The page layout of a map document opened through ArcObjects"""
+
+    def __init__(self, mxd_path, resolution, modules):
+        self.modules = modules
+        carto = modules['esriCarto']
+        self.document = comtypes.client.CreateObject(carto.MapDocument,
+                                                     interface=carto.IMapDocument)
+        self.document.Open(mxd_path, "")
+        layout = self.document.PageLayout
+        self.view = layout.QueryInterface(carto.IActiveView)
+        self.view.Activate(ctypes.windll.user32.GetDesktopWindow())
+        page = layout.Page
+        units = INCHES.get(page.Units)
+        if units is None:
+            raise RuntimeError("Page units " + str(page.Units) + " are not supported")
+        self.page_width, self.page_height = page.QuerySize()
+        self.resolution = resolution
+        # pixels per page unit, as ExportToTIFF sizes the page
+        self.scale = resolution * units
+        self.width = int(round(self.page_width * self.scale))
+        self.height = int(round(self.page_height * self.scale))
+
+    def _envelope(self, xmin, ymin, xmax, ymax):
+        geometry = self.modules['esriGeometry']
+        envelope = comtypes.client.CreateObject(geometry.Envelope, interface=geometry.IEnvelope)
+        envelope.PutCoords(xmin, ymin, xmax, ymax)
+        return envelope
+
+    def render(self, path, top, rows):
+        """Draws the rows from top of the page to a TIFF at path"""
+        output = self.modules['esriOutput']
+        export = comtypes.client.CreateObject(output.ExportTIFF, interface=output.IExport)
+        export.ExportFileName = path
+        export.Resolution = self.resolution
+        export.PixelBounds = self._envelope(0, 0, self.width, rows)
+        rect = self.modules['esriDisplay'].tagRECT()
+        rect.left, rect.top, rect.right, rect.bottom = 0, 0, self.width, rows
+        # page units run up from the bottom of the page
+        visible = self._envelope(0, self.page_height - float(top + rows) / self.scale,
+                                 self.page_width, self.page_height - float(top) / self.scale)
+        hdc = export.StartExporting()
+        try:
+            self.view.Output(hdc, int(self.resolution), rect, visible, None)
+        finally:
+            export.FinishExporting()
+            export.Cleanup()
+
+    def close(self):
+        self.view.Deactivate()
+        self.document.Close()
+
+
+def _geotransform(page, data_frame):
+    """The geotransform of the page pixels from the position and extent of
+    the data frame, as ExportToLayoutGeoTIFF georeferences the page"""
+    if data_frame.rotation:
+        raise RuntimeError("A rotated data frame cannot georeference a tiled export")
+    extent = data_frame.extent
+    x_size = extent.width / (data_frame.elementWidth * page.scale)
+    y_size = extent.height / (data_frame.elementHeight * page.scale)
+    left = extent.XMin - data_frame.elementPositionX * page.scale * x_size
+    top = extent.YMax + (page.page_height - data_frame.elementPositionY -
+                         data_frame.elementHeight) * page.scale * y_size
+    return [left, x_size, 0.0, top, 0.0, -y_size]
+
+
+def _projection(data_frame):
+    reference = osr.SpatialReference()
+    reference.ImportFromESRI([data_frame.spatialReference.exportToString()])
+    return reference.ExportToWkt()
+
+
+def _write_strips(page, outfile, rows, compression, data_frame):
+    """Renders the page strip by strip into a striped TIFF"""
+    options = ['BLOCKYSIZE=' + str(min(rows, page.height)), 'BIGTIFF=IF_SAFER', 'PHOTOMETRIC=RGB']
+    if compression and compression.upper() != 'NONE':
+        options.append('COMPRESS=' + compression.upper())
+    output = gdal.GetDriverByName('GTiff').Create(outfile, page.width, page.height, BANDS,
+                                                  gdal.GDT_Byte, options)
+    if data_frame is not None:
+        output.SetGeoTransform(_geotransform(page, data_frame))
+        output.SetProjection(_projection(data_frame))
+    bands = list(range(1, BANDS + 1))
+    strip_path = os.path.splitext(outfile)[0] + '_strip.tif'
+    try:
+        for top in range(0, page.height, rows):
+            count = min(rows, page.height - top)
+            page.render(strip_path, top, count)
+            strip = gdal.Open(strip_path)
+            if strip is None or (strip.RasterXSize, strip.RasterYSize) != (page.width, count):
+                raise RuntimeError("The strip at row " + str(top) + " was not rendered")
+            data = strip.ReadRaster(0, 0, page.width, count, band_list=bands)
+            strip = None
+            output.WriteRaster(0, top, page.width, count, data, band_list=bands)
+            del data
+            output.FlushCache()
+    finally:
+        output = None
+        if os.path.exists(strip_path):
+            gdal.GetDriverByName('GTiff').Delete(strip_path)
+
+
+def export_strips(mxd, outfile, export, resolution, compression=None, jpeg_quality=100,
+                  data_frame=None, budget=None):
+    """Exports the page layout of the map document to outfile as a TIFF,
+    JPEG or, with the data frame that georeferences it, a layout GeoTIFF
+    rendered in strips. Raises RuntimeError when the page cannot be
+    rendered in strips"""
+    reason = unavailable()
+    if reason:
+        raise RuntimeError("The tiled export needs bounded rendering, which is not available: " +
+                           reason + ". Export without tiledExport to render the page in one "
+                           "piece.")
+    budget = budget or memory_budget()
+    # the map document as it is now, with the changes not saved to its file
+    mxd_path = os.path.splitext(outfile)[0] + '_page.mxd'
+    mxd.saveACopy(mxd_path)
+    cache = gdal.GetCacheMax()
+    page = None
+    target = outfile if export != 'JPEG' else os.path.splitext(outfile)[0] + '_page.tif'
+    try:
+        gdal.SetCacheMax(int(budget // 2))
+        page = _Page(mxd_path, resolution, _arcobjects())
+        rows = strip_rows(page.width, budget)
+        arcpy.AddMessage("Rendering the " + str(page.width) + " x " + str(page.height) +
+                         " page in strips of " + str(rows) + " rows.")
+        _write_strips(page, target, rows, None if export == 'JPEG' else compression, data_frame)
+        if export == 'JPEG':
+            # the JPEG driver compresses the page line by line as it reads it
+            source = gdal.Open(target)
+            gdal.GetDriverByName('JPEG').CreateCopy(outfile, source, 0,
+                                                    ['QUALITY=' + str(jpeg_quality)])
+            source = None
+    finally:
+        if page is not None:
+            page.close()
+        page = None
+        gdal.SetCacheMax(cache)
+        if target != outfile and os.path.exists(target):
+            gdal.GetDriverByName('GTiff').Delete(target)
+        if os.path.exists(mxd_path):
+            os.remove(mxd_path)
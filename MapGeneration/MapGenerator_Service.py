@@ -0,0 +1,288 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""A local service that creates maps on worker processes kept warm between
+requests.
+
+Every worker imports arcpy, checks out the foundation extension and loads
+the Fixed_MapGenerator toolbox once, then creates maps for the product JSON
+it is sent. A request that runs longer than the timeout stops its worker,
+and workers are replaced after a number of requests so memory held by
+arcpy does not grow without bound.
+
+Start the service with
+    python MapGenerator_Service.py --port 6100 --workers 2
+and set CTM_MAP_SERVICE to localhost:6100 for the map generation tools to
+send their requests to it. CTM_MAP_SERVICE_KEY is the shared key of the
+connection, it has to be set for the service and the tools: requests are
+unpickled, so only clients that know the key may connect. The tools wait
+CTM_MAP_SERVICE_TIMEOUT seconds for a map, twice the worker timeout by
+default, then create it themselves."""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+DEFAULT_PORT = 6100
+DEFAULT_TIMEOUT = 600
+MAX_REQUESTS = 50
+
+
+def authkey():
+    """The key in CTM_MAP_SERVICE_KEY, raises RuntimeError when it is not set"""
+    key = os.environ.get('CTM_MAP_SERVICE_KEY')
+    if not key:
+        raise RuntimeError("CTM_MAP_SERVICE_KEY is not set")
+    return key.encode('utf-8')
+
+
+def client_timeout():
+    """The seconds a tool waits for the service, CTM_MAP_SERVICE_TIMEOUT"""
+    return int(os.environ.get('CTM_MAP_SERVICE_TIMEOUT', 2 * DEFAULT_TIMEOUT))
+
+
+def service_address():
+    """The address in CTM_MAP_SERVICE, host:port, or None"""
+    value = os.environ.get('CTM_MAP_SERVICE')
+    if not value:
+        return None
+    host, _, port = value.rpartition(':')
+    return (host or 'localhost', int(port))
+
+
+def _worker_main(connection, pyt_path, scratch_root, max_requests):
+    """ runs in the worker process, answers requests until max_requests
+    have been handled or the service closes the connection"""
+    import MapGenerator_Workers
+    MapGenerator_Workers._init_worker(pyt_path, scratch_root)
+    import arcpy
+    toolbox = MapGenerator_Workers.load_toolbox(pyt_path)
+    connection.send('ready')
+    for count in range(max_requests):
+        try:
+            product_json = connection.recv()
+        except EOFError:
+            break
+        start = time.time()
+        result = {'outfile': None, 'status': 'failed', 'error': None}
+        try:
+            outfile = toolbox.MapGenerator().cached_createmap(product_json)
+            result['outfile'] = outfile
+            if outfile:
+                result['status'] = 'complete'
+            else:
+                result['error'] = arcpy.GetMessages(2) or "No output was created"
+        except Exception as ex:
+            result['error'] = str(ex)
+        result['messages'] = arcpy.GetMessages()
+        result['seconds'] = time.time() - start
+        connection.send(result)
+    connection.close()
+
+
+class Worker(object):
+    """ a warm worker process and the connection to it"""
+
+    def __init__(self, pyt_path, scratch_root, max_requests):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main,
+                                               args=(child, pyt_path, scratch_root, max_requests))
+        self.process.daemon = True
+        self.process.start()
+        self.requests = 0
+        self.max_requests = max_requests
+
+    def wait_ready(self, timeout):
+        if not self.connection.poll(timeout) or self.connection.recv() != 'ready':
+            raise RuntimeError("The worker process did not start")
+
+    def run(self, product_json, timeout):
+        """ sends a request and waits for the result, None after a timeout"""
+        self.connection.send(product_json)
+        self.requests += 1
+        if not self.connection.poll(timeout):
+            return None
+        return self.connection.recv()
+
+    @property
+    def spent(self):
+        return self.requests >= self.max_requests or not self.process.is_alive()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class MapService(object):
+    """ hands the requests of the clients to the idle workers"""
+
+    def __init__(self, pyt_path, workers=2, timeout=DEFAULT_TIMEOUT,
+                 max_requests=MAX_REQUESTS, scratch_root=None):
+        self.pyt_path = pyt_path
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.scratch_root = scratch_root or os.path.join(os.path.dirname(pyt_path),
+                                                         'MapGenerator_Service_scratch')
+        self.size = workers
+        self.idle = queue.Queue()
+        self.running = True
+        # workers that could not be replaced, they are started again before
+        # the next request
+        self.missing = 0
+        self.lock = threading.Lock()
+
+    def _start_worker(self):
+        worker = Worker(self.pyt_path, self.scratch_root, self.max_requests)
+        try:
+            worker.wait_ready(self.timeout)
+        except Exception:
+            worker.stop()
+            raise
+        self.idle.put(worker)
+
+    def _replace(self, worker):
+        """ stops a worker and starts another one, when it does not start
+        the slot is kept and filled before the next request"""
+        worker.stop()
+        try:
+            self._start_worker()
+        except Exception as ex:
+            sys.stderr.write("Unable to start a map worker: " + str(ex) + "\n")
+            with self.lock:
+                self.missing += 1
+
+    def _refill(self):
+        with self.lock:
+            missing, self.missing = self.missing, 0
+        for index in range(missing):
+            try:
+                self._start_worker()
+            except Exception as ex:
+                sys.stderr.write("Unable to start a map worker: " + str(ex) + "\n")
+                with self.lock:
+                    self.missing += 1
+
+    def start(self):
+        import MapGenerator_Workers
+        MapGenerator_Workers.configure_multiprocessing()
+        if not os.path.isdir(self.scratch_root):
+            os.makedirs(self.scratch_root)
+        for index in range(self.size):
+            self._start_worker()
+
+    def handle(self, product_json):
+        """ creates the map for a request on the next idle worker"""
+        self._refill()
+        try:
+            worker = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            return {'outfile': None, 'status': 'failed',
+                    'error': "No map worker was available in " + str(self.timeout) + " seconds"}
+        result = None
+        try:
+            result = worker.run(product_json, self.timeout)
+        except (EOFError, IOError, OSError) as ex:
+            result = {'outfile': None, 'status': 'failed', 'error': "The worker stopped: " + str(ex)}
+        finally:
+            if result is not None and result['status'] != 'timeout' and not worker.spent:
+                self.idle.put(worker)
+            else:
+                # workers that stopped, timed out, failed or handled enough
+                # requests are replaced
+                self._replace(worker)
+        if result is None:
+            result = {'outfile': None, 'status': 'timeout',
+                      'error': "The map was not created in " + str(self.timeout) + " seconds"}
+        return result
+
+    def _serve_client(self, connection):
+        try:
+            while True:
+                try:
+                    product_json = connection.recv()
+                except EOFError:
+                    break
+                connection.send(self.handle(product_json))
+        finally:
+            connection.close()
+
+    def serve(self, address):
+        listener = Listener(address, authkey=authkey())
+        sys.stdout.write("Map service listening on " + str(address) + "\n")
+        try:
+            while self.running:
+                connection = listener.accept()
+                thread = threading.Thread(target=self._serve_client, args=(connection,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            listener.close()
+
+    def stop(self):
+        self.running = False
+        while not self.idle.empty():
+            self.idle.get().stop()
+
+
+def request_map(product_json, address=None, timeout=None):
+    """ sends a request to the service and returns its result. Raises
+    socket.error when the service is not running, RuntimeError when there is
+    no key or no answer within timeout seconds and AuthenticationError when
+    the keys differ"""
+    connection = Client(address or service_address(), authkey=authkey())
+    try:
+        connection.send(product_json)
+        if timeout is not None and not connection.poll(timeout):
+            raise RuntimeError("The map service did not answer in " + str(timeout) + " seconds")
+        return connection.recv()
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Creates maps on warm worker processes.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT,
+                        help="seconds a request may take before its worker is stopped")
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS,
+                        help="requests a worker handles before it is replaced")
+    parser.add_argument('--toolbox', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'Fixed_MapGenerator.pyt'))
+    args = parser.parse_args()
+    if not os.environ.get('CTM_MAP_SERVICE_KEY'):
+        parser.error("set CTM_MAP_SERVICE_KEY to the key the clients use")
+
+    service = MapService(args.toolbox, args.workers, args.timeout, args.max_requests)
+    service.start()
+    try:
+        service.serve(('localhost', args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+if __name__ == '__main__':
+    main()
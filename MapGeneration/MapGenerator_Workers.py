@@ -0,0 +1,115 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Runs MapGenerator.createmap for many map sheets in worker processes.
+
+Every worker process loads the Fixed_MapGenerator toolbox once and gets its
+own scratch folder and scratch geodatabase, so the intermediate data of
+sheets generated at the same time never collide. Results are returned in
+the order of the input or as soon as they finish, a sheet that fails is reported in its result and
+does not stop the other sheets."""
+import os
+import sys
+import imp
+import time
+import shutil
+import multiprocessing
+import arcpy
+
+# the toolbox module loaded by this worker process
+_toolbox = None
+
+
+def configure_multiprocessing():
+    """ inside ArcMap and ArcCatalog sys.executable is the application, worker
+    processes have to be started with the python interpreter instead"""
+    if os.name == 'nt' and not os.path.basename(sys.executable).lower().startswith('python'):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'pythonw.exe'))
+
+
+def load_toolbox(pyt_path):
+    """ loads the python toolbox as a module, once per process"""
+    global _toolbox
+    if _toolbox is None:
+        _toolbox = imp.load_source('Fixed_MapGenerator', pyt_path)
+    return _toolbox
+
+
+def _init_worker(pyt_path, scratch_root):
+    """ gives the worker process its own scratch workspace and loads the
+    toolbox before the first sheet arrives"""
+    folder = os.path.join(scratch_root, 'worker_' + str(os.getpid()))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    arcpy.env.scratchWorkspace = folder
+    arcpy.env.overwriteOutput = True
+    arcpy.CheckOutExtension('foundation')
+    load_toolbox(pyt_path)
+
+
+def run_sheet(task):
+    """ creates the map of one sheet, task is (index, map name, product json,
+    toolbox path)"""
+    index, map_name, product_json, pyt_path = task
+    start = time.time()
+    result = {'index': index, 'map_name': map_name, 'outfile': None,
+              'status': 'failed', 'error': None, 'messages': ''}
+    try:
+        toolbox = load_toolbox(pyt_path)
+        outfile = toolbox.MapGenerator().createmap(product_json)
+        result['outfile'] = outfile
+        # createmap reports its errors as messages and returns nothing
+        if outfile:
+            result['status'] = 'complete'
+        else:
+            result['error'] = arcpy.GetMessages(2) or "No output was created"
+        result['messages'] = arcpy.GetMessages()
+    except SystemExit as ex:
+        # createmap calls exit() on some errors, the worker has to live on or
+        # the pool waits for its result forever
+        result['error'] = arcpy.GetMessages(2) or "createmap exited with " + str(ex.code)
+        result['messages'] = arcpy.GetMessages()
+    except Exception as ex:
+        result['error'] = str(ex)
+        result['messages'] = arcpy.GetMessages()
+    result['seconds'] = time.time() - start
+    return result
+
+
+def iter_batch(pyt_path, sheets, workers, scratch_root, ordered=True):
+    """ creates the maps for sheets, a list of (map name, product json), on
+    a pool of worker processes. Yields the results in the order of sheets as
+    soon as they are available, or in the order they finish when ordered is
+    False"""
+    if not os.path.isdir(scratch_root):
+        os.makedirs(scratch_root)
+    tasks = [(index, name, product_json, pyt_path)
+             for index, (name, product_json) in enumerate(sheets)]
+    configure_multiprocessing()
+    pool = multiprocessing.Pool(min(workers, max(len(tasks), 1)), _init_worker,
+                                (pyt_path, scratch_root))
+    try:
+        results = pool.imap(run_sheet, tasks) if ordered else pool.imap_unordered(run_sheet, tasks)
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(scratch_root, ignore_errors=True)
+
+
+def run_batch(pyt_path, sheets, workers, scratch_root):
+    """ creates the maps for sheets and returns the results in order"""
+    return list(iter_batch(pyt_path, sheets, workers, scratch_root))
@@ -0,0 +1,149 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""The Workflow Manager connection and job extended properties shared by the
+CTM Workflow Manager tools.
+
+The connection is opened once per process and the name of the extended
+property table is looked up once per job type. A connection that fails is
+dropped and opened again once. The extended properties
+of a job are read once, changes are kept until save is called and then
+written with a single job.save().
+
+Set CTM_WMX_LOCAL to the path of a JSON file to use the local stand-in in
+WMX_LocalStore instead of arcpywmx."""
+import os
+import arcpy
+
+# Name of the CTM extended property table
+EXTENDED_PROPERTY_TABLE = "CTM_EXT_JOB_REPLICA"
+
+# connections by database, None is the default database
+_connections = {}
+# the full name of the extended property table by database and job type
+_table_names = {}
+# the properties of the jobs used since the last save
+_jobs = {}
+
+
+def wmx_module():
+    """ arcpywmx, or the local stand-in when CTM_WMX_LOCAL is set"""
+    if os.environ.get('CTM_WMX_LOCAL'):
+        import WMX_LocalStore
+        return WMX_LocalStore
+    import arcpywmx
+    return arcpywmx
+
+
+def connection(database=None):
+    """ the connection to a Workflow Manager database, opened the first time
+    it is used in this process"""
+    if database not in _connections:
+        arcpy.CheckOutExtension('JTX')
+        module = wmx_module()
+        _connections[database] = module.Connect(database) if database else module.Connect()
+    return _connections[database]
+
+
+def retry(database, function):
+    """ calls function, when it fails the connection to the database is
+    dropped and function is called once more with a new connection"""
+    try:
+        return function()
+    except Exception as ex:
+        arcpy.AddWarning("Workflow Manager call failed, reconnecting: " + str(ex))
+        _connections.pop(database, None)
+        return function()
+
+
+class JobProperties(object):
+    """ the extended properties of a job, read once and written on save"""
+
+    def __init__(self, job_id, database=None):
+        self.job_id = int(job_id)
+        self.database = database
+        self.job = None
+        self.table = None
+        retry(database, self._open)
+        self.values = {}
+        self.changed = {}
+
+    def _open(self):
+        self.job = connection(self.database).getJob(self.job_id)
+        self.table = self.job.getExtendedPropertyTable(self._table_name())
+
+    def _table_name(self):
+        # the extended property tables are configured per job type
+        key = (self.database, getattr(self.job, 'jobTypeID', None))
+        if key not in _table_names:
+            name = None
+            for table in self.job.listExtendedProperties():
+                if EXTENDED_PROPERTY_TABLE in str(table):
+                    name = table
+            if name is None:
+                return None
+            _table_names[key] = name
+        return _table_names[key]
+
+    def get(self, field):
+        if field in self.changed:
+            return self.changed[field]
+        if field not in self.values:
+            self.values[field] = self.table[field].data
+        return self.values[field]
+
+    def set(self, field, value):
+        self.changed[field] = value
+
+    def save(self):
+        """ writes the changed properties with one save of the job"""
+        if not self.changed:
+            return False
+
+        def write():
+            for field, value in self.changed.items():
+                self.table[field].data = value
+            self.job.save()
+
+        try:
+            write()
+        except Exception as ex:
+            arcpy.AddWarning("Saving job " + str(self.job_id) + " failed, reconnecting: " +
+                             str(ex))
+            _connections.pop(self.database, None)
+            self._open()
+            write()
+        self.values.update(self.changed)
+        self.changed = {}
+        return True
+
+
+def job_properties(job_id, database=None):
+    """ the extended properties of a job, shared by the calls until the next
+    save_all"""
+    key = (database, int(job_id))
+    if key not in _jobs:
+        _jobs[key] = JobProperties(job_id, database)
+    return _jobs[key]
+
+
+def save_all():
+    """ saves the changed properties of every job and forgets the values
+    read, so the next tool reads them again"""
+    try:
+        for properties in _jobs.values():
+            if properties.save():
+                arcpy.AddMessage("Saved the extended properties of job " + str(properties.job_id) + ".")
+    finally:
+        _jobs.clear()
@@ -0,0 +1,99 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""A local stand-in for the parts of arcpywmx used by the CTM tools, for
+trying the tools without a Workflow Manager database.
+
+Jobs and their extended properties are kept in the JSON file named by
+CTM_WMX_LOCAL:
+
+    {"jobs": {"4917": {"extended_properties":
+        {"CTM_EXT_JOB_REPLICA": {"JOBREPLICA": null, "REVCNT": 2}}}}}
+
+Every job.save() is counted in the file under "saves"."""
+import os
+import json
+
+
+def _store_path(database=None):
+    return database or os.environ['CTM_WMX_LOCAL']
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return {'jobs': {}, 'saves': 0}
+    with open(path) as store:
+        return json.load(store)
+
+
+class Property(object):
+
+    def __init__(self, data):
+        self.data = data
+
+
+class ExtendedPropertyTable(object):
+
+    def __init__(self, values):
+        self.fields = dict((name, Property(value)) for name, value in values.items())
+
+    def __getitem__(self, name):
+        if name not in self.fields:
+            self.fields[name] = Property(None)
+        return self.fields[name]
+
+    def values(self):
+        return dict((name, field.data) for name, field in self.fields.items())
+
+
+class Job(object):
+
+    def __init__(self, path, job_id, values):
+        self.path = path
+        self.ID = job_id
+        self.tables = dict((name, ExtendedPropertyTable(table))
+                           for name, table in values.get('extended_properties', {}).items())
+
+    def listExtendedProperties(self):
+        return sorted(self.tables)
+
+    def getExtendedPropertyTable(self, name):
+        if name not in self.tables:
+            raise ValueError("Job " + str(self.ID) + " has no extended property table " + str(name))
+        return self.tables[name]
+
+    def save(self):
+        store = _load(self.path)
+        job = store['jobs'].setdefault(str(self.ID), {})
+        job['extended_properties'] = dict((name, table.values())
+                                          for name, table in self.tables.items())
+        store['saves'] = store.get('saves', 0) + 1
+        with open(self.path, 'w') as output:
+            json.dump(store, output, indent=2, sort_keys=True)
+
+
+class Connection(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def getJob(self, job_id):
+        jobs = _load(self.path)['jobs']
+        if str(job_id) not in jobs:
+            raise ValueError("Job " + str(job_id) + " does not exist in " + self.path)
+        return Job(self.path, int(job_id), jobs[str(job_id)])
+
+
+def Connect(database=None):
+    return Connection(_store_path(database))
@@ -0,0 +1,197 @@
+###| Copyright 2014 Esri
+###|
+###| Licensed under the Apache License, Version 2.0 (the "License");
+###| you may not use this file except in compliance with the License.
+###| You may obtain a copy of the License at
+###|
+###|    http://www.apache.org/licenses/LICENSE-2.0
+###|
+###| Unless required by applicable law or agreed to in writing, software
+###| distributed under the License is distributed on an "AS IS" BASIS,
+###| WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+###| See the License for the specific language governing permissions and
+###| limitations under the License.
+
+"""Packages a replica file geodatabase into a zip archive.
+
+The archive is written once, straight to its destination. The files of the
+geodatabase are deflated at the chosen compression level on several threads
+at once (zlib releases the GIL while it compresses). The smaller files are
+compressed whole, the larger ones are split in chunks that are deflated on
+the threads and ended with a full flush, so the chunks are joined in order
+into one deflate stream and the files are never held in memory."""
+import os
+import zlib
+import time
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+COMPRESSION_LEVEL = 6
+
+# files up to this size are compressed whole on the thread pool
+PARALLEL_LIMIT = 64 * 1024 * 1024
+
+# the larger files are compressed in chunks of this size
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def _zip_info(path, arcname):
+    date_time = time.localtime(os.path.getmtime(path))[:6]
+    info = zipfile.ZipInfo(arcname, date_time)
+    info.external_attr = (os.stat(path).st_mode & 0xFFFF) << 16
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.file_size = os.path.getsize(path)
+    return info
+
+
+def _compress(task):
+    """ deflates a whole file, returns the crc and compressed data"""
+    path, level = task
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    with open(path, 'rb') as source:
+        data = source.read()
+    crc = zlib.crc32(data) & 0xffffffff
+    return crc, compressor.compress(data) + compressor.flush()
+
+
+def _compress_chunk(task):
+    """ deflates a chunk of a file. The full flush ends the data on a byte
+    boundary without referring to earlier chunks, so the chunks of a file
+    can be compressed apart and joined in order"""
+    data, level = task
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+def _read_chunks(source, count):
+    chunks = []
+    for i in range(count):
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return chunks
+
+
+class ZipWriter(object):
+    """ writes deflated entries to a zip archive, the entries are
+    compressed by the caller"""
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def _header(self, info):
+        info.flag_bits = 0
+        info.header_offset = self.zip.fp.tell()
+        zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+        self.zip.fp.write(info.FileHeader(zip64))
+        return zip64
+
+    def _record(self, info):
+        self.zip.filelist.append(info)
+        self.zip.NameToInfo[info.filename] = info
+        # the central directory is only written by close once the archive
+        # is marked as modified, and after the last entry
+        self.zip._didModify = True
+        self.zip.start_dir = self.zip.fp.tell()
+
+    def write_compressed(self, info, crc, data):
+        """ adds an entry that is already compressed"""
+        info.CRC = crc
+        info.compress_size = len(data)
+        self._header(info)
+        self.zip.fp.write(data)
+        self._record(info)
+
+    def write_chunked(self, path, info, level, pool, threads):
+        """ compresses a file chunk by chunk on the pool into a new entry,
+        the header is written again once the sizes and crc are known"""
+        # the final compressed size is not known yet, use the larger header
+        # when the file may need it
+        info.compress_size = info.file_size
+        info.CRC = 0
+        zip64 = self._header(info)
+        crc = 0
+        size = 0
+        with open(path, 'rb') as source:
+            while True:
+                # one chunk per thread at a time bounds the memory used
+                chunks = _read_chunks(source, threads)
+                if not chunks:
+                    break
+                for chunk in chunks:
+                    crc = zlib.crc32(chunk, crc)
+                for data in pool.map(_compress_chunk, [(chunk, level) for chunk in chunks]):
+                    size += len(data)
+                    self.zip.fp.write(data)
+                del chunks
+        # an empty final block ends the stream
+        data = zlib.compressobj(level, zlib.DEFLATED, -15).flush(zlib.Z_FINISH)
+        size += len(data)
+        self.zip.fp.write(data)
+        info.CRC = crc & 0xffffffff
+        info.compress_size = size
+        end = self.zip.fp.tell()
+        self.zip.fp.seek(info.header_offset)
+        self.zip.fp.write(info.FileHeader(zip64))
+        self.zip.fp.seek(end)
+        self._record(info)
+
+    def close(self):
+        self.zip.close()
+
+
+def zip_folder(folder, zip_path, level=COMPRESSION_LEVEL, threads=None):
+    """ writes the files of a folder to a zip archive at zip_path, under a
+    folder with the same name. The archive is written to a temporary name
+    next to zip_path and renamed when it is complete. Returns the number of
+    bytes before and after compression"""
+    threads = threads or min(4, max(1, (os.environ.get('NUMBER_OF_PROCESSORS') and
+                                        int(os.environ['NUMBER_OF_PROCESSORS'])) or 2))
+    base = os.path.basename(os.path.normpath(folder))
+    small = []
+    large = []
+    for root, dirs, files in os.walk(folder):
+        for name in sorted(files):
+            # lock files only exist while the geodatabase is open
+            if name.lower().endswith('.lock'):
+                continue
+            path = os.path.join(root, name)
+            arcname = os.path.join(base, os.path.relpath(path, folder)).replace(os.sep, '/')
+            entry = (path, _zip_info(path, arcname))
+            if entry[1].file_size <= PARALLEL_LIMIT:
+                small.append(entry)
+            else:
+                large.append(entry)
+
+    partial_path = zip_path + '.partial'
+    writer = ZipWriter(partial_path)
+    pool = ThreadPool(threads)
+    try:
+        # a few files per thread at a time bounds the memory held by
+        # compressed files waiting to be written
+        batch = threads * 4
+        for start in range(0, len(small), batch):
+            entries = small[start:start + batch]
+            results = pool.map(_compress, [(path, level) for path, info in entries])
+            for (path, info), (crc, data) in zip(entries, results):
+                writer.write_compressed(info, crc, data)
+        for path, info in large:
+            writer.write_chunked(path, info, level, pool, threads)
+        writer.close()
+    except:
+        try:
+            writer.close()
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+    if os.path.exists(zip_path):
+        os.remove(zip_path)
+    os.rename(partial_path, zip_path)
+    infos = [info for path, info in small + large]
+    return sum(info.file_size for info in infos), sum(info.compress_size for info in infos)